@@ -0,0 +1,223 @@
+import os
+import pickle
+import tempfile
+import time
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db.models import FloatField, Func
+from django.utils import timezone
+from .models import Work, MediaItem, Checkout, LoanHistory, Hold
+
+# Circulation metrics computed column-wise with NumPy instead of through ORM
+# joins. Closed loans never change, so their columns are kept on disk in
+# ANALYTICS_DIR and only loans closed since the last refresh are read from
+# the database; open loans and holds are small and loaded fresh each time.
+# "Closed" is when the return reached the database, not returned_at: a
+# return replayed from the offline journal carries the earlier desk time.
+# refresh_analytics is the only caller of compute_metrics; it stores the
+# result next to the columns, where every worker process reads it. Files are
+# written under a temporary name and renamed into place, so a reader sees
+# either the old file or the new one, never part of one.
+
+SECONDS_PER_DAY = 86400.0
+LOAN_COLUMNS = ('item', 'checked_out', 'due', 'returned', 'recorded')
+
+class Epoch(Func):
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)', **extra_context)
+
+def _loan_values(queryset, recorded):
+    # recorded: Checkout.updated_at or LoanHistory.closed_at.
+    return queryset.values_list('media_item_id', Epoch('checked_out_at'), Epoch('due_date'), Epoch('returned_at'), Epoch(recorded))
+
+def _load_loans(rows):
+    # Streams (item, checked_out, due, returned) rows in chunks of
+    # ANALYTICS_CHUNK_SIZE and stacks them into float64 columns.
+    chunks = []
+    chunk = []
+    for row in rows.iterator(chunk_size=settings.ANALYTICS_CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) >= settings.ANALYTICS_CHUNK_SIZE:
+            chunks.append(np.array(chunk, dtype=np.float64))
+            chunk = []
+    if chunk:
+        chunks.append(np.array(chunk, dtype=np.float64))
+    if not chunks:
+        return {name: np.empty(0) for name in LOAN_COLUMNS}
+    table = np.concatenate(chunks)
+    return {name: table[:, i] for i, name in enumerate(LOAN_COLUMNS)}
+
+def _path(name):
+    return os.path.join(settings.ANALYTICS_DIR, name)
+
+def _replace(name, write):
+    # write(file) fills a temporary file that then replaces ANALYTICS_DIR/name.
+    os.makedirs(settings.ANALYTICS_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=settings.ANALYTICS_DIR, prefix=f'.{name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, _path(name))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def closed_loan_columns():
+    # Loans closed more than ANALYTICS_SETTLE_SECONDS ago are appended to the
+    # on-disk columns once; the watermark is the last close time stored.
+    try:
+        with np.load(_path('closed_loans.npz')) as stored:
+            columns = {name: stored[name] for name in LOAN_COLUMNS}
+        watermark = float(columns['recorded'].max()) if len(columns['recorded']) else None
+    except FileNotFoundError:
+        columns = {name: np.empty(0) for name in LOAN_COLUMNS}
+        watermark = None
+
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYTICS_SETTLE_SECONDS)
+    # Archived loans have the same columns. Both tables are read in one
+    # statement, so a loan archive_loans moves meanwhile is seen exactly once.
+    parts = []
+    for queryset, recorded in (
+        (Checkout.objects.filter(returned_at__isnull=False), 'updated_at'),
+        (LoanHistory.objects.all(), 'closed_at'),
+    ):
+        new_loans = queryset.filter(**{f'{recorded}__lte': cutoff})
+        if watermark is not None:
+            new_loans = new_loans.annotate(recorded_epoch=Epoch(recorded)).filter(recorded_epoch__gt=watermark)
+        parts.append(_loan_values(new_loans, recorded))
+    fresh = _load_loans(parts[0].union(parts[1], all=True))
+    if len(fresh['item']):
+        columns = {name: np.concatenate([columns[name], fresh[name]]) for name in LOAN_COLUMNS}
+        _replace('closed_loans.npz', lambda f: np.savez(f, **columns))
+    return columns
+
+def _codes(values):
+    # Dictionary-encodes a list of labels: (labels array, int code per value).
+    labels, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    return labels, codes
+
+def _lookup(sorted_ids, values):
+    # Row of each value in sorted_ids, and a mask of the values that exist.
+    values = values.astype(np.int64)
+    if not len(sorted_ids):
+        return np.zeros(0, dtype=np.int64), np.zeros(len(values), dtype=bool)
+    position = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    found = sorted_ids[position] == values
+    return position[found], found
+
+def _rate(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+def compute_metrics(now=None):
+    started = time.perf_counter()
+    now = now or timezone.now()
+    now_epoch = now.timestamp()
+    window_start = now_epoch - settings.ANALYTICS_WINDOW_DAYS * SECONDS_PER_DAY
+
+    closed = closed_loan_columns()
+    open_ = _load_loans(_loan_values(Checkout.objects.filter(returned_at__isnull=True), 'updated_at'))
+    loans = {name: np.concatenate([closed[name], open_[name]]) for name in LOAN_COLUMNS}
+    in_window = loans['checked_out'] >= window_start
+    loans = {name: column[in_window] for name, column in loans.items()}
+
+    # Item dimension: copy id -> row, with genre, media type and title
+    # (work) codes.
+    works = list(Work.objects.order_by('id').values_list('id', 'title', 'author'))
+    work_ids = np.array([row[0] for row in works], dtype=np.int64)
+    titles = np.array([f'{row[1]} by {row[2]}' for row in works], dtype=object)
+    items = list(MediaItem.objects.order_by('id').values_list('id', 'work__genre', 'work__media_type', 'work_id'))
+    item_ids = np.array([row[0] for row in items], dtype=np.int64)
+    genres, genre_code = _codes([row[1] or 'General' for row in items])
+    media_types, type_code = _codes([row[2] for row in items])
+    title_code, _ = _lookup(work_ids, np.array([row[3] for row in items], dtype=np.int64))
+
+    # Loans for items that no longer exist are dropped.
+    position, known = _lookup(item_ids, loans['item'])
+    loans = {name: column[known] for name, column in loans.items()}
+
+    returned = ~np.isnan(loans['returned'])
+    late = np.where(returned, loans['returned'] > loans['due'], now_epoch > loans['due'])
+    length_days = (loans['returned'] - loans['checked_out']) / SECONDS_PER_DAY
+
+    loan_type = type_code[position]
+    loans_per_type = np.bincount(loan_type, minlength=len(media_types))
+    late_per_type = np.bincount(loan_type, weights=late, minlength=len(media_types))
+    loans_per_genre = np.bincount(genre_code[position], minlength=len(genres))
+
+    # Median loan length per media type: sort by (type, length) once and
+    # take the middle of each group.
+    closed_type = loan_type[returned]
+    closed_length = length_days[returned]
+    order = np.lexsort((closed_length, closed_type))
+    closed_type, closed_length = closed_type[order], closed_length[order]
+    bounds = np.searchsorted(closed_type, np.arange(len(media_types) + 1))
+    median_per_type = [
+        float(np.median(closed_length[bounds[i]:bounds[i + 1]])) if bounds[i + 1] > bounds[i] else None
+        for i in range(len(media_types))
+    ]
+
+    copies_per_title = np.bincount(title_code, minlength=len(titles))
+    loans_per_title = np.bincount(title_code[position], minlength=len(titles))
+    turnover = _rate(loans_per_title, copies_per_title)
+
+    hold_works = np.array(
+        list(Hold.objects.filter(status__in=['pending', 'ready', 'in_transit']).values_list('work_id', flat=True)),
+        dtype=np.int64,
+    )
+    hold_position, _ = _lookup(work_ids, hold_works)
+    holds_per_title = np.bincount(hold_position, minlength=len(titles))
+    hold_ratio = _rate(holds_per_title, copies_per_title)
+
+    top = settings.ANALYTICS_TOP_TITLES
+    by_turnover = np.argsort(-turnover, kind='stable')[:top]
+    by_holds = np.argsort(-hold_ratio, kind='stable')[:top]
+
+    return {
+        'generated_at': now,
+        'window_days': settings.ANALYTICS_WINDOW_DAYS,
+        'total_loans': int(len(position)),
+        'median_loan_days': float(np.median(length_days[returned])) if returned.any() else None,
+        'overdue_rate': float(late.mean()) if len(late) else 0.0,
+        'by_media_type': [{
+            'media_type': dict(Work.TYPE_CHOICES).get(media_types[i], str(media_types[i])),
+            'loans': int(loans_per_type[i]),
+            'overdue_rate': float(late_per_type[i] / loans_per_type[i]) if loans_per_type[i] else 0.0,
+            'median_loan_days': median_per_type[i],
+        } for i in np.argsort(-loans_per_type, kind='stable')],
+        'by_genre': [{
+            'genre': str(genres[i]),
+            'loans': int(loans_per_genre[i]),
+        } for i in np.argsort(-loans_per_genre, kind='stable')],
+        'turnover': [{
+            'title': str(titles[i]),
+            'copies': int(copies_per_title[i]),
+            'loans': int(loans_per_title[i]),
+            'turnover': float(turnover[i]),
+        } for i in by_turnover if loans_per_title[i]],
+        'hold_ratio': [{
+            'title': str(titles[i]),
+            'copies': int(copies_per_title[i]),
+            'holds': int(holds_per_title[i]),
+            'ratio': float(hold_ratio[i]),
+        } for i in by_holds if holds_per_title[i]],
+        'seconds': time.perf_counter() - started,
+    }
+
+def refresh():
+    metrics = compute_metrics()
+    _replace('metrics.pickle', lambda f: pickle.dump(metrics, f))
+    return metrics
+
+def daily_metrics():
+    # The last stored result, or None before the first refresh.
+    try:
+        with open(_path('metrics.pickle'), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
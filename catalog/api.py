@@ -0,0 +1,186 @@
+import hashlib
+from django.conf import settings
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .models import MediaItem, Checkout, Hold, Fine
+from .routers import use_replica
+from .throttle import throttle
+from .views import patron_required, librarian_required
+from . import scans
+
+# Read API for discovery layers and kiosks. Every endpoint first reads only
+# ids and updated_at for the rows it would return; when the client's
+# ETag/If-Modified-Since still matches, it answers 304 without loading or
+# serializing anything else. Bodies go from .values() straight to JSON.
+
+# Copies are served with their work's bibliographic fields flattened in.
+COPY_FIELDS = ('id', 'work_id', 'barcode', 'status', 'location', 'added_at', 'updated_at')
+WORK_FIELDS = ('title', 'author', 'media_type', 'isbn', 'description', 'genre', 'publisher', 'pages')
+ITEM_FIELDS = COPY_FIELDS + WORK_FIELDS
+
+class BadRequest(Exception):
+    pass
+
+def _list_param(request, name):
+    values = [v.strip() for v in request.GET.get(name, '').split(',') if v.strip()]
+    if len(values) > settings.API_MAX_BATCH:
+        raise BadRequest(f'At most {settings.API_MAX_BATCH} values allowed for "{name}".')
+    return values
+
+def _int_param(request, name, default, minimum=0, maximum=None):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise BadRequest(f'"{name}" must be an integer.')
+    if value < minimum:
+        raise BadRequest(f'"{name}" must be at least {minimum}.')
+    return min(value, maximum) if maximum else value
+
+def _item_filter(request):
+    ids = _list_param(request, 'ids')
+    barcodes = _list_param(request, 'barcodes')
+    isbns = _list_param(request, 'isbns')
+    if not all(i.isdigit() for i in ids):
+        raise BadRequest('"ids" must be integers.')
+    lookup = Q()
+    if ids:
+        lookup |= Q(id__in=ids)
+    if barcodes:
+        lookup |= Q(barcode__in=barcodes)
+    if isbns:
+        lookup |= Q(work__isbn__in=isbns)
+    return lookup
+
+def _versioned_response(request, versions, build):
+    # versions: iterable of (key, updated_at) pairs describing the response.
+    versions = list(versions)
+    digest = hashlib.sha1(repr([(k, v.isoformat() if v else None) for k, v in versions]).encode()).hexdigest()
+    etag = f'"{digest}"'
+    stamps = [v for _, v in versions if v]
+    last_modified = int(max(stamps).timestamp()) if stamps else None
+    
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    
+    response = JsonResponse(build(), safe=False)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+def _bad_request(error):
+    return JsonResponse({'error': str(error)}, status=400)
+
+@throttle('api')
+@use_replica
+def items_api(request):
+    try:
+        lookup = _item_filter(request)
+        after = _int_param(request, 'after', 0)
+        limit = _int_param(request, 'limit', settings.API_PAGE_SIZE, 1, settings.API_MAX_BATCH)
+        fields = _list_param(request, 'fields') or list(ITEM_FIELDS)
+    except BadRequest as e:
+        return _bad_request(e)
+    unknown = set(fields) - set(ITEM_FIELDS)
+    if unknown:
+        return _bad_request(f'Unknown fields: {", ".join(sorted(unknown))}')
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    
+    page = list(
+        MediaItem.objects.filter(lookup, id__gt=after).order_by('id').values_list('id', 'updated_at', 'work__updated_at')[:limit + 1]
+    )
+    has_more = len(page) > limit
+    page = [(pk, max(copy_updated, work_updated)) for pk, copy_updated, work_updated in page[:limit]]
+    
+    def build():
+        ids = [pk for pk, _ in page]
+        rows = list(MediaItem.objects.filter(id__in=ids).order_by('id').values(
+            *[f for f in fields if f in COPY_FIELDS],
+            **{f: F(f'work__{f}') for f in fields if f in WORK_FIELDS}
+        ))
+        return {'results': rows, 'next': ids[-1] if has_more else None}
+    
+    return _versioned_response(request, [(f'fields:{",".join(fields)}', None)] + page, build)
+
+@throttle('api')
+@use_replica
+def availability_api(request):
+    try:
+        lookup = _item_filter(request)
+    except BadRequest as e:
+        return _bad_request(e)
+    if not lookup:
+        return _bad_request('Pass ids, barcodes or isbns.')
+    
+    open_loan = Checkout.objects.filter(media_item=OuterRef('pk'), returned_at__isnull=True)
+    # Holds queue per work, so every copy of a title reports the same queue.
+    pending = Hold.objects.filter(work=OuterRef('work'), status='pending').values('work')
+    rows = list(
+        MediaItem.objects.filter(lookup).order_by('id').annotate(
+            due_date=Subquery(open_loan.values('due_date')[:1]),
+            loan_updated_at=Subquery(open_loan.values('updated_at')[:1]),
+            pending_holds=Subquery(pending.annotate(n=Count('id')).values('n')),
+            holds_updated_at=Subquery(pending.annotate(latest=Max('updated_at')).values('latest')),
+        ).values('id', 'work_id', 'barcode', 'status', 'updated_at', 'due_date', 'loan_updated_at', 'pending_holds', 'holds_updated_at')[:settings.API_MAX_BATCH]
+    )
+    
+    versions = []
+    for row in rows:
+        versions += [(f'item:{row["id"]}', row['updated_at']), ('loan', row['loan_updated_at']), (f'holds:{row["pending_holds"]}', row['holds_updated_at'])]
+    
+    def build():
+        return {'results': [{
+            'id': row['id'],
+            'work_id': row['work_id'],
+            'barcode': row['barcode'],
+            'status': row['status'],
+            'due_date': row['due_date'],
+            'pending_holds': row['pending_holds'] or 0,
+        } for row in rows]}
+    
+    return _versioned_response(request, versions, build)
+
+@patron_required
+def account_api(request):
+    patron = request.patron
+    loans = Checkout.objects.filter(patron=patron, returned_at__isnull=True)
+    holds = Hold.objects.filter(patron=patron, status__in=['pending', 'ready', 'in_transit'])
+    fines = Fine.objects.filter(patron=patron, paid=False)
+    
+    versions = [(f'patron:{patron.pk}', patron.updated_at)]
+    for name, qs in (('loans', loans), ('holds', holds), ('fines', fines)):
+        summary = qs.aggregate(n=Count('id'), latest=Max('updated_at'))
+        versions.append((f'{name}:{summary["n"]}', summary['latest']))
+    
+    def build():
+        return {
+            'id': patron.id,
+            'name': patron.name,
+            'card_number': patron.card_number,
+            'status': patron.status,
+            'expires_at': patron.expires_at,
+            'loans': list(loans.order_by('due_date').values(
+                'id', 'media_item_id', 'due_date', 'renewals', title=F('media_item__work__title')
+            )),
+            'holds': list(holds.order_by('placed_at').values(
+                'id', 'work_id', 'media_item_id', 'status', 'queue_position', 'pickup_by', 'pickup_location', title=F('work__title')
+            )),
+            'fines': list(fines.order_by('created_at').values('id', 'amount', 'reason', 'created_at')),
+        }
+    
+    return _versioned_response(request, versions, build)
+
+@librarian_required
+def scan_api(request):
+    # Desk scanners: one exact card number or barcode per request.
+    code = request.GET.get('code', '').strip()
+    kind, payload = scans.resolve(code)
+    if kind is None:
+        return _bad_request('Not a library card number or item barcode.')
+    if payload is None:
+        return JsonResponse({'error': f'No {kind} with this {"card number" if kind == "patron" else "barcode"}.'}, status=404)
+    return JsonResponse(payload)
@@ -0,0 +1,154 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateformat import format as format_date
+from . import metrics
+from .events import broker
+from .models import MediaItem, Checkout, Hold, Fine, ActivityLog
+from .notifications import enqueue, hold_ready_notice
+
+# Desk circulation. Each operation runs in one transaction together with its
+# activity log entry, outbox notifications and live-update events.
+
+def fill_hold(media_item):
+    # Sets a copy that just became free aside for the oldest pending hold on
+    # its work. Returns the hold, or None and leaves the copy available.
+    # Runs inside the caller's transaction. The head hold is locked, and a
+    # check-in of another copy of the work skips it and takes the next one,
+    # so each hold is filled by exactly one copy.
+    hold = Hold.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+        work_id=media_item.work_id, status='pending', patron__deleted_at__isnull=True
+    ).order_by('placed_at', 'id').first()
+    if hold:
+        hold.status = 'ready'
+        hold.media_item = media_item
+        hold.pickup_by = timezone.now() + timedelta(days=settings.HOLD_PICKUP_DAYS)
+        hold.save()
+        Hold.objects.filter(work_id=media_item.work_id, status='pending').update(
+            queue_position=F('queue_position') - 1, updated_at=timezone.now()
+        )
+        enqueue(hold_ready_notice(hold))
+        transaction.on_commit(lambda: metrics.inc('circulation_operations_total', operation='hold_filled'))
+        media_item.status = 'on_hold'
+    else:
+        media_item.status = 'available'
+    media_item.save()
+    return hold
+
+def receive_transit(media_item):
+    # A copy pulled for a hold (see pull_list.py) arrived at the pickup
+    # location. Returns the hold now ready, or None if the copy was not in
+    # transit for one.
+    with transaction.atomic():
+        hold = Hold.objects.select_for_update(of=('self',)).filter(
+            media_item=media_item, status='in_transit'
+        ).select_related('patron', 'work').first()
+        if hold is None:
+            return None
+        hold.status = 'ready'
+        hold.pickup_by = timezone.now() + timedelta(days=settings.HOLD_PICKUP_DAYS)
+        hold.save()
+        enqueue(hold_ready_notice(hold))
+        transaction.on_commit(lambda: metrics.inc('circulation_operations_total', operation='hold_filled'))
+        media_item.status = 'on_hold'
+        media_item.save()
+    return hold
+
+def check_out(patron, media_item, librarian=None, now=None):
+    # now backdates a loan replayed from the offline journal.
+    with transaction.atomic():
+        media_item = MediaItem.objects.select_for_update().get(pk=media_item.pk)
+        hold = None
+        if media_item.status == 'on_hold':
+            hold = Hold.objects.filter(media_item=media_item, patron=patron, status='ready').first()
+            if hold is None:
+                return None
+        elif media_item.status == 'available':
+            # Any copy satisfies a title-level hold the patron is waiting on.
+            hold = Hold.objects.filter(work_id=media_item.work_id, patron=patron, status='pending').first()
+            if hold:
+                Hold.objects.filter(
+                    work_id=media_item.work_id, status='pending', queue_position__gt=hold.queue_position
+                ).update(queue_position=F('queue_position') - 1, updated_at=timezone.now())
+        else:
+            return None
+        
+        checkout = Checkout.objects.create(
+            patron=patron,
+            media_item=media_item,
+            due_date=(now or timezone.now()) + timedelta(days=media_item.get_loan_period_days())
+        )
+        if now:
+            # checked_out_at is auto_now_add, so it can only be set afterwards.
+            Checkout.objects.filter(pk=checkout.pk).update(checked_out_at=now)
+            checkout.checked_out_at = now
+        media_item.status = 'checked_out'
+        media_item.save()
+        
+        if hold:
+            hold.status = 'picked_up'
+            hold.media_item = media_item
+            hold.save()
+        
+        ActivityLog.objects.create(
+            action='checkout',
+            patron=patron,
+            media_item=media_item,
+            librarian=librarian,
+            description=f'Checked out "{media_item.title}" to {patron.name}'
+        )
+        
+        broker.publish_on_commit('checkout', {'deltas': {'checkouts_today': 1}})
+        transaction.on_commit(lambda: metrics.inc('circulation_operations_total', operation='checkout'))
+    return checkout
+
+def check_in(media_item, librarian=None, returned_at=None, fill=True):
+    # Returns (checkout, fine_amount), or (None, 0) if the item was not out.
+    # fill=False leaves the copy available instead of setting it aside for
+    # the next hold (the journal closes a stale loan right before checking
+    # the same copy out again).
+    with transaction.atomic():
+        checkout = Checkout.objects.select_for_update().filter(
+            media_item=media_item, returned_at__isnull=True
+        ).select_related('patron').first()
+        if checkout is None:
+            return None, 0
+        
+        checkout.returned_at = returned_at or timezone.now()
+        checkout.save(update_fields=['returned_at', 'updated_at'])
+        
+        fine_amount = checkout.calculate_fine()
+        if fine_amount > 0:
+            Fine.objects.create(
+                patron=checkout.patron,
+                checkout=checkout,
+                amount=fine_amount,
+                reason=f'Overdue fine for "{media_item.title}"'
+            )
+        
+        if fill:
+            fill_hold(media_item)
+        else:
+            media_item.status = 'available'
+            media_item.save()
+        
+        ActivityLog.objects.create(
+            action='checkin',
+            patron=checkout.patron,
+            media_item=media_item,
+            librarian=librarian,
+            description=f'Checked in "{media_item.title}" from {checkout.patron.name}'
+        )
+        
+        transaction.on_commit(lambda: metrics.inc('circulation_operations_total', operation='checkin'))
+        broker.publish_on_commit('checkin', {
+            'deltas': {'overdue_items': -1 if checkout.is_overdue() else 0},
+            'checkin': {
+                'title': media_item.title,
+                'patron': checkout.patron.name,
+                'returned': format_date(timezone.localtime(checkout.returned_at), 'M d, Y H:i'),
+            },
+        })
+    return checkout, fine_amount
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Checkout, MediaRequest
+
+# In-process pub/sub behind the librarian live-update stream. Every open
+# stream is one asyncio.Queue on the ASGI event loop, so an idle connection
+# costs a parked coroutine and nothing else. Circulation code publishes from
+# any thread; delivery is handed to the subscriber's loop.
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def live_counters():
+    today = timezone.now().date()
+    return {
+        'checkouts_today': Checkout.objects.filter(checked_out_at__date=today).count(),
+        'overdue_items': Checkout.objects.filter(returned_at__isnull=True, due_date__lt=timezone.now()).count(),
+        'pending_requests': MediaRequest.objects.filter(status='pending').count(),
+        'approved_requests': MediaRequest.objects.filter(status='approved').count(),
+        'rejected_requests': MediaRequest.objects.filter(status='rejected').count(),
+    }
+
+class EventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._watchers = {}
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=settings.LIVE_UPDATES_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = loop
+            if loop not in self._watchers:
+                self._watchers[loop] = loop.create_task(self._watch_counters(loop))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                self.unsubscribe(queue)
+
+    def publish_on_commit(self, event, data):
+        transaction.on_commit(lambda: self.publish(event, data))
+
+    @staticmethod
+    def _deliver(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client stopped reading; drop its backlog and have it
+            # reload the counters instead of replaying stale deltas.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(format_event('resync', {}))
+
+    async def _watch_counters(self, loop):
+        # Overdue counts change with the clock, and other worker processes
+        # publish to their own brokers, so one task per event loop re-counts
+        # periodically and pushes absolute values when something moved.
+        last = await sync_to_async(live_counters)()
+        while True:
+            await asyncio.sleep(settings.LIVE_UPDATES_INTERVAL)
+            with self._lock:
+                if loop not in self._subscribers.values():
+                    del self._watchers[loop]
+                    return
+            counters = await sync_to_async(live_counters)()
+            if counters != last:
+                self.publish('counters', {'values': counters})
+            last = counters
+
+broker = EventBroker()
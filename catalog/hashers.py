@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+# Patron PINs and librarian passwords get their own hasher so the PBKDF2 cost
+# can be tuned per account type. Changing the iteration setting makes
+# must_update() true for existing hashes, and check_password() re-hashes them
+# on the next successful login.
+
+class PatronPINHasher(PBKDF2PasswordHasher):
+    algorithm = 'patron_pbkdf2_sha256'
+
+    @property
+    def iterations(self):
+        return settings.PATRON_PIN_ITERATIONS
+
+class LibrarianPasswordHasher(PBKDF2PasswordHasher):
+    algorithm = 'librarian_pbkdf2_sha256'
+
+    @property
+    def iterations(self):
+        return settings.LIBRARIAN_PASSWORD_ITERATIONS
@@ -0,0 +1,169 @@
+import csv
+from collections import Counter, defaultdict
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .allocators import barcodes
+from .models import MediaItem
+
+# Shelf inventory. Scan files are streamed and every barcode is packed into an
+# int64 key, so a location's scans and its expected copies are two sorted
+# NumPy arrays (8 bytes per copy) that are diffed with one set operation each.
+# The database is read per location in INVENTORY_CHUNK_SIZE rows and written
+# back with chunked UPDATEs.
+
+STATUS_CODES = {status: code for code, (status, _) in enumerate(MediaItem.STATUS_CHOICES)}
+CATEGORIES = {
+    'missing': 'Expected on the shelf but not scanned',
+    'misplaced': 'Scanned here but shelved elsewhere',
+    'checked_out_on_shelf': 'Scanned on the shelf but recorded as checked out',
+    'found': 'Scanned but recorded as lost',
+    'unknown': 'Scanned but not in the catalog',
+}
+
+def barcode_key(barcode):
+    # "BC-000000123" -> 1000000123; the leading 1 keeps zero padding, so
+    # old fixed-width barcodes and newer check-digit ones never collide.
+    return int('1' + barcode[len(barcodes.prefix):])
+
+def key_barcode(key):
+    return barcodes.prefix + str(int(key))[1:]
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _pack(keys):
+    return np.unique(np.array(keys, dtype=np.int64))
+
+def read_scans(files, location=None):
+    # Streams scan files into {location: sorted unique keys}. Lines are
+    # either a bare barcode (with location given) or "location,barcode".
+    # Returns the keys and a Counter of lines read and rejected.
+    chunk_size = settings.INVENTORY_CHUNK_SIZE
+    packed = defaultdict(list)
+    pending = defaultdict(list)
+    counts = Counter()
+    for f in files:
+        for row in csv.reader(f):
+            if not row or not row[-1].strip():
+                continue
+            barcode = row[-1].strip()
+            where = location if location else (row[0].strip() if len(row) > 1 else '')
+            counts['lines'] += 1
+            if not where or not barcodes.is_valid(barcode):
+                counts['invalid'] += 1
+                continue
+            pending[where].append(barcode_key(barcode))
+            if len(pending[where]) >= chunk_size:
+                packed[where].append(_pack(pending.pop(where)))
+    for where, keys in pending.items():
+        packed[where].append(_pack(keys))
+    return {where: np.unique(np.concatenate(arrays)) for where, arrays in packed.items()}, counts
+
+def expected_at(location):
+    # (sorted keys, status codes) of every copy shelved at location.
+    keys = []
+    codes = []
+    rows = MediaItem.objects.filter(location=location).values_list('barcode', 'status')
+    for barcode, status in rows.iterator(chunk_size=settings.INVENTORY_CHUNK_SIZE):
+        if barcodes.is_valid(barcode):
+            keys.append(barcode_key(barcode))
+            codes.append(STATUS_CODES.get(status, -1))
+    keys = np.array(keys, dtype=np.int64)
+    codes = np.array(codes, dtype=np.int8)
+    order = np.argsort(keys, kind='stable')
+    return keys[order], codes[order]
+
+def _rows(keys, category, location):
+    # Report rows for keys, looked up in chunks.
+    for chunk in _chunks(keys, settings.INVENTORY_CHUNK_SIZE):
+        chunk_barcodes = [key_barcode(key) for key in chunk]
+        found = {
+            row[0]: row for row in MediaItem.objects.filter(barcode__in=chunk_barcodes).values_list(
+                'barcode', 'work__title', 'location', 'status'
+            )
+        }
+        for barcode in chunk_barcodes:
+            _, title, shelved_at, status = found.get(barcode, (barcode, '', '', ''))
+            yield {
+                'category': category,
+                'scanned_at': location,
+                'barcode': barcode,
+                'title': title,
+                'location': shelved_at,
+                'status': status,
+            }
+
+def reconcile(location, scanned):
+    # Diffs one location. Returns {category: sorted keys}.
+    expected, codes = expected_at(location)
+    on_shelf = np.isin(expected, scanned, assume_unique=True)
+    found = {
+        'missing': [expected[~on_shelf & (codes == STATUS_CODES['available'])]],
+        'checked_out_on_shelf': [expected[on_shelf & (codes == STATUS_CODES['checked_out'])]],
+        'found': [expected[on_shelf & (codes == STATUS_CODES['lost'])]],
+        'misplaced': [],
+        'unknown': [],
+    }
+    # Scans of copies not shelved here are classified by their status.
+    elsewhere = np.setdiff1d(scanned, expected, assume_unique=True)
+    categories = {None: 'unknown', 'checked_out': 'checked_out_on_shelf', 'lost': 'found'}
+    for chunk in _chunks(elsewhere, settings.INVENTORY_CHUNK_SIZE):
+        rows = dict(MediaItem.objects.filter(
+            barcode__in=[key_barcode(key) for key in chunk]
+        ).values_list('barcode', 'status'))
+        by_category = defaultdict(list)
+        for key in chunk:
+            status = rows.get(key_barcode(key))
+            by_category[categories.get(status, 'misplaced')].append(key)
+        for category, keys in by_category.items():
+            found[category].append(np.array(keys, dtype=np.int64))
+    return {
+        category: np.sort(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+        for category, arrays in found.items()
+    }
+
+def mark_inventoried(keys, now):
+    updated = 0
+    for chunk in _chunks(keys, settings.INVENTORY_CHUNK_SIZE):
+        # updated_at is left alone: nothing clients cache has changed.
+        updated += MediaItem.objects.filter(barcode__in=[key_barcode(key) for key in chunk]).update(last_inventoried_at=now)
+    return updated
+
+def mark_lost(missing, days, now):
+    # Missing copies not seen by any inventory in the last `days` days (or
+    # ever, if they were added before then) are marked lost.
+    cutoff = now - timedelta(days=days)
+    long_missing = Q(last_inventoried_at__lt=cutoff) | Q(last_inventoried_at__isnull=True, added_at__lt=cutoff)
+    marked = 0
+    for chunk in _chunks(missing, settings.INVENTORY_CHUNK_SIZE):
+        marked += MediaItem.objects.filter(
+            long_missing, barcode__in=[key_barcode(key) for key in chunk], status='available'
+        ).update(status='lost', updated_at=now)
+    return marked
+
+def run(files, location=None, report=None, lost_after_days=None):
+    # Reconciles every location in the scan files. Writes one CSV row per
+    # discrepancy to report (a file object) if given. Returns per-location
+    # category counts and the line Counter.
+    now = timezone.now()
+    scans, counts = read_scans(files, location)
+    writer = None
+    if report is not None:
+        writer = csv.DictWriter(report, fieldnames=['category', 'scanned_at', 'barcode', 'title', 'location', 'status'])
+        writer.writeheader()
+    summary = {}
+    for where, scanned in sorted(scans.items()):
+        result = reconcile(where, scanned)
+        summary[where] = {'scanned': len(scanned)}
+        summary[where].update({category: len(keys) for category, keys in result.items()})
+        if writer:
+            for category in CATEGORIES:
+                writer.writerows(_rows(result[category], category, where))
+        summary[where]['inventoried'] = mark_inventoried(np.setdiff1d(scanned, result['unknown']), now)
+        if lost_after_days is not None:
+            summary[where]['marked_lost'] = mark_lost(result['missing'], lost_after_days, now)
+    return summary, counts
@@ -0,0 +1,225 @@
+import json
+import sqlite3
+import time
+import uuid
+from collections import Counter
+from contextlib import closing
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import metrics
+from .circulation import check_out, check_in
+from .models import Patron, Librarian, MediaItem, Checkout, Hold, ReplayedOperation
+
+# Offline circulation journal. When the catalog database fails, the desk
+# views append the transaction to a SQLite file on the web host and answer
+# right away; replay_journal applies the entries to the database in order
+# once it is back. Each entry carries an idempotency key from the desk form,
+# so a resubmitted form is journaled once and a replayed entry is applied
+# once (the key is stored with the change in ReplayedOperation).
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    operation TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    librarian_id INTEGER,
+    recorded_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    outcome TEXT,
+    detail TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    replayed_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_status ON entries (status, seq);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    entries INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    outcomes TEXT NOT NULL
+);
+'''
+
+_initialized = set()
+
+def _connect():
+    path = str(settings.CIRCULATION_JOURNAL_PATH)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # Autocommit with a synchronous WAL: an entry is on disk before the
+    # desk is told it was recorded.
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')
+    if path not in _initialized:
+        conn.executescript(_SCHEMA)
+        _initialized.add(path)
+    return conn
+
+def new_key():
+    return uuid.uuid4().hex
+
+def record(operation, key, payload, librarian_id=None):
+    # Returns False if an entry with this key was already journaled.
+    with closing(_connect()) as conn:
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO entries (key, operation, payload, librarian_id, recorded_at) VALUES (?, ?, ?, ?, ?)',
+            (key, operation, json.dumps(payload), librarian_id, time.time()),
+        )
+        return cursor.rowcount == 1
+
+def _find_patron(payload):
+    if payload.get('patron_id'):
+        return Patron.objects.filter(pk=payload['patron_id']).first()
+    return Patron.objects.filter(card_number=payload.get('card_number', '')).first()
+
+def _find_item(payload):
+    items = MediaItem.objects.select_related('work')
+    if payload.get('item_id'):
+        return items.filter(pk=payload['item_id']).first()
+    return items.filter(barcode=payload.get('barcode', '')).first()
+
+def _replay_checkout(payload, librarian, recorded_at):
+    patron = _find_patron(payload)
+    media_item = _find_item(payload)
+    if patron is None or media_item is None:
+        return 'conflict', 'Patron or item no longer exists.'
+
+    # The copy was in the patron's hands at the desk, so whatever the
+    # database says happened to it since is overridden.
+    resolved = []
+    open_loan = Checkout.objects.filter(media_item=media_item, returned_at__isnull=True).select_related('patron').first()
+    if open_loan and open_loan.patron_id == patron.pk:
+        return 'duplicate', 'Already checked out to this patron.'
+    if open_loan:
+        # No hold is filled with the copy: it goes straight back out below.
+        check_in(media_item, librarian, returned_at=recorded_at, fill=False)
+        resolved.append(f'closed the open loan of {open_loan.patron.name}')
+    elif media_item.status == 'on_hold':
+        hold = Hold.objects.filter(media_item=media_item, status='ready').exclude(patron=patron).first()
+        if hold:
+            # The copy was on the holds shelf for someone else before the
+            # outage and left the building; put their hold back at the head
+            # of the queue.
+            Hold.objects.filter(work_id=hold.work_id, status='pending').update(
+                queue_position=F('queue_position') + 1, updated_at=timezone.now()
+            )
+            Hold.objects.filter(pk=hold.pk).update(
+                status='pending', media_item=None, pickup_by=None, queue_position=1, updated_at=timezone.now()
+            )
+            media_item.status = 'available'
+            media_item.save()
+            resolved.append(f'requeued the ready hold of patron {hold.patron_id}')
+    elif media_item.status in ['lost', 'in_transit']:
+        resolved.append(f'item was marked {media_item.get_status_display().lower()}')
+        media_item.status = 'available'
+        media_item.save()
+
+    if check_out(patron, media_item, librarian, now=recorded_at) is None:
+        return 'conflict', f'Item could not be checked out (status {media_item.status}).'
+    if resolved:
+        detail = '; '.join(resolved)
+        return 'resolved', detail[0].upper() + detail[1:] + '.'
+    return 'applied', ''
+
+def _replay_checkin(payload, librarian, recorded_at):
+    media_item = _find_item(payload)
+    if media_item is None:
+        return 'conflict', 'Item not found.'
+    open_loan = Checkout.objects.filter(media_item=media_item, returned_at__isnull=True).first()
+    if open_loan is None:
+        return 'duplicate', 'Item was not checked out.'
+    if open_loan.checked_out_at > recorded_at:
+        # Checked out again after this return was recorded; the return
+        # belongs to an earlier loan that is already closed.
+        return 'stale', 'Item was checked out again after this return.'
+    checkout, fine_amount = check_in(media_item, librarian, returned_at=recorded_at)
+    return 'applied', f'Fine ${fine_amount:.2f}' if fine_amount else ''
+
+_HANDLERS = {
+    'checkout': _replay_checkout,
+    'checkin': _replay_checkin,
+}
+
+def _replay_entry(entry):
+    recorded_at = datetime.fromtimestamp(entry['recorded_at'], tz=dt_timezone.utc)
+    librarian = Librarian.objects.filter(pk=entry['librarian_id']).first() if entry['librarian_id'] else None
+    try:
+        with transaction.atomic():
+            if ReplayedOperation.objects.filter(key=entry['key']).exists():
+                return 'duplicate', 'Already replayed.'
+            outcome, detail = _HANDLERS[entry['operation']](json.loads(entry['payload']), librarian, recorded_at)
+            ReplayedOperation.objects.create(
+                key=entry['key'], operation=entry['operation'], outcome=outcome, detail=detail, recorded_at=recorded_at
+            )
+    except IntegrityError as e:
+        # Another worker replayed the same key first, or the change itself
+        # was refused.
+        if ReplayedOperation.objects.filter(key=entry['key']).exists():
+            return 'duplicate', 'Already replayed.'
+        return 'conflict', str(e)
+    return outcome, detail
+
+def replay(batch_size=None):
+    # Replays up to batch_size queued entries, oldest first, and stops at
+    # the first database error so later entries never overtake it.
+    # Returns (outcome counts, seconds).
+    batch_size = batch_size or settings.CIRCULATION_REPLAY_BATCH_SIZE
+    started = time.perf_counter()
+    outcomes = Counter()
+    with closing(_connect()) as conn:
+        entries = conn.execute(
+            "SELECT * FROM entries WHERE status = 'queued' ORDER BY seq LIMIT ?", (batch_size,)
+        ).fetchall()
+        for entry in entries:
+            try:
+                outcome, detail = _replay_entry(entry)
+            except DatabaseError as e:
+                conn.execute('UPDATE entries SET attempts = attempts + 1, detail = ? WHERE seq = ?', (str(e), entry['seq']))
+                outcomes['error'] += 1
+                break
+            conn.execute(
+                'UPDATE entries SET status = ?, outcome = ?, detail = ?, attempts = attempts + 1, replayed_at = ? WHERE seq = ?',
+                ('conflict' if outcome == 'conflict' else 'done', outcome, detail, time.time(), entry['seq']),
+            )
+            outcomes[outcome] += 1
+            metrics.inc('circulation_replay_total', outcome=outcome)
+        seconds = time.perf_counter() - started
+        if entries:
+            conn.execute(
+                'INSERT INTO runs (started_at, entries, seconds, outcomes) VALUES (?, ?, ?, ?)',
+                (time.time() - seconds, sum(outcomes.values()), seconds, json.dumps(outcomes)),
+            )
+    return outcomes, seconds
+
+def stats():
+    # Backlog and recent replay throughput for the diagnostics page.
+    with closing(_connect()) as conn:
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM entries GROUP BY status').fetchall())
+        oldest = conn.execute("SELECT MIN(recorded_at) FROM entries WHERE status = 'queued'").fetchone()[0]
+        runs = conn.execute('SELECT * FROM runs ORDER BY id DESC LIMIT 10').fetchall()
+        conflicts = conn.execute(
+            "SELECT * FROM entries WHERE status = 'conflict' ORDER BY seq DESC LIMIT 20"
+        ).fetchall()
+    return {
+        'queued': counts.get('queued', 0),
+        'done': counts.get('done', 0),
+        'conflicts': counts.get('conflict', 0),
+        'oldest_queued_seconds': time.time() - oldest if oldest else None,
+        'runs': [{
+            'started_at': datetime.fromtimestamp(run['started_at'], tz=dt_timezone.utc),
+            'entries': run['entries'],
+            'seconds': run['seconds'],
+            'per_second': run['entries'] / run['seconds'] if run['seconds'] else None,
+            'outcomes': json.loads(run['outcomes']),
+        } for run in runs],
+        'recent_conflicts': [{
+            'operation': entry['operation'],
+            'payload': json.loads(entry['payload']),
+            'recorded_at': datetime.fromtimestamp(entry['recorded_at'], tz=dt_timezone.utc),
+            'detail': entry['detail'],
+        } for entry in conflicts],
+    }
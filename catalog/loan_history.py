@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Checkout, LoanHistory, Fine
+
+# Loan archive. Checkout only needs the open loans, but returned ones used to
+# stay there forever, so every open-loan query scanned years of history.
+# archive_loans moves loans returned more than LOAN_HISTORY_AFTER_DAYS ago
+# into LoanHistory in batches of LOAN_HISTORY_BATCH_SIZE. Each batch copies
+# the rows, points their fines at the copy and deletes the originals in one
+# transaction. Recent returns stay in Checkout, so the check-in desk and the
+# "today" counters never need the archive.
+
+def _archive_batch(ids, anonymize):
+    with transaction.atomic():
+        rows = list(
+            Checkout.objects.select_for_update(of=('self',)).filter(id__in=ids, returned_at__isnull=False).values_list(
+                'id', 'patron_id', 'media_item_id', 'media_item__work_id', 'checked_out_at', 'due_date', 'returned_at', 'updated_at', 'renewals'
+            )
+        )
+        if not rows:
+            return 0
+        LoanHistory.objects.bulk_create([
+            LoanHistory(
+                loan_id=loan_id,
+                patron_id=None if anonymize else patron_id,
+                media_item_id=media_item_id,
+                work_id=work_id,
+                checked_out_at=checked_out_at,
+                due_date=due_date,
+                returned_at=returned_at,
+                closed_at=closed_at,
+                renewals=renewals,
+            ) for loan_id, patron_id, media_item_id, work_id, checked_out_at, due_date, returned_at, closed_at, renewals in rows
+        ], ignore_conflicts=True)
+        moved = [row[0] for row in rows]
+        Fine.objects.filter(checkout_id__in=moved).update(loan_id=F('checkout_id'), checkout=None)
+        Checkout.objects.filter(id__in=moved).delete()
+    return len(rows)
+
+def archive(days=None, batch_size=None, anonymize=None):
+    # Returns (loans moved, seconds).
+    days = settings.LOAN_HISTORY_AFTER_DAYS if days is None else max(days, 1)
+    batch_size = batch_size or settings.LOAN_HISTORY_BATCH_SIZE
+    anonymize = settings.LOAN_HISTORY_ANONYMIZE if anonymize is None else anonymize
+    cutoff = timezone.now() - timedelta(days=days)
+    started = time.perf_counter()
+    returned = Checkout.objects.filter(returned_at__lt=cutoff)
+    moved = 0
+    last_id = 0
+    while True:
+        ids = list(returned.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        moved += _archive_batch(ids, anonymize)
+        last_id = ids[-1]
+    return moved, time.perf_counter() - started
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from . import metrics
+from .models import Patron
+
+# PBKDF2 runs inside OpenSSL with the GIL released, so a small thread pool
+# lets one worker process verify several logins on several cores. The pool is
+# bounded: at most LOGIN_HASH_WORKERS hashes run at once, LOGIN_HASH_QUEUE more
+# may wait, and anything beyond that gets LoginBusy right away instead of
+# piling up. An admitted login still holds its request thread until its hash
+# is done.
+
+class LoginBusy(Exception):
+    pass
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+def _get_pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.LOGIN_HASH_WORKERS,
+                thread_name_prefix='login-hash',
+            )
+            _slots = threading.BoundedSemaphore(settings.LOGIN_HASH_WORKERS + settings.LOGIN_HASH_QUEUE)
+    return _executor, _slots
+
+def _hash_field(account):
+    return 'pin_hash' if isinstance(account, Patron) else 'password_hash'
+
+def _check(account, secret):
+    if isinstance(account, Patron):
+        return account.check_pin(secret)
+    return account.check_password(secret)
+
+def verify_credentials(account, secret):
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        metrics.inc('login_busy_total')
+        raise LoginBusy()
+    field = _hash_field(account)
+    old_hash = getattr(account, field)
+    try:
+        is_valid = executor.submit(_check, account, secret).result()
+    finally:
+        slots.release()
+    # check_pin/check_password re-hash in place when the configured cost
+    # changed; persist that here, on the request thread's DB connection.
+    if is_valid and getattr(account, field) != old_hash:
+        account.save(update_fields=[field])
+    return is_valid
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog import loan_history
+from catalog.models import Checkout, LoanHistory
+
+class Command(BaseCommand):
+    help = 'Move returned loans from Checkout into the loan history (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Archive loans returned more than this many days ago (default: LOAN_HISTORY_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Loans per transaction (default: LOAN_HISTORY_BATCH_SIZE)')
+        parser.add_argument('--anonymize', action='store_true', default=None, help='Drop the patron from archived loans (default: LOAN_HISTORY_ANONYMIZE)')
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        before = Checkout.objects.count()
+        moved, seconds = loan_history.archive(kwargs['days'], kwargs['batch_size'], kwargs['anonymize'])
+        self.stdout.write(f'Checkout rows: {before} -> {before - moved}; loan history rows: {LoanHistory.objects.count()}')
+        rate = moved / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} loans in {time.perf_counter() - started:.2f}s ({rate:.0f} loans/s)'))
@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog.renewals import auto_renew
+
+class Command(BaseCommand):
+    help = 'Renew loans that are due soon when no one is waiting for them (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Renew loans due within this many days (default: AUTO_RENEW_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Loans per UPDATE (default: AUTO_RENEW_BATCH_SIZE)')
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        renewed = auto_renew(days=kwargs['days'], batch_size=kwargs['batch_size'])
+        for period, count in renewed.items():
+            self.stdout.write(f'{period}-day loans: {count} renewed')
+        elapsed = time.perf_counter() - started
+        total = sum(renewed.values())
+        self.stdout.write(self.style.SUCCESS(f'Renewed {total} loans in {elapsed:.2f}s ({total / elapsed:.0f} loans/s)'))
@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, check_password, get_hasher
+from django.core.management.base import BaseCommand
+from catalog.hashers import PatronPINHasher, LibrarianPasswordHasher
+
+class Command(BaseCommand):
+    help = 'Measure credential checks per second: serial default PBKDF2 vs the login hashing pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=60)
+        parser.add_argument('--workers', type=int, default=settings.LOGIN_HASH_WORKERS)
+
+    def handle(self, *args, **options):
+        logins = options['logins']
+        workers = options['workers']
+        cores = os.cpu_count() or 1
+
+        default_hasher = get_hasher('default')
+        self.stdout.write(f'{logins} logins, {workers} pool workers, {cores} cores')
+
+        encoded = make_password('1234', hasher=default_hasher.algorithm)
+        rate = self._serial(encoded, logins)
+        self.stdout.write(
+            f'before  {default_hasher.algorithm} ({default_hasher.iterations} iterations), serial: '
+            f'{rate:.1f} logins/s on one core'
+        )
+
+        for hasher_class in (PatronPINHasher, LibrarianPasswordHasher):
+            hasher = hasher_class()
+            encoded = make_password('1234', hasher=hasher.algorithm)
+            rate = self._serial(encoded, logins)
+            self.stdout.write(
+                f'after   {hasher.algorithm} ({hasher.iterations} iterations), serial: {rate:.1f} logins/s'
+            )
+            rate = self._pooled(encoded, logins, workers)
+            used = min(workers, cores)
+            self.stdout.write(
+                f'after   {hasher.algorithm} ({hasher.iterations} iterations), pool: '
+                f'{rate:.1f} logins/s, {rate / used:.1f} per busy core'
+            )
+
+    def _serial(self, encoded, logins):
+        start = time.perf_counter()
+        for _ in range(logins):
+            check_password('1234', encoded)
+        return logins / (time.perf_counter() - start)
+
+    def _pooled(self, encoded, logins, workers):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: check_password('1234', encoded), range(logins)))
+            return logins / (time.perf_counter() - start)
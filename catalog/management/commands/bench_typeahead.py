@@ -0,0 +1,41 @@
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from django.core.management.base import BaseCommand
+
+PREFIXES = ['a', 'th', 'the', 'dun', 'mid', 'at', 'pro', 'bc-', 'lc-', 'sa', 'mi', 'in']
+
+class Command(BaseCommand):
+    help = 'Fire concurrent typeahead requests at a running server and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='e.g. http://127.0.0.1:8000 (run once against the WSGI and once against the ASGI server)')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--endpoint', choices=['items', 'patrons'], default='items')
+
+    def handle(self, *args, **options):
+        url = f"{options['base_url'].rstrip('/')}/api/{options['endpoint']}/search/"
+
+        def fetch(_):
+            query = urlencode({'q': random.choice(PREFIXES)})
+            start = time.perf_counter()
+            with urlopen(f'{url}?{query}', timeout=30) as response:
+                json.load(response)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            start = time.perf_counter()
+            latencies = sorted(executor.map(fetch, range(options['requests'])))
+            elapsed = time.perf_counter() - start
+
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{options['requests']} requests, concurrency {options['concurrency']}: "
+            f'{len(latencies) / elapsed:.0f} req/s, '
+            f'p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms'
+        )
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog import recommendations
+
+class Command(BaseCommand):
+    help = 'Build the "patrons also borrowed" recommendations from checkout history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help='Only fold in checkouts made since the last run')
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        if kwargs['incremental']:
+            pairs = recommendations.update()
+            self.stdout.write(self.style.SUCCESS(f'Updated {pairs} item pairs in {time.perf_counter() - started:.2f}s'))
+        else:
+            pairs = recommendations.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {pairs} item pairs in {time.perf_counter() - started:.2f}s'))
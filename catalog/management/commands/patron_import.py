@@ -0,0 +1,45 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from catalog import roster
+
+class Command(BaseCommand):
+    help = 'Create patron accounts from roster CSV files with name, email and pin columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Roster CSV files with a name,email,pin header')
+        parser.add_argument('--report', help='Write one CSV row per roster row with its card number or why it was skipped ("-" for stdout)')
+        parser.add_argument('--expires-days', type=int, default=365, help='Days until the new cards expire')
+        parser.add_argument('--batch-size', type=int, default=None, help='Patrons per transaction (default: PATRON_IMPORT_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, default=None, help='PIN hashing threads (default: PATRON_IMPORT_WORKERS)')
+
+    def handle(self, *args, **options):
+        try:
+            files = [open(path, newline='', encoding='utf-8-sig') for path in options['files']]
+        except OSError as e:
+            raise CommandError(e)
+        report = None
+        if options['report'] == '-':
+            report = sys.stdout
+        elif options['report']:
+            report = open(options['report'], 'w', newline='')
+        try:
+            counts, seconds = roster.run(files, report, options['expires_days'], options['batch_size'], options['workers'])
+        except ValueError as e:
+            raise CommandError(e)
+        finally:
+            for f in files:
+                f.close()
+            if report not in (None, sys.stdout):
+                report.close()
+
+        rows = sum(counts.values())
+        rate = rows / seconds if seconds else 0
+        if counts['exists'] or counts['duplicate']:
+            self.stdout.write(self.style.WARNING(
+                f'Skipped {counts["exists"]} already registered and {counts["duplicate"]} repeated emails'
+            ))
+        if counts['invalid']:
+            self.stdout.write(self.style.WARNING(f'Skipped {counts["invalid"]} rows without a valid name, email and pin'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {counts["imported"]} of {rows} patrons in {seconds:.2f}s ({rate:.0f} rows/s)'
+        ))
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from catalog.models import Patron, Librarian, MediaItem, Checkout, Hold, MediaRequest, ActivityLog
+from catalog.models import Patron, Librarian, Work, MediaItem, Checkout, Hold, MediaRequest, ActivityLog
 
 class Command(BaseCommand):
     help = 'Populate the database with sample data'
@@ -56,13 +56,22 @@ class Command(BaseCommand):
             {'title': 'Time Magazine', 'author': 'Time Inc.', 'media_type': 'magazine', 'barcode': 'BC-000000013', 'genre': 'News', 'description': 'Weekly news magazine covering current events.'},
             {'title': 'National Geographic', 'author': 'National Geographic Society', 'media_type': 'magazine', 'barcode': 'BC-000000014', 'genre': 'Science', 'description': 'Monthly magazine about nature, science, and culture.'},
             {'title': 'Klara and the Sun', 'author': 'Kazuo Ishiguro', 'media_type': 'book', 'barcode': 'BC-000000015', 'genre': 'Science Fiction', 'description': 'A story about artificial intelligence and love.'},
+            {'title': 'Atomic Habits', 'author': 'James Clear', 'media_type': 'book', 'barcode': 'BC-000000016', 'genre': 'Self-Help', 'description': 'An easy & proven way to build good habits & break bad ones.'},
+            {'title': 'Project Hail Mary', 'author': 'Andy Weir', 'media_type': 'book', 'barcode': 'BC-000000017', 'genre': 'Science Fiction', 'description': 'A lone astronaut must save Earth from disaster.'},
         ]
         
         for book_data in books:
-            MediaItem.objects.get_or_create(
-                barcode=book_data['barcode'],
+            barcode = book_data.pop('barcode')
+            work, _ = Work.objects.get_or_create(
+                title=book_data.pop('title'),
+                author=book_data.pop('author'),
+                media_type=book_data.pop('media_type'),
                 defaults=book_data
             )
+            MediaItem.objects.get_or_create(
+                barcode=barcode,
+                defaults={'work': work}
+            )
         
         self.stdout.write(self.style.SUCCESS(f'Created {len(books)} media items'))
 
@@ -101,7 +110,7 @@ class Command(BaseCommand):
         item3 = MediaItem.objects.get(barcode='BC-000000003')
         Hold.objects.get_or_create(
             patron=patron1,
-            media_item=item3,
+            work=item3.work,
             defaults={'queue_position': 1, 'status': 'pending'}
         )
 
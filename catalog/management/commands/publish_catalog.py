@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog import snapshot
+
+class Command(BaseCommand):
+    help = 'Publish the read-only catalog snapshot used by the home page and patron search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and republish every --interval seconds')
+        parser.add_argument('--interval', type=int, default=300, help='Seconds between publishes with --loop')
+        parser.add_argument('--path', default=None, help='Snapshot file (default: CATALOG_SNAPSHOT_PATH)')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            works = snapshot.publish(options['path'])
+            seconds = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f'Published {works} works in {seconds:.2f}s.'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
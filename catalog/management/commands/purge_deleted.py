@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog import purge
+
+class Command(BaseCommand):
+    help = 'Clean up after deleted patrons and titles in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per transaction (default: PURGE_BATCH_SIZE)')
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many jobs')
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        finished = purge.run_pending(kwargs['batch_size'], kwargs['limit'])
+        for job, rows in finished:
+            self.stdout.write(f'{job.kind} {job.object_id}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(f'Purged {len(finished)} deleted records in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,43 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from catalog import inventory
+
+class Command(BaseCommand):
+    help = 'Compare shelf scan files with the catalog and report missing and misplaced items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Scan files: one barcode per line with --location, else "location,barcode" lines')
+        parser.add_argument('--location', help='Shelf location every barcode in the files was scanned at')
+        parser.add_argument('--report', help='Write one CSV row per discrepancy to this file ("-" for stdout)')
+        parser.add_argument('--mark-lost-after', type=int, default=None, metavar='DAYS',
+                            help='Mark missing items lost if no inventory has seen them for this many days')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            files = [open(path, newline='') for path in options['files']]
+        except OSError as e:
+            raise CommandError(e)
+        report = None
+        if options['report'] == '-':
+            report = sys.stdout
+        elif options['report']:
+            report = open(options['report'], 'w', newline='')
+        try:
+            summary, counts = inventory.run(files, options['location'], report, options['mark_lost_after'])
+        finally:
+            for f in files:
+                f.close()
+            if report not in (None, sys.stdout):
+                report.close()
+
+        for location, stats in summary.items():
+            details = ', '.join(f'{category.replace("_", " ")} {stats[category]}' for category in inventory.CATEGORIES)
+            self.stdout.write(f'{location}: {stats["scanned"]} scanned, {details}')
+            if 'marked_lost' in stats:
+                self.stdout.write(f'{location}: {stats["marked_lost"]} marked lost')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {counts["lines"]} scans ({counts["invalid"]} unreadable) in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog import journal
+
+class Command(BaseCommand):
+    help = 'Apply desk transactions recorded in the offline circulation journal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the journal')
+        parser.add_argument('--interval', type=int, default=5, help='Seconds between polls with --loop')
+        parser.add_argument('--batch-size', type=int, default=None, help='Entries per pass (default: CIRCULATION_REPLAY_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        while True:
+            self.drain(options['batch_size'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def drain(self, batch_size):
+        while True:
+            outcomes, seconds = journal.replay(batch_size)
+            if not outcomes:
+                return
+            replayed = sum(outcomes.values()) - outcomes['error']
+            summary = ', '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items()) if outcome != 'error')
+            self.stdout.write(f'replayed {replayed} in {seconds:.2f}s ({replayed / seconds:.0f}/s): {summary}')
+            if outcomes['error']:
+                self.stdout.write(self.style.WARNING('Database unavailable, will retry.'))
+                return
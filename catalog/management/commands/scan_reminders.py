@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from catalog.notifications import scan_reminders
+
+class Command(BaseCommand):
+    help = 'Queue due-soon, overdue and hold-ready notifications (run nightly)'
+
+    def handle(self, *args, **kwargs):
+        created = scan_reminders()
+        for kind, count in created.items():
+            self.stdout.write(f'{kind}: {count} checked')
+        self.stdout.write(self.style.SUCCESS('Reminder scan complete.'))
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from catalog.notifications import send_pending
+
+class Command(BaseCommand):
+    help = 'Deliver queued patron notifications in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the outbox')
+        parser.add_argument('--interval', type=int, default=30, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = send_pending()
+            while stats['sent'] or stats['failed'] or stats['retry']:
+                self.stdout.write(f"sent {stats['sent']}, retrying {stats['retry']}, failed {stats['failed']}")
+                stats = send_pending()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite database onto the SQLITE_REPLICAS files (local stand-in for replication)'
+
+    def handle(self, *args, **kwargs):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Only SQLite replicas are copied; real replicas follow the primary on their own.')
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write('No replicas configured (set SQLITE_REPLICAS).')
+            return
+        
+        source = sqlite3.connect(str(primary['NAME']))
+        for alias in settings.DATABASE_REPLICAS:
+            # NAME is a read-only URI: file:<path>?mode=ro
+            path = settings.DATABASES[alias]['NAME'][len('file:'):].split('?')[0]
+            target = sqlite3.connect(path)
+            source.backup(target)
+            target.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: copied to {path}'))
+        source.close()
@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Prometheus-style metrics. Every thread records into its own shard, so the
+# request path never takes a lock; a scrape sums the shards. With METRICS_DIR
+# set, each process also dumps its totals there every METRICS_FLUSH_SECONDS
+# and /metrics merges the files of all worker processes.
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name and status.'),
+    'db_queries_per_request': ('histogram', 'Database queries issued per request, by URL name.'),
+    'db_seconds_per_request': ('histogram', 'Time spent in the database per request, by URL name.'),
+    'circulation_operations_total': ('counter', 'Checkouts, check-ins and holds filled.'),
+    'circulation_replay_total': ('counter', 'Offline journal entries replayed, by outcome.'),
+    'principal_cache_requests_total': ('counter', 'Principal cache lookups by result.'),
+    'login_busy_total': ('counter', 'Logins turned away because the hash pool was full.'),
+    'throttle_decisions_total': ('counter', 'Throttled requests by scope and decision (allowed, limited, busy, shed).'),
+    'request_queue_seconds': ('histogram', 'Time requests waited at the proxy before a worker took them.'),
+    'catalog_snapshot_reads_total': ('counter', 'Catalog snapshot reads by result (hit, stale, missing, error).'),
+    'notification_outbox_pending': ('gauge', 'Notifications waiting to be sent.'),
+}
+
+class _Shard:
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+def _buckets(name):
+    if name == 'db_queries_per_request':
+        return settings.METRICS_QUERY_BUCKETS
+    return settings.METRICS_LATENCY_BUCKETS
+
+def inc(name, amount=1, **labels):
+    _shard().counters[(name, tuple(sorted(labels.items())))] += amount
+
+def observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    histograms = _shard().histograms
+    buckets = _buckets(name)
+    row = histograms.get(key)
+    if row is None:
+        # One count per bucket plus +Inf, then sum and count.
+        row = histograms[key] = [0] * (len(buckets) + 3)
+    row[bisect_left(buckets, value)] += 1
+    row[-2] += value
+    row[-1] += 1
+
+def snapshot():
+    # Totals of this process. dict() copies are atomic, so shards can be
+    # read while their threads keep writing.
+    counters = defaultdict(float)
+    histograms = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, value in dict(shard.counters).items():
+            counters[key] += value
+        for key, row in dict(shard.histograms).items():
+            merged = histograms.setdefault(key, [0] * len(row))
+            for i, value in enumerate(list(row)):
+                merged[i] += value
+    return counters, histograms
+
+_process = {'pid': None, 'path': None, 'flushed': 0}
+_flush_lock = threading.Lock()
+
+def _process_file():
+    # The name includes the start time so a reused pid never overwrites
+    # an earlier worker's totals.
+    if _process['pid'] != os.getpid():
+        _process['pid'] = os.getpid()
+        _process['path'] = os.path.join(settings.METRICS_DIR, f'{os.getpid()}-{time.time_ns()}.json')
+    return _process['path']
+
+def flush(force=False):
+    if not settings.METRICS_DIR:
+        return
+    if not force and time.monotonic() - _process['flushed'] < settings.METRICS_FLUSH_SECONDS:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _process['flushed'] = time.monotonic()
+        counters, histograms = snapshot()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = _process_file()
+        with open(path + '.tmp', 'w') as f:
+            json.dump({
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [[name, labels, row] for (name, labels), row in histograms.items()],
+            }, f)
+        os.replace(path + '.tmp', path)
+    finally:
+        _flush_lock.release()
+
+def collect():
+    if not settings.METRICS_DIR:
+        return snapshot()
+    flush(force=True)
+    counters = defaultdict(float)
+    histograms = {}
+    for filename in os.listdir(settings.METRICS_DIR):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data['counters']:
+            counters[(name, tuple(tuple(pair) for pair in labels))] += value
+        for name, labels, row in data['histograms']:
+            merged = histograms.setdefault((name, tuple(tuple(pair) for pair in labels)), [0] * len(row))
+            for i, value in enumerate(row):
+                merged[i] += value
+    return counters, histograms
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def render(gauges=None):
+    counters, histograms = collect()
+    for name, value in (gauges or {}).items():
+        counters[(name, ())] = value
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), row in histograms.items():
+        by_name[name].append((labels, row))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(_buckets(name)) + ['+Inf'], value[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-2])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+class _QueryStats:
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.seconds = 0.0
+
+_query_stats = ContextVar('query_stats', default=None)
+
+def current_view():
+    # URL name of the request this code runs for, if any.
+    stats = _query_stats.get()
+    match = getattr(stats.request, 'resolver_match', None) if stats else None
+    return match.view_name if match else None
+
+def count_queries(execute, sql, params, many, context):
+    # Installed on every connection by catalog.signals. The stats object
+    # travels in a context variable, so queries run by async views on
+    # sync_to_async threads are counted against their request too.
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - started
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _QueryStats(request)
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = _QueryStats(request)
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, stats, seconds):
+        # Label by URL name rather than path so ids don't explode the series.
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        observe('http_request_duration_seconds', seconds, view=view, status=response.status_code)
+        observe('db_queries_per_request', stats.queries, view=view)
+        observe('db_seconds_per_request', stats.seconds, view=view)
+        flush()
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:01
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    IdentifierSequence = apps.get_model('catalog', 'IdentifierSequence')
+    IdentifierSequence.objects.get_or_create(name='card_number', defaults={'next_value': 200000})
+    IdentifierSequence.objects.get_or_create(name='barcode', defaults={'next_value': 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentifierSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Work',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=300)),
+                ('author', models.CharField(max_length=200)),
+                ('media_type', models.CharField(choices=[('book', 'Book'), ('audiobook', 'Audiobook'), ('dvd', 'DVD'), ('cd', 'Music CD'), ('magazine', 'Magazine')], max_length=20)),
+                ('isbn', models.CharField(blank=True, max_length=20, null=True)),
+                ('description', models.TextField(blank=True)),
+                ('genre', models.CharField(blank=True, max_length=100)),
+                ('publisher', models.CharField(blank=True, max_length=200)),
+                ('pages', models.IntegerField(blank=True, null=True)),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['isbn'], name='catalog_wor_isbn_e35854_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='mediaitem',
+            name='work',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='catalog.work'),
+        ),
+        migrations.AddField(
+            model_name='hold',
+            name='work',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='catalog.work'),
+        ),
+        # Nullable until 0008 drops them, so the split can be reversed.
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='title',
+            field=models.CharField(max_length=300, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='author',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='media_type',
+            field=models.CharField(choices=[('book', 'Book'), ('audiobook', 'Audiobook'), ('dvd', 'DVD'), ('cd', 'Music CD'), ('magazine', 'Magazine')], max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='hold',
+            name='media_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.mediaitem'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:05
+
+from django.db import migrations
+
+BIBLIOGRAPHIC_FIELDS = ('title', 'author', 'media_type', 'isbn', 'description', 'genre', 'publisher', 'pages')
+
+
+def split_works(apps, schema_editor):
+    # Copies sharing an ISBN, or else the same title, author and media type,
+    # become one work. Holds move to the work and pending ones re-queue by
+    # placement time, since any copy can now satisfy them.
+    Work = apps.get_model('catalog', 'Work')
+    MediaItem = apps.get_model('catalog', 'MediaItem')
+    Hold = apps.get_model('catalog', 'Hold')
+
+    works = {}
+    for item in MediaItem.objects.order_by('id').iterator():
+        if item.isbn:
+            key = ('isbn', item.isbn.strip())
+        else:
+            key = ('title', item.title.strip().lower(), item.author.strip().lower(), item.media_type)
+        if key not in works:
+            works[key] = Work.objects.create(**{name: getattr(item, name) for name in BIBLIOGRAPHIC_FIELDS})
+        item.work = works[key]
+        item.save(update_fields=['work'])
+
+    positions = {}
+    for hold in Hold.objects.select_related('media_item').order_by('placed_at', 'id').iterator():
+        hold.work_id = hold.media_item.work_id
+        if hold.status == 'pending':
+            hold.media_item = None
+            positions[hold.work_id] = positions.get(hold.work_id, 0) + 1
+            hold.queue_position = positions[hold.work_id]
+        hold.save(update_fields=['work', 'media_item', 'queue_position'])
+
+
+def join_works(apps, schema_editor):
+    MediaItem = apps.get_model('catalog', 'MediaItem')
+    Hold = apps.get_model('catalog', 'Hold')
+
+    for item in MediaItem.objects.select_related('work').iterator():
+        for name in BIBLIOGRAPHIC_FIELDS:
+            setattr(item, name, getattr(item.work, name))
+        item.save(update_fields=BIBLIOGRAPHIC_FIELDS)
+    for hold in Hold.objects.filter(media_item__isnull=True).iterator():
+        hold.media_item = MediaItem.objects.filter(work_id=hold.work_id).order_by('id').first()
+        hold.save(update_fields=['media_item'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_work'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_works, join_works),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reset_recommendations(apps, schema_editor):
+    # Recommendations are rebuilt per work; the next incremental run starts
+    # from the first checkout.
+    JobCheckpoint = apps.get_model('catalog', 'JobCheckpoint')
+    JobCheckpoint.objects.filter(name='recommendations').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_split_works'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='author',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='media_type',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='isbn',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='genre',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='publisher',
+        ),
+        migrations.RemoveField(
+            model_name='mediaitem',
+            name='pages',
+        ),
+        migrations.AlterField(
+            model_name='mediaitem',
+            name='work',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='catalog.work'),
+        ),
+        migrations.AlterField(
+            model_name='hold',
+            name='work',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.work'),
+        ),
+        migrations.DeleteModel(
+            name='ItemRecommendation',
+        ),
+        migrations.DeleteModel(
+            name='CoBorrowCount',
+        ),
+        migrations.CreateModel(
+            name='CoBorrowCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.work')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.work')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('work', 'other'), name='unique_coborrow_pair')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField()),
+                ('rank', models.IntegerField()),
+                ('work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='catalog.work')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.work')),
+            ],
+            options={
+                'ordering': ['rank'],
+                'indexes': [models.Index(fields=['work', 'rank'], name='catalog_wor_work_id_adedea_idx')],
+            },
+        ),
+        migrations.RunPython(reset_recommendations, migrations.RunPython.noop),
+    ]
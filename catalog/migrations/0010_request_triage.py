@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:34
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Copies of catalog.models.normalize_title/normalize_isbn as they were when
+# this migration was written, so later changes there don't alter it.
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_LEADING_ARTICLE = re.compile(r'^(the|a|an) ')
+
+
+def normalize_title(title):
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = ' '.join(_PUNCTUATION.sub(' ', text).split())
+    return _LEADING_ARTICLE.sub('', text)[:300]
+
+
+def normalize_isbn(isbn):
+    return re.sub(r'[^0-9X]', '', (isbn or '').upper())
+
+
+def fill_normalized_titles(apps, schema_editor):
+    Work = apps.get_model('catalog', 'Work')
+    MediaRequest = apps.get_model('catalog', 'MediaRequest')
+
+    works = list(Work.objects.all())
+    for work in works:
+        work.normalized_title = normalize_title(work.title)
+        work.isbn = normalize_isbn(work.isbn) or None
+    Work.objects.bulk_update(works, ['normalized_title', 'isbn'], batch_size=500)
+
+    media_requests = list(MediaRequest.objects.all())
+    for media_request in media_requests:
+        media_request.normalized_title = normalize_title(media_request.title)
+    MediaRequest.objects.bulk_update(media_requests, ['normalized_title'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediarequest',
+            name='isbn',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='mediarequest',
+            name='normalized_title',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='normalized_title',
+            field=models.CharField(blank=True, db_index=True, max_length=300),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='action',
+            field=models.CharField(choices=[('checkout', 'Checkout'), ('checkin', 'Check In'), ('hold_placed', 'Hold Placed'), ('hold_cancelled', 'Hold Cancelled'), ('request_submitted', 'Request Submitted'), ('request_approved', 'Request Approved'), ('request_rejected', 'Request Rejected'), ('patron_created', 'Patron Created'), ('renewal', 'Renewal')], max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='mediarequest',
+            index=models.Index(fields=['status', 'normalized_title'], name='catalog_med_status_01d288_idx'),
+        ),
+        migrations.RunPython(fill_normalized_titles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_request_triage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplayedOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('operation', models.CharField(max_length=20)),
+                ('outcome', models.CharField(max_length=20)),
+                ('detail', models.TextField(blank=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('replayed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
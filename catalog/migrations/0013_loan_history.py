@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_inventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loan_id', models.BigIntegerField(unique=True)),
+                ('checked_out_at', models.DateTimeField()),
+                ('due_date', models.DateTimeField()),
+                ('returned_at', models.DateTimeField()),
+                ('renewals', models.PositiveSmallIntegerField(default=0)),
+                ('media_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.mediaitem')),
+                ('patron', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.patron')),
+                ('work', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.work')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fine',
+            name='loan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fines', to='catalog.loanhistory', to_field='loan_id'),
+        ),
+        migrations.AddIndex(
+            model_name='loanhistory',
+            index=models.Index(fields=['patron', 'checked_out_at'], name='catalog_loa_patron__dab932_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanhistory',
+            index=models.Index(fields=['returned_at'], name='catalog_loa_returne_fa2315_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_loan_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(fields=['status', 'work', 'placed_at'], name='catalog_hol_status_78355c_idx'),
+        ),
+    ]
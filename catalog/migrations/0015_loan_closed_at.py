@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:32
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_returned_at(apps, schema_editor):
+    # Loans archived so far were all in the analytics columns already; their
+    # return time is as good a close time as any.
+    LoanHistory = apps.get_model('catalog', 'LoanHistory')
+    LoanHistory.objects.update(closed_at=F('returned_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_hold_queue_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanhistory',
+            name='closed_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_returned_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='loanhistory',
+            name='closed_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='loanhistory',
+            index=models.Index(fields=['closed_at'], name='catalog_loa_closed__c1084b_idx'),
+        ),
+    ]
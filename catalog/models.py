@@ -1,9 +1,48 @@
+import re
+import unicodedata
 from django.db import models
+from django.db.models import Count, DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 from datetime import timedelta
-import random
-import string
+from .hashers import PatronPINHasher, LibrarianPasswordHasher
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_LEADING_ARTICLE = re.compile(r'^(the|a|an) ')
+
+def normalize_title(title):
+    # Case, accents, punctuation and a leading article don't make it a
+    # different title: "The Hobbit!" and "hobbit" match.
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = ' '.join(_PUNCTUATION.sub(' ', text).split())
+    return _LEADING_ARTICLE.sub('', text)[:300]
+
+def normalize_isbn(isbn):
+    return re.sub(r'[^0-9X]', '', (isbn or '').upper())
+
+class LiveManager(models.Manager):
+    # Default manager of soft-deletable models: rows with deleted_at set are
+    # hidden everywhere unless all_objects is used. Foreign keys still
+    # resolve to them, so circulation history keeps pointing at its rows.
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+class PatronQuerySet(models.QuerySet):
+    def with_account_totals(self):
+        # Open loan count and unpaid fines as correlated subqueries, so a
+        # page of patrons costs one query instead of two more per patron.
+        open_loans = Checkout.objects.filter(
+            patron=OuterRef('pk'), returned_at__isnull=True
+        ).values('patron').annotate(n=Count('id')).values('n')
+        unpaid = Fine.objects.filter(
+            patron=OuterRef('pk'), paid=False
+        ).values('patron').annotate(total=Sum('amount')).values('total')
+        return self.annotate(
+            checked_out=Coalesce(Subquery(open_loans), 0),
+            fines=Coalesce(Subquery(unpaid), Value(0), output_field=DecimalField(max_digits=8, decimal_places=2)),
+        )
 
 class Patron(models.Model):
     STATUS_CHOICES = [
@@ -19,16 +58,22 @@ class Patron(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = LiveManager.from_queryset(PatronQuerySet)()
+    all_objects = PatronQuerySet.as_manager()
     
     def set_pin(self, pin):
-        self.pin_hash = make_password(pin)
+        self.pin_hash = make_password(pin, hasher=PatronPINHasher.algorithm)
     
     def check_pin(self, pin):
-        return check_password(pin, self.pin_hash)
+        return check_password(pin, self.pin_hash, self.set_pin, preferred=PatronPINHasher.algorithm)
     
     @staticmethod
     def generate_card_number():
-        return 'LC-' + ''.join(random.choices(string.digits, k=6))
+        from .allocators import card_numbers
+        return card_numbers.allocate()
     
     def get_total_fines(self):
         return sum(f.amount for f in self.fine_set.filter(paid=False))
@@ -39,6 +84,13 @@ class Patron(models.Model):
     def get_holds_count(self):
         return self.hold_set.filter(status__in=['pending', 'ready', 'in_transit']).count()
     
+    def soft_delete(self):
+        # The email is freed right away so it can be registered again; the
+        # rest of the record is anonymized by the purge job.
+        self.deleted_at = timezone.now()
+        self.email = f'deleted-{self.pk}@invalid'
+        self.save(update_fields=['deleted_at', 'email', 'updated_at'])
+    
     def __str__(self):
         return f"{self.name} ({self.card_number})"
 
@@ -49,15 +101,25 @@ class Librarian(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def set_password(self, password):
-        self.password_hash = make_password(password)
+        self.password_hash = make_password(password, hasher=LibrarianPasswordHasher.algorithm)
     
     def check_password(self, password):
-        return check_password(password, self.password_hash)
+        return check_password(password, self.password_hash, self.set_password, preferred=LibrarianPasswordHasher.algorithm)
     
     def __str__(self):
         return self.username
 
-class MediaItem(models.Model):
+class WorkQuerySet(models.QuerySet):
+    def with_availability(self):
+        # Copy counts per work from one grouped join instead of a query
+        # per work.
+        live = Q(copies__deleted_at__isnull=True)
+        return self.annotate(
+            copies_count=Count('copies', filter=live),
+            available_copies=Count('copies', filter=live & Q(copies__status='available')),
+        )
+
+class Work(models.Model):
     TYPE_CHOICES = [
         ('book', 'Book'),
         ('audiobook', 'Audiobook'),
@@ -66,6 +128,42 @@ class MediaItem(models.Model):
         ('magazine', 'Magazine'),
     ]
     
+    title = models.CharField(max_length=300)
+    author = models.CharField(max_length=200)
+    media_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    isbn = models.CharField(max_length=20, blank=True, null=True)
+    normalized_title = models.CharField(max_length=300, blank=True, db_index=True)
+    description = models.TextField(blank=True)
+    genre = models.CharField(max_length=100, blank=True)
+    publisher = models.CharField(max_length=200, blank=True)
+    pages = models.IntegerField(null=True, blank=True)
+    added_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = LiveManager.from_queryset(WorkQuerySet)()
+    all_objects = WorkQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [models.Index(fields=['isbn'])]
+    
+    def save(self, *args, **kwargs):
+        self.normalized_title = normalize_title(self.title)
+        if self.isbn:
+            self.isbn = normalize_isbn(self.isbn)
+        super().save(*args, **kwargs)
+    
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+    
+    def __str__(self):
+        return f"{self.title} by {self.author}"
+
+class MediaItem(models.Model):
+    # One physical copy of a Work.
+    TYPE_CHOICES = Work.TYPE_CHOICES
+    
     STATUS_CHOICES = [
         ('available', 'Available'),
         ('checked_out', 'Checked Out'),
@@ -74,31 +172,75 @@ class MediaItem(models.Model):
         ('lost', 'Lost'),
     ]
     
-    title = models.CharField(max_length=300)
-    author = models.CharField(max_length=200)
-    media_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
-    isbn = models.CharField(max_length=20, blank=True, null=True)
+    LOAN_PERIOD_DAYS = {'dvd': 7, 'cd': 7, 'magazine': 14}
+    DEFAULT_LOAN_PERIOD_DAYS = 21
+    
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='copies')
     barcode = models.CharField(max_length=50, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
-    description = models.TextField(blank=True)
-    genre = models.CharField(max_length=100, blank=True)
-    publisher = models.CharField(max_length=200, blank=True)
     location = models.CharField(max_length=100, blank=True)
-    pages = models.IntegerField(null=True, blank=True)
     added_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    last_inventoried_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = LiveManager()
+    all_objects = models.Manager()
+    
+    class Meta:
+        indexes = [models.Index(fields=['location'])]
+    
+    # Bibliographic fields live on the work; select_related('work') when
+    # listing copies.
+    @property
+    def title(self):
+        return self.work.title
+    
+    @property
+    def author(self):
+        return self.work.author
+    
+    @property
+    def media_type(self):
+        return self.work.media_type
+    
+    @property
+    def isbn(self):
+        return self.work.isbn
+    
+    @property
+    def description(self):
+        return self.work.description
+    
+    @property
+    def genre(self):
+        return self.work.genre
+    
+    @property
+    def publisher(self):
+        return self.work.publisher
+    
+    @property
+    def pages(self):
+        return self.work.pages
+    
+    def get_media_type_display(self):
+        return self.work.get_media_type_display()
     
     def get_loan_period_days(self):
-        if self.media_type in ['dvd', 'cd']:
-            return 7
-        elif self.media_type == 'magazine':
-            return 14
-        return 21
+        return self.LOAN_PERIOD_DAYS.get(self.media_type, self.DEFAULT_LOAN_PERIOD_DAYS)
     
     def get_fine_per_day(self):
         return 0.45
     
+    def soft_delete(self):
+        # Frees the barcode for a replacement copy.
+        self.deleted_at = timezone.now()
+        self.barcode = f'deleted-{self.pk}-{self.barcode}'[:50]
+        self.save(update_fields=['deleted_at', 'barcode', 'updated_at'])
+    
     def __str__(self):
-        return f"{self.title} by {self.author}"
+        return f"{self.title} ({self.barcode})"
 
 class Checkout(models.Model):
     patron = models.ForeignKey(Patron, on_delete=models.CASCADE)
@@ -107,6 +249,7 @@ class Checkout(models.Model):
     due_date = models.DateTimeField()
     returned_at = models.DateTimeField(null=True, blank=True)
     renewals = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def is_overdue(self):
         check_time = self.returned_at if self.returned_at else timezone.now()
@@ -147,6 +290,36 @@ class Checkout(models.Model):
     def __str__(self):
         return f"{self.patron.name} - {self.media_item.title}"
 
+class LoanHistory(models.Model):
+    # Returned loans moved out of Checkout by archive_loans (see
+    # catalog/loan_history.py). Rows are only ever inserted; loan_id is the
+    # id the loan had in Checkout, so fines and borrow order carry over.
+    # patron is empty when the loan was archived anonymized.
+    loan_id = models.BigIntegerField(unique=True)
+    patron = models.ForeignKey(Patron, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    media_item = models.ForeignKey(MediaItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    work = models.ForeignKey(Work, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    checked_out_at = models.DateTimeField()
+    due_date = models.DateTimeField()
+    returned_at = models.DateTimeField()
+    # When the return reached the database (Checkout.updated_at). Differs
+    # from returned_at for returns replayed from the offline journal.
+    closed_at = models.DateTimeField()
+    renewals = models.PositiveSmallIntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['patron', 'checked_out_at']),
+            models.Index(fields=['returned_at']),
+            models.Index(fields=['closed_at']),
+        ]
+    
+    def is_overdue(self):
+        return self.returned_at > self.due_date
+    
+    def __str__(self):
+        return f"Loan {self.loan_id} returned {self.returned_at:%Y-%m-%d}"
+
 class Hold(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -157,16 +330,24 @@ class Hold(models.Model):
         ('expired', 'Expired'),
     ]
     
+    # Holds queue on the work; media_item is the copy set aside once the
+    # hold is ready.
     patron = models.ForeignKey(Patron, on_delete=models.CASCADE)
-    media_item = models.ForeignKey(MediaItem, on_delete=models.CASCADE)
+    work = models.ForeignKey(Work, on_delete=models.CASCADE)
+    media_item = models.ForeignKey(MediaItem, on_delete=models.SET_NULL, null=True, blank=True)
     placed_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     queue_position = models.IntegerField(default=1)
     pickup_by = models.DateTimeField(null=True, blank=True)
     pickup_location = models.CharField(max_length=100, default='Main Branch')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        # The queue of a work, oldest first: filling holds and the pull list.
+        indexes = [models.Index(fields=['status', 'work', 'placed_at'])]
     
     def __str__(self):
-        return f"Hold: {self.patron.name} - {self.media_item.title}"
+        return f"Hold: {self.patron.name} - {self.work.title}"
 
 class MediaRequest(models.Model):
     STATUS_CHOICES = [
@@ -187,6 +368,8 @@ class MediaRequest(models.Model):
     patron = models.ForeignKey(Patron, on_delete=models.CASCADE)
     title = models.CharField(max_length=300)
     author = models.CharField(max_length=200, blank=True)
+    isbn = models.CharField(max_length=20, blank=True)
+    normalized_title = models.CharField(max_length=300, blank=True)
     media_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     reason = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -195,17 +378,29 @@ class MediaRequest(models.Model):
     reviewed_at = models.DateTimeField(null=True, blank=True)
     reviewed_by = models.ForeignKey(Librarian, on_delete=models.SET_NULL, null=True, blank=True)
     
+    class Meta:
+        # Pending requests are grouped by title for triage.
+        indexes = [models.Index(fields=['status', 'normalized_title'])]
+    
+    def save(self, *args, **kwargs):
+        self.normalized_title = normalize_title(self.title)
+        self.isbn = normalize_isbn(self.isbn)
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return f"Request: {self.title} by {self.patron.name}"
 
 class Fine(models.Model):
     patron = models.ForeignKey(Patron, on_delete=models.CASCADE)
     checkout = models.ForeignKey(Checkout, on_delete=models.CASCADE, null=True, blank=True)
+    # Set instead of checkout once the loan has been archived.
+    loan = models.ForeignKey(LoanHistory, to_field='loan_id', on_delete=models.SET_NULL, null=True, blank=True, related_name='fines')
     amount = models.DecimalField(max_digits=6, decimal_places=2)
     reason = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
     paid = models.BooleanField(default=False)
     paid_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Fine: ${self.amount} - {self.patron.name}"
@@ -218,6 +413,7 @@ class ActivityLog(models.Model):
         ('hold_cancelled', 'Hold Cancelled'),
         ('request_submitted', 'Request Submitted'),
         ('request_approved', 'Request Approved'),
+        ('request_rejected', 'Request Rejected'),
         ('patron_created', 'Patron Created'),
         ('renewal', 'Renewal'),
     ]
@@ -234,3 +430,115 @@ class ActivityLog(models.Model):
     
     def __str__(self):
         return f"{self.action} - {self.created_at}"
+
+class IdentifierSequence(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('hold_ready', 'Hold Ready'),
+        ('request_approved', 'Request Approved'),
+        ('request_available', 'Request Available'),
+        ('due_soon', 'Due Soon'),
+        ('overdue', 'Overdue'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    patron = models.ForeignKey(Patron, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    dedupe_key = models.CharField(max_length=200, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+    
+    def __str__(self):
+        return f"{self.kind} - {self.patron.name}"
+
+class JobCheckpoint(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+class CoBorrowCount(models.Model):
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['work', 'other'], name='unique_coborrow_pair')]
+
+class WorkRecommendation(models.Model):
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField()
+    rank = models.IntegerField()
+    
+    class Meta:
+        ordering = ['rank']
+        indexes = [models.Index(fields=['work', 'rank'])]
+    
+    def __str__(self):
+        return f"{self.work_id} -> {self.recommended_id} ({self.score})"
+
+class PurgeJob(models.Model):
+    KIND_CHOICES = [
+        ('patron', 'Patron'),
+        ('work', 'Work'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ]
+    
+    # Cleans up after a soft-deleted patron or work in batches; step and
+    # rows_done record how far it got.
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    step = models.CharField(max_length=50, blank=True)
+    rows_done = models.IntegerField(default=0)
+    requested_by = models.ForeignKey(Librarian, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+    
+    def __str__(self):
+        return f"Purge {self.kind} {self.object_id}: {self.status}"
+
+class ReplayedOperation(models.Model):
+    # Idempotency keys of offline journal entries already applied, written in
+    # the same transaction as the change itself.
+    key = models.CharField(max_length=100, unique=True)
+    operation = models.CharField(max_length=20)
+    outcome = models.CharField(max_length=20)
+    detail = models.TextField(blank=True)
+    recorded_at = models.DateTimeField()
+    replayed_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.operation} {self.key}: {self.outcome}"
@@ -0,0 +1,156 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Checkout, Hold, Notification
+
+# Outbox for patron notifications. Circulation code only inserts rows, in the
+# same transaction as the change that caused them; scan_reminders and
+# send_notifications do the rest off the request path. dedupe_key is unique,
+# so enqueueing the same event twice is a no-op.
+
+def enqueue(*notifications):
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+
+def hold_ready_notice(hold):
+    return Notification(
+        patron_id=hold.patron_id,
+        kind='hold_ready',
+        dedupe_key=f'hold_ready:{hold.id}',
+        subject=f'"{hold.work.title}" is ready for pickup',
+        body=f'Your hold on "{hold.work.title}" is ready at {hold.pickup_location}. '
+             f'Please pick it up by {hold.pickup_by:%b %d, %Y}.',
+    )
+
+def request_approved_notice(media_request):
+    return Notification(
+        patron_id=media_request.patron_id,
+        kind='request_approved',
+        dedupe_key=f'request_approved:{media_request.id}',
+        subject=f'Your request for "{media_request.title}" was approved',
+        body=f'We will add "{media_request.title}" to the catalog and let you know when it is available.',
+    )
+
+def request_available_notice(media_request, media_item):
+    return Notification(
+        patron_id=media_request.patron_id,
+        kind='request_available',
+        dedupe_key=f'request_available:{media_request.id}',
+        subject=f'"{media_item.title}" is now in the catalog',
+        body=f'"{media_item.title}" by {media_item.author}, which you requested, is now available to borrow.',
+    )
+
+def _due_notice(kind, loan):
+    due = timezone.localtime(loan['due_date'])
+    if kind == 'due_soon':
+        subject = f'"{loan["title"]}" is due {due:%b %d}'
+        body = f'"{loan["title"]}" is due back on {due:%b %d, %Y}. Renew it online if you need more time.'
+    else:
+        subject = f'"{loan["title"]}" is overdue'
+        body = f'"{loan["title"]}" was due on {due:%b %d, %Y}. Overdue items are fined $0.45 per day.'
+    return Notification(
+        patron_id=loan['patron_id'],
+        kind=kind,
+        dedupe_key=f'{kind}:{loan["id"]}:{due:%Y%m%d}',
+        subject=subject,
+        body=body,
+    )
+
+def _enqueue_batches(notices, batch_size):
+    # Inserts a stream of notices batch_size at a time; returns the count.
+    count = 0
+    batch = []
+    for notice in notices:
+        batch.append(notice)
+        if len(batch) >= batch_size:
+            enqueue(*batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        enqueue(*batch)
+        count += len(batch)
+    return count
+
+def scan_reminders(now=None, batch_size=None):
+    # One pass over open loans per kind, inserting in batches; loans that were
+    # already reminded for their current due date are dropped by dedupe_key.
+    now = now or timezone.now()
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    open_loans = Checkout.objects.filter(returned_at__isnull=True)
+    scans = {
+        'due_soon': open_loans.filter(due_date__gt=now, due_date__lte=now + timedelta(days=settings.NOTIFICATION_DUE_SOON_DAYS)),
+        'overdue': open_loans.filter(due_date__lte=now),
+    }
+    created = {}
+    for kind, loans in scans.items():
+        loans = loans.values('id', 'patron_id', 'due_date', title=F('media_item__work__title')).iterator(chunk_size=batch_size)
+        created[kind] = _enqueue_batches((_due_notice(kind, loan) for loan in loans), batch_size)
+
+    # Backstop for holds that became ready without going through check-in.
+    ready = Hold.objects.filter(status='ready').select_related('work').iterator(chunk_size=batch_size)
+    created['hold_ready'] = _enqueue_batches((hold_ready_notice(hold) for hold in ready), batch_size)
+    return created
+
+def _claim_batch(now, batch_size):
+    # Push next_attempt_at past the lease so a second sender skips these rows;
+    # a sender that dies leaves them to be retried once the lease runs out.
+    with transaction.atomic():
+        ids = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        Notification.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+        )
+    return list(Notification.objects.filter(id__in=ids).select_related('patron').order_by('patron_id', 'created_at'))
+
+def send_pending(batch_size=None):
+    # Notices for the same patron are folded into one email, all emails in a
+    # batch share one backend connection, and the send rate is capped at
+    # NOTIFICATION_MAX_PER_MINUTE.
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    now = timezone.now()
+    notices = _claim_batch(now, batch_size)
+    if not notices:
+        return {'sent': 0, 'failed': 0, 'retry': 0}
+
+    by_patron = {}
+    for notice in notices:
+        by_patron.setdefault(notice.patron, []).append(notice)
+
+    stats = {'sent': 0, 'failed': 0, 'retry': 0}
+    interval = 60.0 / settings.NOTIFICATION_MAX_PER_MINUTE
+    connection = get_connection()
+    connection.open()
+    try:
+        for patron, group in by_patron.items():
+            started = time.monotonic()
+            subject = group[0].subject if len(group) == 1 else f'{len(group)} updates from the library'
+            body = '\n\n'.join(notice.body for notice in group)
+            message = EmailMessage(subject, f'Hi {patron.name},\n\n{body}\n', settings.DEFAULT_FROM_EMAIL, [patron.email], connection=connection)
+            ids = [notice.id for notice in group]
+            try:
+                message.send()
+            except Exception as exc:
+                attempts = max(notice.attempts for notice in group) + 1
+                if attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                    Notification.objects.filter(id__in=ids).update(status='failed', attempts=attempts, last_error=str(exc))
+                    stats['failed'] += len(ids)
+                else:
+                    retry_at = timezone.now() + timedelta(minutes=2 ** attempts)
+                    Notification.objects.filter(id__in=ids).update(attempts=attempts, next_attempt_at=retry_at, last_error=str(exc))
+                    stats['retry'] += len(ids)
+            else:
+                Notification.objects.filter(id__in=ids).update(status='sent', sent_at=timezone.now())
+                stats['sent'] += len(ids)
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+    finally:
+        connection.close()
+    return stats
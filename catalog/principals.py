@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+from .models import Patron, Librarian
+
+# The logged-in patron/librarian is looked up on every decorated view, so it
+# is kept in the cache next to the (cache-backed) session. Entries are dropped
+# by the signal handlers in catalog.signals whenever the row changes, and
+# PRINCIPAL_CACHE_VERSION can be bumped to discard all of them at once.
+# Without a shared cache (PRINCIPAL_CACHE_ENABLED off) an invalidation would
+# only reach one process, so every lookup goes to the database instead.
+PRINCIPAL_MODELS = {
+    'patron': Patron,
+    'librarian': Librarian,
+}
+
+def principal_cache_key(kind, pk):
+    return f'principal:{kind}:{pk}'
+
+def _load(kind, pk):
+    try:
+        return PRINCIPAL_MODELS[kind].objects.get(pk=pk)
+    except PRINCIPAL_MODELS[kind].DoesNotExist:
+        return None
+
+async def _aload(kind, pk):
+    try:
+        return await PRINCIPAL_MODELS[kind].objects.aget(pk=pk)
+    except PRINCIPAL_MODELS[kind].DoesNotExist:
+        return None
+
+def get_principal(kind, pk):
+    if not settings.PRINCIPAL_CACHE_ENABLED:
+        return _load(kind, pk)
+    key = principal_cache_key(kind, pk)
+    principal = cache.get(key, version=settings.PRINCIPAL_CACHE_VERSION)
+    metrics.inc('principal_cache_requests_total', result='miss' if principal is None else 'hit')
+    if principal is None:
+        principal = _load(kind, pk)
+        if principal is None:
+            return None
+        cache.set(key, principal, settings.PRINCIPAL_CACHE_TIMEOUT, version=settings.PRINCIPAL_CACHE_VERSION)
+    return principal
+
+async def aget_principal(kind, pk):
+    if not settings.PRINCIPAL_CACHE_ENABLED:
+        return await _aload(kind, pk)
+    key = principal_cache_key(kind, pk)
+    principal = await cache.aget(key, version=settings.PRINCIPAL_CACHE_VERSION)
+    metrics.inc('principal_cache_requests_total', result='miss' if principal is None else 'hit')
+    if principal is None:
+        principal = await _aload(kind, pk)
+        if principal is None:
+            return None
+        await cache.aset(key, principal, settings.PRINCIPAL_CACHE_TIMEOUT, version=settings.PRINCIPAL_CACHE_VERSION)
+    return principal
+
+def cache_principal(kind, principal):
+    if not settings.PRINCIPAL_CACHE_ENABLED:
+        return
+    cache.set(
+        principal_cache_key(kind, principal.pk),
+        principal,
+        settings.PRINCIPAL_CACHE_TIMEOUT,
+        version=settings.PRINCIPAL_CACHE_VERSION,
+    )
+
+def invalidate_principal(kind, pk):
+    cache.delete(principal_cache_key(kind, pk), version=settings.PRINCIPAL_CACHE_VERSION)
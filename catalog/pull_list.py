@@ -0,0 +1,138 @@
+import csv
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Hold, MediaItem, Patron, Work
+
+# Daily hold pull list. Pending holds are title-level, so any available copy
+# of the work can fill one. The list is a single query: pending holds are
+# numbered per work oldest first, available copies are numbered per work by
+# location, and hold n is paired with copy n. Staff pull the copies sorted by
+# location and mark the ones they took as in transit to the pickup location;
+# checking a copy in there makes its hold ready.
+
+COLUMNS = [
+    'location', 'barcode', 'title', 'author', 'media_type',
+    'patron', 'card_number', 'placed_at', 'pickup_location', 'hold_id', 'item_id',
+]
+
+def _sql(connection, location):
+    # Holds and copies are numbered in one UNION ALL and paired by grouping
+    # on (work, number), so the pairing is a sort rather than a join between
+    # two derived tables, which some planners can only run as a nested loop.
+    quote = connection.ops.quote_name
+    hold, item, patron, work = (quote(model._meta.db_table) for model in (Hold, MediaItem, Patron, Work))
+    where = 'WHERE m.location = %s' if location else ''
+    return f'''
+        WITH queue AS (
+            SELECT h.work_id, h.id AS hold_id, NULL AS item_id,
+                   ROW_NUMBER() OVER (PARTITION BY h.work_id ORDER BY h.placed_at, h.id) AS n
+            FROM {hold} h
+            JOIN {patron} p ON p.id = h.patron_id AND p.deleted_at IS NULL
+            WHERE h.status = 'pending'
+            UNION ALL
+            SELECT m.work_id, NULL, m.id,
+                   ROW_NUMBER() OVER (PARTITION BY m.work_id ORDER BY m.location, m.id)
+            FROM {item} m
+            WHERE m.status = 'available' AND m.deleted_at IS NULL
+              AND m.work_id IN (SELECT work_id FROM {hold} WHERE status = 'pending')
+        ), pairs AS (
+            SELECT MAX(hold_id) AS hold_id, MAX(item_id) AS item_id
+            FROM queue
+            GROUP BY work_id, n
+            HAVING COUNT(hold_id) > 0 AND COUNT(item_id) > 0
+        )
+        SELECT m.location, m.barcode, w.title, w.author, w.media_type,
+               p.name, p.card_number, h.placed_at, h.pickup_location, h.id, m.id
+        FROM pairs
+        JOIN {hold} h ON h.id = pairs.hold_id
+        JOIN {item} m ON m.id = pairs.item_id
+        JOIN {work} w ON w.id = h.work_id AND w.deleted_at IS NULL
+        JOIN {patron} p ON p.id = h.patron_id
+        {where}
+        ORDER BY m.location, w.title, m.barcode
+    '''
+
+def rows(location=None):
+    # Streams the pull list as dicts keyed by COLUMNS, for every location or
+    # just one. Pairing is always done across all locations, so a branch's
+    # list is its part of the full list.
+    connection = connections[router.db_for_read(Hold)]
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(connection, location), [location] if location else [])
+        while True:
+            chunk = cursor.fetchmany(settings.PULL_LIST_BATCH_SIZE)
+            if not chunk:
+                break
+            for row in chunk:
+                row = dict(zip(COLUMNS, row))
+                # SQLite and MySQL hand raw SQL timestamps back naive.
+                if isinstance(row['placed_at'], str) or timezone.is_naive(row['placed_at']):
+                    row['placed_at'] = connection.ops.convert_datetimefield_value(row['placed_at'], None, connection)
+                yield row
+
+class _Echo:
+    def write(self, value):
+        return value
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([row[column] for column in COLUMNS])
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def mark_in_transit(pairs, pickup_location=''):
+    # Marks the pulled (hold id, copy id) pairs in transit in one transaction,
+    # sending each to pickup_location when given, otherwise to the pickup
+    # location the patron chose. Pairs whose hold is no longer pending or
+    # whose copy is no longer available on the shelf are skipped. Returns
+    # the number of holds marked.
+    now = timezone.now()
+    batch_size = settings.PULL_LIST_BATCH_SIZE
+    with transaction.atomic():
+        holds = {}
+        copies = {}
+        for chunk in _chunks(pairs, batch_size):
+            holds.update((hold.id, hold) for hold in Hold.objects.select_for_update(of=('self',)).filter(
+                id__in=[hold_id for hold_id, _ in chunk], status='pending', patron__deleted_at__isnull=True
+            ))
+            copies.update(MediaItem.objects.select_for_update().filter(
+                id__in=[item_id for _, item_id in chunk], status='available'
+            ).values_list('id', 'work_id'))
+
+        marked = []
+        pulled = set()
+        for hold_id, item_id in pairs:
+            hold = holds.pop(hold_id, None)
+            if hold is None or item_id in pulled or copies.get(item_id) != hold.work_id:
+                continue
+            pulled.add(item_id)
+            hold.status = 'in_transit'
+            hold.media_item_id = item_id
+            if pickup_location:
+                hold.pickup_location = pickup_location
+            hold.updated_at = now
+            marked.append(hold)
+
+        Hold.objects.bulk_update(marked, ['status', 'media_item', 'pickup_location', 'updated_at'], batch_size=batch_size)
+        for chunk in _chunks(sorted(pulled), batch_size):
+            MediaItem.objects.filter(id__in=chunk).update(status='in_transit', updated_at=now)
+
+        # The holds still pending behind each marked one move up a place.
+        # Highest positions first, so each pass compares against positions
+        # the earlier passes have not changed yet.
+        works_at = defaultdict(list)
+        for hold in marked:
+            works_at[hold.queue_position].append(hold.work_id)
+        for position in sorted(works_at, reverse=True):
+            for chunk in _chunks(works_at[position], batch_size):
+                Hold.objects.filter(work_id__in=chunk, status='pending', queue_position__gt=position).update(
+                    queue_position=F('queue_position') - 1, updated_at=now
+                )
+    return len(marked)
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .circulation import fill_hold
+from .models import Patron, Hold, MediaRequest, Notification, CoBorrowCount, WorkRecommendation, PurgeJob
+
+# Background cleanup after a soft delete. The delete views only set the
+# tombstone and queue a PurgeJob; this removes or closes the rows that
+# depended on the patron or work, PURGE_BATCH_SIZE rows per transaction.
+# Checkouts, fines and the activity log are kept as circulation history.
+# Every step works off "what is left", so an interrupted job just resumes.
+
+ACTIVE_HOLD_STATUSES = ['pending', 'ready', 'in_transit']
+
+def _cancel_holds(queryset, batch_size):
+    holds = list(queryset.select_related('media_item').order_by('pk')[:batch_size])
+    now = timezone.now()
+    Hold.objects.filter(pk__in=[hold.pk for hold in holds]).update(status='cancelled', updated_at=now)
+    # Move the rest of each queue up, back to front so a batch with two
+    # holds on one work shifts the holds behind both of them twice.
+    for hold in sorted(holds, key=lambda hold: hold.queue_position, reverse=True):
+        if hold.status == 'pending':
+            Hold.objects.filter(
+                work_id=hold.work_id, status='pending', queue_position__gt=hold.queue_position
+            ).update(queue_position=F('queue_position') - 1, updated_at=now)
+    for hold in holds:
+        # Pass a copy that was set aside for this hold on to the next one.
+        if hold.status != 'pending' and hold.media_item and hold.media_item.status == 'on_hold':
+            fill_hold(hold.media_item)
+    return len(holds)
+
+def _delete(queryset, batch_size):
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+    queryset.model.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+def _anonymize_patron(patron_id):
+    Patron.all_objects.filter(pk=patron_id).update(name='Deleted patron', pin_hash='!', updated_at=timezone.now())
+
+def _steps(job):
+    # (step name, remaining rows, batch action)
+    if job.kind == 'patron':
+        return [
+            ('holds', Hold.objects.filter(patron_id=job.object_id, status__in=ACTIVE_HOLD_STATUSES), _cancel_holds),
+            ('notifications', Notification.objects.filter(patron_id=job.object_id), _delete),
+            ('requests', MediaRequest.objects.filter(patron_id=job.object_id), _delete),
+        ]
+    return [
+        ('holds', Hold.objects.filter(work_id=job.object_id, status__in=ACTIVE_HOLD_STATUSES), _cancel_holds),
+        ('recommendations', WorkRecommendation.objects.filter(Q(work_id=job.object_id) | Q(recommended_id=job.object_id)), _delete),
+        ('coborrow', CoBorrowCount.objects.filter(Q(work_id=job.object_id) | Q(other_id=job.object_id)), _delete),
+    ]
+
+def run(job, batch_size=None):
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+    for step, queryset, action in _steps(job):
+        job.step = step
+        while True:
+            with transaction.atomic():
+                done = action(queryset, batch_size)
+            job.rows_done += done
+            job.save(update_fields=['step', 'rows_done', 'updated_at'])
+            if done < batch_size:
+                break
+    if job.kind == 'patron':
+        _anonymize_patron(job.object_id)
+    job.status = 'done'
+    job.step = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'step', 'finished_at', 'updated_at'])
+    return job.rows_done
+
+def run_pending(batch_size=None, limit=None):
+    jobs = PurgeJob.objects.filter(status__in=['pending', 'running']).order_by('created_at')
+    if limit:
+        jobs = jobs[:limit]
+    return [(job, run(job, batch_size)) for job in jobs]
@@ -0,0 +1,150 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import combinations
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Subquery
+from django.db.models.functions import Coalesce
+from .models import Checkout, LoanHistory, CoBorrowCount, WorkRecommendation, JobCheckpoint
+
+# "Patrons also borrowed": a sparse work-work co-occurrence matrix kept in
+# CoBorrowCount (one row per ordered pair of works borrowed by the same
+# patron) and the top RECOMMENDATION_TOP_K neighbours per work materialised
+# in WorkRecommendation, so serving is one indexed lookup. Copies of the
+# same work count as one. Loans are read from Checkout and LoanHistory
+# together; archived loans keep their checkout id, so borrow order holds.
+
+CHECKPOINT = 'recommendations'
+
+def _pairs(works):
+    # Patrons with huge histories would add quadratically many pairs while
+    # saying little about any one work, so only their latest works count.
+    works = works[-settings.RECOMMENDATION_MAX_ITEMS_PER_PATRON:]
+    for a, b in combinations(works, 2):
+        yield a, b
+        yield b, a
+
+def _loans(last_id, after_id=0, patrons=None):
+    # (patron_id, checkout id, work_id) of live and archived loans. UNION
+    # also drops a loan read twice while archive_loans moves it.
+    live = Checkout.objects.filter(id__gt=after_id, id__lte=last_id)
+    archived = LoanHistory.objects.filter(loan_id__gt=after_id, loan_id__lte=last_id, patron__isnull=False)
+    if patrons is not None:
+        live = live.filter(patron_id__in=patrons)
+        archived = archived.filter(patron_id__in=patrons)
+    return live.values_list('patron_id', 'id', 'media_item__work_id').union(
+        archived.values_list('patron_id', 'loan_id', 'work_id')
+    )
+
+def _last_loan_id():
+    return max(
+        Checkout.objects.aggregate(last=Max('id'))['last'] or 0,
+        LoanHistory.objects.aggregate(last=Max('loan_id'))['last'] or 0,
+    )
+
+def _borrow_histories(loans):
+    # Yields (patron_id, {work_id: id of its first checkout}) in borrow order.
+    patron_id, works = None, {}
+    rows = loans.order_by('patron_id', 'id')
+    for pid, checkout_id, work_id in rows.iterator(chunk_size=settings.RECOMMENDATION_BATCH_SIZE):
+        if pid != patron_id:
+            if works:
+                yield patron_id, works
+            patron_id, works = pid, {}
+        works.setdefault(work_id, checkout_id)
+    if works:
+        yield patron_id, works
+
+def _store_top_k(work_ids):
+    # Recomputes WorkRecommendation rows for the given works from the matrix.
+    work_ids = list(work_ids)
+    batch = settings.RECOMMENDATION_BATCH_SIZE
+    for i in range(0, len(work_ids), batch):
+        chunk = work_ids[i:i + batch]
+        neighbours = defaultdict(list)
+        for work, other, count in CoBorrowCount.objects.filter(work__in=chunk).values_list('work_id', 'other_id', 'count').iterator(chunk_size=batch):
+            neighbours[work].append((count, -other))
+        rows = []
+        for work, candidates in neighbours.items():
+            top = heapq.nlargest(settings.RECOMMENDATION_TOP_K, candidates)
+            rows += [
+                WorkRecommendation(work_id=work, recommended_id=-neg_other, score=count, rank=rank)
+                for rank, (count, neg_other) in enumerate(top, 1)
+            ]
+        with transaction.atomic():
+            WorkRecommendation.objects.filter(work__in=chunk).delete()
+            WorkRecommendation.objects.bulk_create(rows, batch_size=batch)
+
+def rebuild():
+    # Full batch build from the whole checkout history.
+    last_id = _last_loan_id()
+    counts = Counter()
+    for _, works in _borrow_histories(_loans(last_id)):
+        counts.update(_pairs(list(works)))
+    
+    # One transaction, so readers keep the old recommendations until the
+    # new ones are all in place instead of seeing none in between.
+    with transaction.atomic():
+        CoBorrowCount.objects.all().delete()
+        CoBorrowCount.objects.bulk_create(
+            (CoBorrowCount(work_id=a, other_id=b, count=n) for (a, b), n in counts.items()),
+            batch_size=settings.RECOMMENDATION_BATCH_SIZE,
+        )
+        JobCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'last_id': last_id})
+        WorkRecommendation.objects.all().delete()
+        _store_top_k({a for a, _ in counts})
+    return len(counts)
+
+def update():
+    # Folds checkouts made since the last run into the matrix and refreshes
+    # the neighbours of every work they touched.
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    last_id = _last_loan_id()
+    if last_id <= checkpoint.last_id:
+        return 0
+    
+    patrons = {row[0] for row in _loans(last_id, after_id=checkpoint.last_id)}
+    deltas = Counter()
+    for _, works in _borrow_histories(_loans(last_id, patrons=patrons)):
+        # Only pairs with at least one work new to this patron are new.
+        for a, b in _pairs(list(works)):
+            if max(works[a], works[b]) > checkpoint.last_id:
+                deltas[(a, b)] += 1
+    
+    with transaction.atomic():
+        touched = {a for a, _ in deltas}
+        existing = {
+            (row.work_id, row.other_id): row
+            for row in CoBorrowCount.objects.filter(work__in=touched).select_for_update()
+        }
+        to_update, to_create = [], []
+        for (a, b), n in deltas.items():
+            row = existing.get((a, b))
+            if row:
+                row.count = F('count') + n
+                to_update.append(row)
+            else:
+                to_create.append(CoBorrowCount(work_id=a, other_id=b, count=n))
+        CoBorrowCount.objects.bulk_update(to_update, ['count'], batch_size=settings.RECOMMENDATION_BATCH_SIZE)
+        CoBorrowCount.objects.bulk_create(to_create, batch_size=settings.RECOMMENDATION_BATCH_SIZE)
+        checkpoint.last_id = last_id
+        checkpoint.save()
+    _store_top_k(touched)
+    return len(deltas)
+
+def for_work(work_id):
+    return WorkRecommendation.objects.filter(work_id=work_id, recommended__deleted_at__isnull=True).select_related('recommended')[:settings.RECOMMENDATION_TOP_K]
+
+def for_patron(patron):
+    # Neighbours of the patron's latest checkout, minus anything they have
+    # already borrowed, in one query. The archive is only consulted for the
+    # latest loan when the patron has nothing left in Checkout.
+    latest = Checkout.objects.filter(patron=patron).order_by('-checked_out_at').values('media_item__work_id')[:1]
+    latest_archived = LoanHistory.objects.filter(patron=patron).order_by('-checked_out_at').values('work_id')[:1]
+    borrowed = Checkout.objects.filter(patron=patron).values('media_item__work_id')
+    archived = LoanHistory.objects.filter(patron=patron).values('work_id')
+    return WorkRecommendation.objects.filter(
+        work_id=Coalesce(Subquery(latest), Subquery(latest_archived)), recommended__deleted_at__isnull=True
+    ).exclude(recommended_id__in=borrowed).exclude(recommended_id__in=archived).select_related(
+        'work', 'recommended'
+    )[:settings.RECOMMENDATION_TOP_K]
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from .models import MediaItem, Checkout, Hold, Fine, ActivityLog
+
+# Nightly auto-renewal. Loans due within AUTO_RENEW_DAYS are renewed in bulk
+# when Checkout.can_renew() would allow it, nobody is waiting for the title
+# and the patron has no unpaid fines. The new due date only depends on the
+# loan period, so each period is one UPDATE per batch of ids instead of a
+# renew() per loan.
+
+def _period_groups():
+    # (loan period in days, media types filter, media types exclude)
+    periods = {}
+    for media_type, days in MediaItem.LOAN_PERIOD_DAYS.items():
+        periods.setdefault(days, []).append(media_type)
+    groups = [(days, types, []) for days, types in sorted(periods.items())]
+    groups.append((MediaItem.DEFAULT_LOAN_PERIOD_DAYS, None, list(MediaItem.LOAN_PERIOD_DAYS)))
+    return groups
+
+def eligible_loans(now=None, days=None):
+    now = now or timezone.now()
+    days = settings.AUTO_RENEW_DAYS if days is None else days
+    waiting = Hold.objects.filter(work_id=OuterRef('media_item__work_id'), status='pending')
+    unpaid = Fine.objects.filter(patron_id=OuterRef('patron_id'), paid=False)
+    return Checkout.objects.filter(
+        returned_at__isnull=True,
+        renewals__lt=2,
+        due_date__gte=now,
+        due_date__lte=now + timedelta(days=days),
+        patron__status='active',
+    ).exclude(Exists(waiting)).exclude(Exists(unpaid))
+
+def _renew_batch(loans, due_date, now):
+    with transaction.atomic():
+        rows = list(loans.select_for_update(of=('self',)).values_list(
+            'id', 'patron_id', 'media_item_id', 'media_item__work__title'
+        ))
+        if not rows:
+            return []
+        Checkout.objects.filter(id__in=[row[0] for row in rows]).update(
+            due_date=due_date, renewals=F('renewals') + 1, updated_at=now
+        )
+        ActivityLog.objects.bulk_create([
+            ActivityLog(
+                action='renewal',
+                patron_id=patron_id,
+                media_item_id=media_item_id,
+                description=f'Automatically renewed "{title}"',
+            ) for _, patron_id, media_item_id, title in rows
+        ], batch_size=settings.AUTO_RENEW_BATCH_SIZE)
+    return rows
+
+def auto_renew(now=None, days=None, batch_size=None):
+    # Returns {loan period in days: loans renewed}.
+    now = now or timezone.now()
+    batch_size = batch_size or settings.AUTO_RENEW_BATCH_SIZE
+    eligible = eligible_loans(now, days)
+    renewed = {}
+    for period, types, excluded in _period_groups():
+        loans = eligible.filter(media_item__work__media_type__in=types) if types else eligible.exclude(media_item__work__media_type__in=excluded)
+        due_date = now + timedelta(days=period)
+        last_id = 0
+        count = 0
+        while True:
+            # Ids only go up, so no loan is renewed twice in one run even if
+            # its new due date still falls inside the window.
+            batch = loans.filter(id__gt=last_id).order_by('id')[:batch_size]
+            rows = _renew_batch(batch, due_date, now)
+            if not rows:
+                break
+            count += len(rows)
+            last_id = rows[-1][0]
+        renewed[period] = renewed.get(period, 0) + count
+    return renewed
@@ -0,0 +1,123 @@
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+# Read-replica routing. Views wrapped in use_replica send their catalog reads
+# to one of settings.DATABASE_REPLICAS; everything else, every write and any
+# read inside a transaction stays on the primary. A browser that has just
+# written is pinned to the primary for REPLICA_PIN_SECONDS (via a cookie set
+# by PrimaryPinMiddleware) so it always reads its own writes.
+
+PIN_COOKIE = 'primary_pin'
+
+class _RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+class _ReplicaChoice:
+    # One replica per request, so a page never mixes two replicas' lag.
+    alias = None
+
+_request_state = ContextVar('request_state', default=None)
+_replica_reads = ContextVar('replica_reads', default=None)
+_down_until = {}
+
+def _choose_replica():
+    now = time.monotonic()
+    aliases = [alias for alias in settings.DATABASE_REPLICAS if _down_until.get(alias, 0) <= now]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+            return alias
+        except DatabaseError:
+            # Skip an unreachable replica for a while instead of paying the
+            # connect timeout on every request.
+            _down_until[alias] = now + settings.REPLICA_RETRY_SECONDS
+    return 'default'
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        choice = _replica_reads.get()
+        if choice is None or model._meta.app_label != 'catalog':
+            return None
+        state = _request_state.get()
+        if state and (state.pinned or state.wrote):
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'
+        if choice.alias is None:
+            choice.alias = _choose_replica()
+        return choice.alias
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state and model._meta.app_label == 'catalog':
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema and rows from the primary.
+        return db == 'default'
+
+def use_replica(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica_reads.set(_ReplicaChoice())
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_reads.set(_ReplicaChoice())
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+class PrimaryPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._pin(state, response)
+
+    def _pin(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .metrics import count_queries
+from .models import Patron, Librarian
+from .principals import invalidate_principal
+from .slowlog import record_slow_queries
+
+@receiver([post_save, post_delete], sender=Patron)
+def invalidate_cached_patron(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_principal('patron', pk))
+
+@receiver([post_save, post_delete], sender=Librarian)
+def invalidate_cached_librarian(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_principal('librarian', pk))
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # connection_created fires on every reconnect of the same wrapper (each
+    # request with CONN_MAX_AGE=0), so install each hook only once.
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+    if record_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_queries)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from .metrics import current_view
+
+# Slow-query log. Queries slower than SLOW_QUERY_MS are grouped by a
+# normalized SQL fingerprint and kept per process, capped at SLOW_QUERY_TOP_N
+# fingerprints (the ones with the least total time are dropped first). A
+# SLOW_QUERY_EXPLAIN_RATE share of them also get their query plan captured.
+
+_lock = threading.Lock()
+_entries = {}
+_explaining = ContextVar('explaining', default=False)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+def fingerprint(sql):
+    normalized = _STRING.sub('?', sql)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    # IN (?, ?, ?) with any number of values is the same query.
+    normalized = _IN_LIST.sub('(...)', normalized)
+    normalized = _SPACE.sub(' ', normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+def _caller():
+    # Innermost frame in project code, skipping Django and this module.
+    root = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename
+        if filename.startswith(root) and 'site-packages' not in filename and os.path.basename(filename) not in ('slowlog.py', 'metrics.py'):
+            return f'{os.path.relpath(filename, root)}:{frame.lineno} in {frame.name}'
+    return None
+
+def _explain(connection, sql, params):
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor in ('postgresql', 'mysql'):
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        _explaining.reset(token)
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(' | '.join(str(col) for col in row) for row in rows)
+
+def _params_sample(params):
+    text = repr(params)
+    return text if len(text) <= 300 else text[:297] + '...'
+
+def record_slow_queries(execute, sql, params, many, context):
+    # Installed on every connection by catalog.signals.
+    if _explaining.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= settings.SLOW_QUERY_MS:
+            _record(context['connection'], sql, params, many, elapsed_ms)
+
+def _record(connection, sql, params, many, elapsed_ms):
+    key, normalized = fingerprint(sql)
+    plan = None
+    # Plans are only taken outside transactions: a failing EXPLAIN would
+    # otherwise abort the caller's transaction on PostgreSQL.
+    if (not many and normalized.upper().startswith(('SELECT', 'WITH'))
+            and not connection.in_atomic_block
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE):
+        plan = _explain(connection, sql, params)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            if len(_entries) >= settings.SLOW_QUERY_TOP_N:
+                victim = min(_entries, key=lambda k: _entries[k]['total_ms'])
+                if _entries[victim]['total_ms'] > elapsed_ms:
+                    return
+                del _entries[victim]
+            entry = _entries[key] = {
+                'fingerprint': key,
+                'sql': normalized,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'plan': None,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['last_seen'] = timezone.now()
+        if elapsed_ms >= entry['max_ms']:
+            # Keep the context of the slowest run.
+            entry['max_ms'] = elapsed_ms
+            entry['params'] = _params_sample(params)
+            entry['view'] = current_view()
+            entry['caller'] = _caller()
+        if plan:
+            entry['plan'] = plan
+
+def slow_queries():
+    with _lock:
+        entries = [dict(entry) for entry in _entries.values()]
+    for entry in entries:
+        entry['avg_ms'] = entry['total_ms'] / entry['count']
+    return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)
+
+def clear():
+    with _lock:
+        _entries.clear()
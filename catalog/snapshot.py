@@ -0,0 +1,195 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from django.conf import settings
+from . import metrics
+from .models import Work
+
+# Published catalog snapshot. publish_catalog writes every live work with its
+# copy counts and a full-text index into a standalone SQLite file, then swaps
+# it into place with os.replace. The home page and patron search read that
+# file (read-only, memory-mapped) instead of the primary database. Each
+# worker thread reopens the file when a new one is published, and any
+# snapshot older than CATALOG_SNAPSHOT_MAX_AGE, missing or unreadable makes
+# the callers fall back to the ORM.
+
+_SCHEMA = '''
+CREATE TABLE meta (published_at REAL NOT NULL, works INTEGER NOT NULL);
+CREATE TABLE works (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    isbn TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    publisher TEXT NOT NULL,
+    description TEXT NOT NULL,
+    copies_count INTEGER NOT NULL,
+    available_copies INTEGER NOT NULL
+);
+CREATE INDEX works_title ON works (title, id);
+CREATE VIRTUAL TABLE works_fts USING fts5(
+    title, author, publisher, content='works', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+'''
+
+COLUMNS = ('id', 'title', 'author', 'media_type', 'isbn', 'genre', 'publisher', 'description', 'copies_count', 'available_copies')
+
+# search_by -> FTS columns searched
+FTS_COLUMNS = {
+    'title': 'title',
+    'author': 'author',
+    'publisher': 'publisher',
+}
+
+def publish(path=None):
+    # Builds the snapshot next to path and swaps it in. Returns the number of
+    # works written.
+    path = str(path or settings.CATALOG_SNAPSHOT_PATH)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    rows = Work.objects.with_availability().values_list(*COLUMNS)
+    count = 0
+    with closing(sqlite3.connect(tmp_path)) as conn:
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.executescript(_SCHEMA)
+        chunk = []
+        for row in rows.iterator(chunk_size=settings.CATALOG_SNAPSHOT_CHUNK_SIZE):
+            chunk.append(tuple('' if value is None else value for value in row))
+            if len(chunk) >= settings.CATALOG_SNAPSHOT_CHUNK_SIZE:
+                conn.executemany(f'INSERT INTO works VALUES ({", ".join("?" * len(COLUMNS))})', chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            conn.executemany(f'INSERT INTO works VALUES ({", ".join("?" * len(COLUMNS))})', chunk)
+            count += len(chunk)
+        conn.execute("INSERT INTO works_fts (works_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO works_fts (works_fts) VALUES ('optimize')")
+        conn.execute('INSERT INTO meta VALUES (?, ?)', (time.time(), count))
+        conn.commit()
+        conn.execute('ANALYZE')
+    # The file is complete on disk before it becomes visible under path.
+    fd = os.open(tmp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+    return count
+
+class _Reader(threading.local):
+    conn = None
+    file_key = None
+    published_at = 0
+    checked_at = 0
+
+_reader = _Reader()
+
+def _close():
+    if _reader.conn is not None:
+        _reader.conn.close()
+    _reader.conn = None
+    _reader.file_key = None
+
+def _connection():
+    # This thread's connection to the current snapshot, or None.
+    path = str(settings.CATALOG_SNAPSHOT_PATH)
+    now = time.monotonic()
+    if now - _reader.checked_at >= settings.CATALOG_SNAPSHOT_CHECK_SECONDS:
+        _reader.checked_at = now
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _close()
+            metrics.inc('catalog_snapshot_reads_total', result='missing')
+            return None
+        if (stat.st_ino, stat.st_mtime_ns) != _reader.file_key:
+            _close()
+            # immutable: the file is replaced, never written in place, so
+            # SQLite can skip locking and change detection entirely.
+            conn = sqlite3.connect(f'file:{path}?mode=ro&immutable=1', uri=True)
+            conn.execute(f'PRAGMA mmap_size={settings.CATALOG_SNAPSHOT_MMAP_SIZE}')
+            _reader.published_at = conn.execute('SELECT published_at FROM meta').fetchone()[0]
+            _reader.conn = conn
+            _reader.file_key = (stat.st_ino, stat.st_mtime_ns)
+    if _reader.conn is None:
+        metrics.inc('catalog_snapshot_reads_total', result='missing')
+        return None
+    if time.time() - _reader.published_at > settings.CATALOG_SNAPSHOT_MAX_AGE:
+        metrics.inc('catalog_snapshot_reads_total', result='stale')
+        return None
+    return _reader.conn
+
+def _works(rows):
+    # Unsaved Work instances, so templates use them like ORM results.
+    works = []
+    for row in rows:
+        values = dict(zip(COLUMNS, row))
+        copies_count = values.pop('copies_count')
+        available_copies = values.pop('available_copies')
+        work = Work(**values)
+        work.copies_count = copies_count
+        work.available_copies = available_copies
+        works.append(work)
+    return works
+
+def _match(query, columns):
+    # Every word of the query as a prefix, within the given columns.
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return '{' + ' '.join(columns) + '} : ' + ' '.join(f'"{word}"*' for word in words)
+
+def _read(build):
+    try:
+        conn = _connection()
+        if conn is None:
+            return None
+        result = build(conn)
+    except sqlite3.Error:
+        _close()
+        metrics.inc('catalog_snapshot_reads_total', result='error')
+        return None
+    metrics.inc('catalog_snapshot_reads_total', result='hit')
+    return result
+
+def latest(limit):
+    # The first `limit` works by id, or None to fall back to the database.
+    def build(conn):
+        return _works(conn.execute(f'SELECT {", ".join(COLUMNS)} FROM works ORDER BY id LIMIT ?', (limit,)))
+    return _read(build)
+
+def search(query='', search_by='title', media_type='', genre='', limit=24):
+    # (works, total) like patron_search, or None to fall back to the
+    # database. Title, author and publisher searches match word prefixes
+    # through the full-text index; ISBN is a substring match.
+    conditions = []
+    params = []
+    if query:
+        if search_by == 'isbn':
+            conditions.append('isbn LIKE ?')
+            params.append(f'%{query}%')
+        else:
+            match = _match(query, [FTS_COLUMNS[search_by]] if search_by in FTS_COLUMNS else ['title', 'author'])
+            if match is None:
+                return [], 0
+            conditions.append('id IN (SELECT rowid FROM works_fts WHERE works_fts MATCH ?)')
+            params.append(match)
+    if media_type:
+        conditions.append('media_type = ?')
+        params.append(media_type)
+    if genre:
+        conditions.append('genre LIKE ?')
+        params.append(f'%{genre}%')
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+    def build(conn):
+        total = conn.execute(f'SELECT COUNT(*) FROM works {where}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT {", ".join(COLUMNS)} FROM works {where} ORDER BY title, id LIMIT ?', params + [limit])
+        return _works(rows), total
+    return _read(build)
@@ -0,0 +1,32 @@
+from datetime import timedelta
+from django.utils import timezone
+from ..models import Patron, Librarian, Work, MediaItem, Checkout
+
+# PIN and password hashes are set directly: a real PBKDF2 hash per fixture
+# would make the suite take minutes.
+
+def make_patron(n):
+    return Patron.objects.create(name=f'Patron {n}', email=f'patron{n}@example.com', card_number=f'LC-9{n:05d}', pin_hash='-')
+
+def make_work(title='The Hobbit', author='J.R.R. Tolkien'):
+    return Work.objects.create(title=title, author=author, media_type='book')
+
+def make_copy(work, n, status='available', location='Main Branch'):
+    return MediaItem.objects.create(work=work, barcode=f'BC-T{work.id}-{n}', status=status, location=location)
+
+def make_loan(patron, media_item, **fields):
+    checkout = Checkout.objects.create(patron=patron, media_item=media_item, due_date=timezone.now() + timedelta(days=21))
+    if fields:
+        Checkout.objects.filter(pk=checkout.pk).update(**fields)
+        checkout.refresh_from_db()
+    media_item.status = 'checked_out'
+    media_item.save()
+    return checkout
+
+def make_librarian(username='desk'):
+    return Librarian.objects.create(username=username, email=f'{username}@example.com', password_hash='-')
+
+def sign_in(client, kind, principal):
+    session = client.session
+    session[f'{kind}_id'] = principal.pk
+    session.save()
@@ -0,0 +1,37 @@
+from django.test import TestCase
+from ..allocators import BlockAllocator, luhn_check_digit, luhn_is_valid
+from ..models import IdentifierSequence
+
+class AllocatorTests(TestCase):
+    def test_luhn_check_digit(self):
+        self.assertEqual(luhn_check_digit('7992739871'), '3')
+        self.assertTrue(luhn_is_valid('79927398713'))
+        self.assertFalse(luhn_is_valid('79927398710'))
+
+    def test_identifiers_are_unique_and_valid(self):
+        allocator = BlockAllocator('test', 'T-', 6, start=1)
+        # A second process serving the same sequence.
+        other = BlockAllocator('test', 'T-', 6, start=1)
+        issued = allocator.allocate_many(250) + other.allocate_many(250) + [allocator.allocate(), other.allocate()]
+        self.assertEqual(len(set(issued)), len(issued))
+        self.assertTrue(all(allocator.is_valid(value) for value in issued))
+
+    def test_is_valid(self):
+        allocator = BlockAllocator('test', 'T-', 6, start=1)
+        value = allocator.format(42)
+        self.assertEqual(value, 'T-000042' + luhn_check_digit('000042'))
+        self.assertTrue(allocator.is_valid(value))
+        # Legacy identifiers have exactly width digits and no check digit.
+        self.assertTrue(allocator.is_valid('T-123456'))
+        wrong = value[:-1] + str((int(value[-1]) + 1) % 10)
+        self.assertFalse(allocator.is_valid(wrong))
+        self.assertFalse(allocator.is_valid('X-000042' + value[-1]))
+        self.assertFalse(allocator.is_valid('T-12345'))
+        self.assertFalse(allocator.is_valid(''))
+
+    def test_reservation_inside_a_transaction_takes_the_exact_count(self):
+        # Tests run inside a transaction, so nothing is kept in memory.
+        allocator = BlockAllocator('test', 'T-', 6, start=1)
+        allocator.allocate_many(3)
+        self.assertEqual(IdentifierSequence.objects.get(name='test').next_value, 4)
+        self.assertEqual(allocator.allocate(), allocator.format(4))
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .. import analytics
+from ..models import Checkout
+from .helpers import make_copy, make_librarian, make_loan, make_patron, make_work, sign_in
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        analytics_settings = override_settings(ANALYTICS_DIR=self.directory, ANALYTICS_SETTLE_SECONDS=0)
+        analytics_settings.enable()
+        self.addCleanup(analytics_settings.disable)
+        self.patron = make_patron(1)
+        self.work = make_work()
+        now = timezone.now()
+        # Five days, on time; twelve days, two days late; still out and overdue.
+        self.loan(1, now - timedelta(days=20), now - timedelta(days=10), now - timedelta(days=15))
+        self.loan(2, now - timedelta(days=20), now - timedelta(days=10), now - timedelta(days=8))
+        make_loan(self.patron, make_copy(self.work, 3), checked_out_at=now - timedelta(days=30), due_date=now - timedelta(days=9))
+
+    def loan(self, n, checked_out_at, due_date, returned_at):
+        return make_loan(self.patron, make_copy(self.work, n), checked_out_at=checked_out_at, due_date=due_date, returned_at=returned_at)
+
+    def test_refresh_computes_and_stores_the_reports(self):
+        self.assertIsNone(analytics.daily_metrics())
+        metrics = analytics.refresh()
+        self.assertEqual(metrics['total_loans'], 3)
+        self.assertAlmostEqual(metrics['overdue_rate'], 2 / 3)
+        self.assertAlmostEqual(metrics['median_loan_days'], 8.5)
+        self.assertEqual(metrics['turnover'][0]['loans'], 3)
+        self.assertEqual(analytics.daily_metrics()['total_loans'], 3)
+
+    def test_reports_page_only_reads_the_stored_result(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        response = self.client.get(reverse('librarian_reports'))
+        self.assertContains(response, 'Reports have not been generated yet')
+        analytics.refresh()
+        make_loan(self.patron, make_copy(self.work, 4))
+        response = self.client.get(reverse('librarian_reports'))
+        self.assertEqual(response.context['metrics']['total_loans'], 3)
+
+    def test_closed_loans_are_appended_once(self):
+        self.assertEqual(len(analytics.closed_loan_columns()['item']), 2)
+        self.assertEqual(len(analytics.closed_loan_columns()['item']), 2)
+        # A return replayed late carries a desk time before the watermark.
+        late = Checkout.objects.get(returned_at__isnull=True)
+        Checkout.objects.filter(pk=late.pk).update(returned_at=timezone.now() - timedelta(days=30), updated_at=timezone.now())
+        columns = analytics.closed_loan_columns()
+        self.assertEqual(sorted(columns['item']), sorted(float(c.media_item_id) for c in Checkout.objects.all()))
+        self.assertEqual({len(column) for column in columns.values()}, {3})
+
+    def test_files_are_replaced_whole(self):
+        analytics.refresh()
+        self.assertEqual(sorted(os.listdir(self.directory)), ['closed_loans.npz', 'metrics.pickle'])
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from ..models import Hold
+from .helpers import make_copy, make_loan, make_patron, make_work, sign_in
+
+class ItemsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.work = make_work()
+        self.copies = [make_copy(self.work, n) for n in range(3)]
+
+    def get(self, url='items_api', etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse(url), params, **headers)
+
+    def test_unchanged_page_is_304(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        not_modified = self.get(etag=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_changed_copy_or_work_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.copies[1].status = 'lost'
+        self.copies[1].save()
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.work.title = 'The Hobbit, or There and Back Again'
+        self.work.save()
+        self.assertEqual(self.get(etag=response['ETag']).status_code, 200)
+
+    def test_fields_and_paging(self):
+        response = self.get(fields='barcode,title', limit=2)
+        body = response.json()
+        self.assertEqual(body['results'], [
+            {'id': copy.id, 'barcode': copy.barcode, 'title': 'The Hobbit'} for copy in self.copies[:2]
+        ])
+        self.assertEqual(body['next'], self.copies[1].id)
+        body = self.get(fields='barcode', limit=2, after=body['next']).json()
+        self.assertEqual(([row['id'] for row in body['results']], body['next']), ([self.copies[2].id], None))
+        # Other fields are a different response.
+        self.assertNotEqual(self.get(fields='barcode')['ETag'], self.get(fields='status')['ETag'])
+
+    def test_lookup_by_barcode(self):
+        body = self.get(barcodes=self.copies[2].barcode).json()
+        self.assertEqual([row['id'] for row in body['results']], [self.copies[2].id])
+
+    def test_bad_parameters_are_400(self):
+        for params in ({'limit': '-5'}, {'limit': '0'}, {'after': '-1'}, {'limit': 'x'}, {'ids': 'a'}, {'fields': 'pin_hash'}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+    def test_availability_reports_loans_and_the_hold_queue(self):
+        patron = make_patron(1)
+        make_loan(patron, self.copies[0])
+        Hold.objects.create(patron=make_patron(2), work=self.work)
+        response = self.get('availability_api', ids=f'{self.copies[0].id},{self.copies[1].id}')
+        rows = response.json()['results']
+        self.assertEqual([(row['status'], row['pending_holds']) for row in rows], [('checked_out', 1), ('available', 1)])
+        self.assertIsNotNone(rows[0]['due_date'])
+        self.assertEqual(self.get('availability_api', etag=response['ETag'], ids=f'{self.copies[0].id},{self.copies[1].id}').status_code, 304)
+        Hold.objects.create(patron=make_patron(3), work=self.work)
+        self.assertEqual(self.get('availability_api', etag=response['ETag'], ids=f'{self.copies[0].id},{self.copies[1].id}').status_code, 200)
+
+    def test_availability_needs_a_lookup(self):
+        self.assertEqual(self.get('availability_api').status_code, 400)
+
+    def test_account(self):
+        patron = make_patron(1)
+        make_loan(patron, self.copies[0])
+        sign_in(self.client, 'patron', patron)
+        response = self.get('account_api')
+        self.assertEqual([loan['media_item_id'] for loan in response.json()['loans']], [self.copies[0].id])
+        self.assertEqual(self.get('account_api', etag=response['ETag']).status_code, 304)
@@ -0,0 +1,60 @@
+import asyncio
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from ..circulation import check_out
+from ..events import EventBroker, format_event, live_counters
+from ..models import MediaRequest
+from .helpers import make_copy, make_librarian, make_patron, make_work, sign_in
+
+def _subscribe(broker):
+    queue = broker.subscribe()
+    # No periodic re-count: it would read the database from another thread.
+    for task in broker._watchers.values():
+        task.cancel()
+    return queue
+
+class EventBrokerTests(TestCase):
+    def test_events_published_from_other_threads_reach_subscribers(self):
+        async def scenario():
+            broker = EventBroker()
+            queue = _subscribe(broker)
+            await asyncio.to_thread(broker.publish, 'checkout', {'deltas': {'checkouts_today': 1}})
+            message = await asyncio.wait_for(queue.get(), 1)
+            broker.unsubscribe(queue)
+            broker.publish('checkout', {})
+            await asyncio.sleep(0)
+            return message, queue.qsize()
+        message, left = asyncio.run(scenario())
+        self.assertEqual(message, format_event('checkout', {'deltas': {'checkouts_today': 1}}))
+        self.assertEqual(left, 0)
+
+    @override_settings(LIVE_UPDATES_QUEUE_SIZE=2)
+    def test_slow_subscriber_is_told_to_resync(self):
+        async def scenario():
+            broker = EventBroker()
+            queue = _subscribe(broker)
+            for n in range(3):
+                broker.publish('checkout', {'n': n})
+            await asyncio.sleep(0)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+        self.assertEqual(asyncio.run(scenario()), [format_event('resync', {})])
+
+    def test_publish_on_commit_waits_for_the_commit(self):
+        published = []
+        broker = EventBroker()
+        broker.publish = lambda event, data: published.append((event, data))
+        with self.captureOnCommitCallbacks(execute=True):
+            broker.publish_on_commit('checkout', {'deltas': {'checkouts_today': 1}})
+            self.assertEqual(published, [])
+        self.assertEqual(published, [('checkout', {'deltas': {'checkouts_today': 1}})])
+
+    def test_live_counters(self):
+        patron = make_patron(1)
+        check_out(patron, make_copy(make_work(), 1))
+        MediaRequest.objects.create(patron=patron, title='Dune', media_type='book')
+        counters = live_counters()
+        self.assertEqual((counters['checkouts_today'], counters['overdue_items'], counters['pending_requests']), (1, 0, 1))
+
+    def test_stream_needs_asgi(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        self.assertEqual(self.client.get(reverse('librarian_events')).status_code, 204)
@@ -0,0 +1,61 @@
+from django.test import TestCase
+from django.urls import reverse
+from ..models import Hold
+from .helpers import make_copy, make_librarian, make_loan, make_patron, make_work, sign_in
+
+HTMX = {'HTTP_HX_REQUEST': 'true'}
+
+class PatronFragmentTests(TestCase):
+    def setUp(self):
+        self.patron = make_patron(1)
+        sign_in(self.client, 'patron', self.patron)
+        self.work = make_work()
+
+    def test_renew_returns_the_row(self):
+        loan = make_loan(self.patron, make_copy(self.work, 1))
+        response = self.client.post(reverse('patron_renew', args=[loan.pk]), **HTMX)
+        self.assertTemplateUsed(response, 'patron/partials/checkout-row.html')
+        self.assertTemplateNotUsed(response, 'patron/patron-checked-out.html')
+        self.assertContains(response, f'id="checkout-{loan.pk}"')
+        self.assertContains(response, 'Successfully renewed')
+        self.assertContains(response, 'Renewed 1x')
+
+    def test_renew_without_htmx_redirects(self):
+        loan = make_loan(self.patron, make_copy(self.work, 1))
+        response = self.client.post(reverse('patron_renew', args=[loan.pk]))
+        self.assertRedirects(response, reverse('patron_checked_out'), fetch_redirect_response=False)
+
+    def test_place_hold_returns_the_button(self):
+        response = self.client.post(reverse('patron_place_hold', args=[self.work.pk]), **HTMX)
+        self.assertTemplateUsed(response, 'patron/partials/hold-button.html')
+        self.assertContains(response, 'You are #1 in queue')
+        again = self.client.post(reverse('patron_place_hold', args=[self.work.pk]), **HTMX)
+        self.assertContains(again, 'You already have a hold on this title.')
+        self.assertEqual(Hold.objects.filter(patron=self.patron).count(), 1)
+
+    def test_cancel_hold_returns_the_card(self):
+        hold = Hold.objects.create(patron=self.patron, work=self.work)
+        response = self.client.post(reverse('patron_cancel_hold', args=[hold.pk]), **HTMX)
+        self.assertTemplateUsed(response, 'patron/partials/hold-card.html')
+        self.assertContains(response, f'id="hold-{hold.pk}"')
+        self.assertContains(response, 'Hold cancelled.')
+
+    def test_signed_out_fragment_redirects_the_page(self):
+        self.client.logout()
+        response = self.client.post(reverse('patron_place_hold', args=[self.work.pk]), **HTMX)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['HX-Redirect'], reverse('login'))
+        self.assertEqual(response.content, b'')
+        self.assertFalse(Hold.objects.exists())
+
+class CheckinFragmentTests(TestCase):
+    def test_checkin_returns_the_result(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        copy = make_copy(make_work(), 1)
+        copy.barcode = 'BC-000000001'
+        copy.save()
+        make_loan(make_patron(1), copy)
+        response = self.client.post(reverse('librarian_checkin'), {'barcode': copy.barcode}, **HTMX)
+        self.assertTemplateUsed(response, 'librarian/partials/checkin-result.html')
+        self.assertTemplateNotUsed(response, 'librarian/librarian-checkin.html')
+        self.assertContains(response, 'Successfully checked in')
@@ -0,0 +1,69 @@
+import csv
+from datetime import timedelta
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .. import inventory
+from ..models import MediaItem
+from .helpers import make_work
+
+def barcode(n):
+    return f'BC-{n:09d}'
+
+# Chunks of two so every read and UPDATE spans several chunks.
+@override_settings(INVENTORY_CHUNK_SIZE=2)
+class ReconcileTests(TestCase):
+    def setUp(self):
+        work = make_work()
+        shelf = [
+            (1, 'available', 'Main Branch'),
+            (2, 'available', 'Main Branch'),
+            (3, 'checked_out', 'Main Branch'),
+            (4, 'lost', 'Main Branch'),
+            (5, 'available', 'Annex'),
+            (6, 'lost', 'Annex'),
+            (7, 'available', 'Main Branch'),
+        ]
+        self.copies = {
+            n: MediaItem.objects.create(work=work, barcode=barcode(n), status=status, location=location)
+            for n, status, location in shelf
+        }
+        # Copy 2 has not been seen for months; copy 7 was added last week.
+        MediaItem.objects.filter(pk=self.copies[2].pk).update(added_at=timezone.now() - timedelta(days=100))
+        MediaItem.objects.filter(pk=self.copies[7].pk).update(added_at=timezone.now() - timedelta(days=7))
+        scanned = [1, 3, 4, 5, 6, 99, 1]
+        self.scans = StringIO(''.join(f'Main Branch,{barcode(n)}\n' for n in scanned) + 'Main Branch,garbage\n\n')
+
+    def test_discrepancies_are_categorized(self):
+        report = StringIO()
+        summary, counts = inventory.run([self.scans], report=report)
+        self.assertEqual((counts['lines'], counts['invalid']), (8, 1))
+        self.assertEqual(summary, {'Main Branch': {
+            'scanned': 6, 'missing': 2, 'checked_out_on_shelf': 1, 'found': 2, 'misplaced': 1, 'unknown': 1, 'inventoried': 5,
+        }})
+        rows = {(row['category'], row['barcode']) for row in csv.DictReader(StringIO(report.getvalue()))}
+        self.assertEqual(rows, {
+            ('missing', barcode(2)), ('missing', barcode(7)),
+            ('checked_out_on_shelf', barcode(3)),
+            ('found', barcode(4)), ('found', barcode(6)),
+            ('misplaced', barcode(5)),
+            ('unknown', barcode(99)),
+        })
+        self.assertFalse(MediaItem.objects.filter(pk=self.copies[2].pk, last_inventoried_at__isnull=False).exists())
+        self.assertEqual(MediaItem.objects.filter(last_inventoried_at__isnull=False).count(), 5)
+
+    def test_location_for_bare_barcodes(self):
+        scans = StringIO(f'{barcode(1)}\n{barcode(2)}\n')
+        summary, _ = inventory.run([scans], location='Annex')
+        self.assertEqual((summary['Annex']['misplaced'], summary['Annex']['missing']), (2, 1))
+
+    def test_long_missing_copies_are_marked_lost(self):
+        summary, _ = inventory.run([self.scans], lost_after_days=30)
+        self.assertEqual(summary['Main Branch']['marked_lost'], 1)
+        self.assertEqual(MediaItem.objects.get(pk=self.copies[2].pk).status, 'lost')
+        self.assertEqual(MediaItem.objects.get(pk=self.copies[7].pk).status, 'available')
+
+    def test_barcode_keys_round_trip(self):
+        for value in [barcode(1), barcode(123456789), 'BC-0000000017']:
+            self.assertEqual(inventory.key_barcode(inventory.barcode_key(value)), value)
+        self.assertNotEqual(inventory.barcode_key('BC-000000001'), inventory.barcode_key('BC-0000000001'))
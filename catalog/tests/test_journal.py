@@ -0,0 +1,169 @@
+import json
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .. import journal
+from ..models import Checkout, Hold, MediaItem, Notification, ReplayedOperation
+from .helpers import make_copy, make_librarian, make_loan, make_patron, make_work, sign_in
+
+class JournalReplayTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        journal_settings = override_settings(CIRCULATION_JOURNAL_PATH=str(Path(directory.name) / 'journal.sqlite3'))
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+        self.librarian = make_librarian()
+        self.work = make_work()
+        self.copy = make_copy(self.work, 1)
+        self.patron = make_patron(1)
+
+    def entry(self, operation, payload, key=None, recorded_at=None):
+        return {
+            'key': key or journal.new_key(),
+            'operation': operation,
+            'payload': json.dumps(payload),
+            'librarian_id': self.librarian.pk,
+            'recorded_at': recorded_at or time.time(),
+        }
+
+    def checkout_payload(self, patron=None):
+        return {'card_number': (patron or self.patron).card_number, 'barcode': self.copy.barcode}
+
+    def test_resubmitted_form_is_journaled_once(self):
+        key = journal.new_key()
+        self.assertTrue(journal.record('checkout', key, self.checkout_payload(), self.librarian.pk))
+        self.assertFalse(journal.record('checkout', key, self.checkout_payload(), self.librarian.pk))
+        outcomes, _ = journal.replay()
+        self.assertEqual(outcomes, {'applied': 1})
+        outcomes, _ = journal.replay()
+        self.assertEqual(sum(outcomes.values()), 0)
+        self.assertEqual(Checkout.objects.filter(media_item=self.copy).count(), 1)
+
+    def test_entry_is_applied_once(self):
+        entry = self.entry('checkout', self.checkout_payload())
+        self.assertEqual(journal._replay_entry(entry), ('applied', ''))
+        self.assertEqual(journal._replay_entry(entry), ('duplicate', 'Already replayed.'))
+        self.assertEqual(ReplayedOperation.objects.filter(key=entry['key']).count(), 1)
+        self.assertEqual(Checkout.objects.filter(media_item=self.copy).count(), 1)
+
+    def test_checkout_of_unknown_patron_conflicts(self):
+        outcome, _ = journal._replay_entry(self.entry('checkout', {'card_number': 'LC-0000000', 'barcode': self.copy.barcode}))
+        self.assertEqual(outcome, 'conflict')
+        self.assertFalse(Checkout.objects.exists())
+
+    def test_checkout_already_out_to_patron_is_duplicate(self):
+        make_loan(self.patron, self.copy)
+        outcome, _ = journal._replay_entry(self.entry('checkout', self.checkout_payload()))
+        self.assertEqual(outcome, 'duplicate')
+        self.assertEqual(Checkout.objects.count(), 1)
+
+    def test_checkout_closes_stale_loan_without_filling_holds(self):
+        other = make_patron(2)
+        waiting = make_patron(3)
+        stale = make_loan(other, self.copy)
+        hold = Hold.objects.create(patron=waiting, work=self.work, queue_position=1)
+        outcome, detail = journal._replay_entry(self.entry('checkout', self.checkout_payload()))
+        self.assertEqual(outcome, 'resolved')
+        self.assertIn(other.name, detail)
+        stale.refresh_from_db()
+        self.assertIsNotNone(stale.returned_at)
+        self.assertTrue(Checkout.objects.filter(patron=self.patron, media_item=self.copy, returned_at__isnull=True).exists())
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.queue_position), ('pending', 1))
+        self.assertFalse(Notification.objects.exists())
+
+    def test_checkout_requeues_hold_the_copy_was_set_aside_for(self):
+        holder = make_patron(2)
+        waiting = make_patron(3)
+        self.copy.status = 'on_hold'
+        self.copy.save()
+        ready = Hold.objects.create(patron=holder, work=self.work, media_item=self.copy, status='ready', queue_position=0)
+        pending = Hold.objects.create(patron=waiting, work=self.work, queue_position=1)
+        outcome, _ = journal._replay_entry(self.entry('checkout', self.checkout_payload()))
+        self.assertEqual(outcome, 'resolved')
+        ready.refresh_from_db()
+        pending.refresh_from_db()
+        self.assertEqual((ready.status, ready.queue_position, ready.media_item_id), ('pending', 1, None))
+        self.assertEqual(pending.queue_position, 2)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'checked_out')
+
+    def test_checkout_of_lost_copy_is_resolved(self):
+        self.copy.status = 'lost'
+        self.copy.save()
+        outcome, detail = journal._replay_entry(self.entry('checkout', self.checkout_payload()))
+        self.assertEqual(outcome, 'resolved')
+        self.assertIn('lost', detail)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'checked_out')
+
+    def test_checkin_is_applied_at_the_recorded_time(self):
+        loan = make_loan(self.patron, self.copy, checked_out_at=timezone.now() - timedelta(days=3))
+        recorded_at = time.time() - 3600
+        outcome, _ = journal._replay_entry(self.entry('checkin', {'barcode': self.copy.barcode}, recorded_at=recorded_at))
+        self.assertEqual(outcome, 'applied')
+        loan.refresh_from_db()
+        self.assertAlmostEqual(loan.returned_at.timestamp(), recorded_at, places=3)
+
+    def test_checkin_of_copy_not_out_is_duplicate(self):
+        outcome, _ = journal._replay_entry(self.entry('checkin', {'barcode': self.copy.barcode}))
+        self.assertEqual(outcome, 'duplicate')
+
+    def test_checkin_of_unknown_copy_conflicts(self):
+        outcome, _ = journal._replay_entry(self.entry('checkin', {'barcode': 'BC-missing'}))
+        self.assertEqual(outcome, 'conflict')
+
+    def test_checkin_before_a_newer_loan_is_stale(self):
+        loan = make_loan(self.patron, self.copy)
+        outcome, _ = journal._replay_entry(self.entry('checkin', {'barcode': self.copy.barcode}, recorded_at=time.time() - 7200))
+        self.assertEqual(outcome, 'stale')
+        loan.refresh_from_db()
+        self.assertIsNone(loan.returned_at)
+
+def database_down(execute, sql, params, many, context):
+    raise OperationalError('could not connect to server')
+
+# Sessions come from the cache, as they do in production with a shared
+# cache, so only the catalog database is gone.
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class OutageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        journal_settings = override_settings(CIRCULATION_JOURNAL_PATH=str(Path(directory.name) / 'journal.sqlite3'))
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+        self.librarian = make_librarian()
+        sign_in(self.client, 'librarian', self.librarian)
+        # A barcode that passes the format check at the check-in desk.
+        self.copy = MediaItem.objects.create(work=make_work(), barcode='BC-000000001')
+        self.patron = make_patron(1)
+
+    def test_checkout_and_checkin_are_journaled_and_replayed(self):
+        with connection.execute_wrapper(database_down):
+            response = self.client.post(reverse('librarian_checkout'), {
+                'card_number': self.patron.card_number, 'barcodes': self.copy.barcode,
+            })
+        self.assertRedirects(response, reverse('librarian_checkout'), fetch_redirect_response=False)
+        self.assertEqual(journal.stats()['queued'], 1)
+        self.assertEqual(journal.replay()[0], {'applied': 1})
+        loan = Checkout.objects.get(media_item=self.copy)
+        self.assertEqual((loan.patron, loan.returned_at), (self.patron, None))
+
+        with connection.execute_wrapper(database_down):
+            response = self.client.post(reverse('librarian_checkin'), {'barcode': self.copy.barcode})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Recorded the return of BC-000000001 offline')
+        self.assertEqual(journal.replay()[0], {'applied': 1})
+        loan.refresh_from_db()
+        self.assertIsNotNone(loan.returned_at)
+
+    def test_other_librarian_pages_still_fail(self):
+        with connection.execute_wrapper(database_down), self.assertRaises(OperationalError):
+            self.client.get(reverse('librarian_dashboard'))
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from .. import loan_history
+from ..models import Checkout, Fine, LoanHistory
+from .helpers import make_copy, make_loan, make_patron, make_work
+
+class ArchiveLoansTests(TestCase):
+    def setUp(self):
+        self.patron = make_patron(1)
+        self.work = make_work()
+        long_ago = timezone.now() - timedelta(days=400)
+        self.old = [
+            make_loan(self.patron, make_copy(self.work, n), checked_out_at=long_ago, returned_at=long_ago + timedelta(days=30))
+            for n in range(2)
+        ]
+        self.recent = make_loan(self.patron, make_copy(self.work, 2), returned_at=timezone.now())
+        self.fine = Fine.objects.create(patron=self.patron, checkout=self.old[0], amount='1.50', reason='Overdue')
+        self.recent_fine = Fine.objects.create(patron=self.patron, checkout=self.recent, amount='0.50', reason='Overdue')
+
+    def test_old_loans_move_with_their_fines(self):
+        moved, _ = loan_history.archive(days=365, batch_size=1, anonymize=False)
+        self.assertEqual(moved, 2)
+        self.assertEqual(list(Checkout.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(set(LoanHistory.objects.values_list('loan_id', flat=True)), {loan.id for loan in self.old})
+        self.fine.refresh_from_db()
+        self.assertEqual((self.fine.checkout_id, self.fine.loan_id), (None, self.old[0].id))
+        self.assertEqual(self.fine.loan.patron_id, self.patron.id)
+        self.recent_fine.refresh_from_db()
+        self.assertEqual((self.recent_fine.checkout_id, self.recent_fine.loan_id), (self.recent.id, None))
+
+    def test_anonymized_archive_keeps_fines_with_patron(self):
+        loan_history.archive(days=365, anonymize=True)
+        self.assertFalse(LoanHistory.objects.filter(patron__isnull=False).exists())
+        self.fine.refresh_from_db()
+        self.assertEqual((self.fine.patron_id, self.fine.loan_id), (self.patron.id, self.old[0].id))
+
+    def test_rerun_moves_nothing(self):
+        loan_history.archive(days=365)
+        self.assertEqual(loan_history.archive(days=365)[0], 0)
+        self.assertEqual(LoanHistory.objects.count(), 2)
+
+    def test_command_reports_the_move(self):
+        out = StringIO()
+        call_command('archive_loans', days=365, stdout=out)
+        self.assertIn('Checkout rows: 3 -> 1; loan history rows: 2', out.getvalue())
+        call_command('archive_loans', days=365, stdout=out)
+        self.assertEqual(LoanHistory.objects.count(), 2)
@@ -0,0 +1,50 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .. import login
+from ..login import LoginBusy, verify_credentials
+from .helpers import make_patron
+
+@override_settings(PATRON_PIN_ITERATIONS=1000)
+class LoginTests(TestCase):
+    def setUp(self):
+        self.patron = make_patron(1)
+        self.patron.set_pin('2468')
+        self.patron.save()
+
+    def post(self, pin):
+        return self.client.post(reverse('login'), {'user_type': 'patron', 'card_number': self.patron.card_number, 'pin': pin})
+
+    def test_verify_credentials(self):
+        self.assertTrue(verify_credentials(self.patron, '2468'))
+        self.assertFalse(verify_credentials(self.patron, '1357'))
+
+    def test_login_signs_the_patron_in(self):
+        response = self.post('2468')
+        self.assertRedirects(response, reverse('patron_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['patron_id'], self.patron.pk)
+
+    def test_wrong_pin(self):
+        self.assertEqual(self.post('1357').status_code, 200)
+        self.assertNotIn('patron_id', self.client.session)
+
+    def test_changed_cost_rehashes_on_login(self):
+        with override_settings(PATRON_PIN_ITERATIONS=2000):
+            self.assertTrue(verify_credentials(self.patron, '2468'))
+        self.patron.refresh_from_db()
+        self.assertIn('$2000$', self.patron.pin_hash)
+
+    def test_full_pool_refuses_at_once(self):
+        _, slots = login._get_pool()
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            with self.assertRaises(LoginBusy):
+                verify_credentials(self.patron, '2468')
+            response = self.post('2468')
+            self.assertEqual(response.status_code, 503)
+            self.assertNotIn('patron_id', self.client.session)
+        finally:
+            for _ in range(taken):
+                slots.release()
+        self.assertTrue(verify_credentials(self.patron, '2468'))
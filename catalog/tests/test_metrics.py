@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+from unittest import mock
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .. import metrics
+from ..slowlog import record_slow_queries
+
+class MetricsViewTests(TestCase):
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_scrape_needs_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('notification_outbox_pending 0\n', response.content.decode())
+
+    def test_requests_are_timed_and_their_queries_counted(self):
+        key = ('db_queries_per_request', (('view', 'items_api'),))
+        before = metrics.snapshot()[1].get(key, [0] * 12)
+        self.client.get(reverse('items_api'))
+        after = metrics.snapshot()[1][key]
+        self.assertEqual(after[-1], before[-1] + 1)
+        self.assertGreaterEqual(after[-2], before[-2] + 1)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_request_duration_seconds_count{status="200",view="items_api"}', body)
+        self.assertIn('# TYPE db_queries_per_request histogram', body)
+
+    def test_reconnects_install_the_wrappers_once(self):
+        for _ in range(3):
+            connection_created.send(sender=connection.__class__, connection=connection)
+        self.assertEqual(connection.execute_wrappers.count(metrics.count_queries), 1)
+        self.assertEqual(connection.execute_wrappers.count(record_slow_queries), 1)
+
+class RenderTests(TestCase):
+    def test_counters_and_histograms(self):
+        metrics.inc('circulation_operations_total', 2, operation='render-test')
+        metrics.observe('request_queue_seconds', 0.02, server='render-test')
+        body = metrics.render()
+        self.assertIn('# TYPE circulation_operations_total counter', body)
+        self.assertIn('circulation_operations_total{operation="render-test"} 2\n', body)
+        self.assertIn('request_queue_seconds_bucket{server="render-test",le="0.01"} 0\n', body)
+        self.assertIn('request_queue_seconds_bucket{server="render-test",le="0.025"} 1\n', body)
+        self.assertIn('request_queue_seconds_bucket{server="render-test",le="+Inf"} 1\n', body)
+        self.assertIn('request_queue_seconds_count{server="render-test"} 1\n', body)
+
+    def test_label_values_are_escaped(self):
+        metrics.inc('throttle_decisions_total', scope='say "hi"\n')
+        self.assertIn('throttle_decisions_total{scope="say \\"hi\\"\\n"} 1\n', metrics.render())
+
+    def test_workers_are_merged_from_metrics_dir(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory), \
+                mock.patch.dict(metrics._process, {'pid': None}):
+            with open(os.path.join(directory, 'other-worker.json'), 'w') as f:
+                json.dump({'counters': [['login_busy_total', [['worker', 'merge-test']], 3]], 'histograms': []}, f)
+            with open(os.path.join(directory, 'partial.json.tmp'), 'w') as f:
+                f.write('{')
+            metrics.inc('login_busy_total', worker='merge-test')
+            body = metrics.render()
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.json')]), 2)
+        self.assertIn('login_busy_total{worker="merge-test"} 4\n', body)
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .. import notifications
+from ..models import Hold, Notification
+from .helpers import make_copy, make_loan, make_patron, make_work
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    NOTIFICATION_MAX_PER_MINUTE=60000,
+    NOTIFICATION_DUE_SOON_DAYS=3,
+)
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.patron = make_patron(1)
+        self.work = make_work()
+        now = timezone.now()
+        make_loan(self.patron, make_copy(self.work, 1), due_date=now + timedelta(days=1))
+        make_loan(self.patron, make_copy(self.work, 2), due_date=now - timedelta(days=2))
+        make_loan(self.patron, make_copy(self.work, 3), due_date=now + timedelta(days=10))
+        for n in range(3):
+            Hold.objects.create(
+                patron=make_patron(n + 2), work=self.work, media_item=make_copy(self.work, n + 4, status='on_hold'),
+                status='ready', pickup_by=now + timedelta(days=7),
+            )
+
+    def test_scan_queues_each_notice_once(self):
+        created = notifications.scan_reminders()
+        self.assertEqual(created, {'due_soon': 1, 'overdue': 1, 'hold_ready': 3})
+        notifications.scan_reminders()
+        self.assertEqual(Notification.objects.count(), 5)
+
+    def test_scan_inserts_in_batches(self):
+        with mock.patch.object(notifications, 'enqueue', wraps=notifications.enqueue) as enqueue:
+            notifications.scan_reminders(batch_size=2)
+        self.assertTrue(all(len(call.args) <= 2 for call in enqueue.call_args_list))
+        self.assertEqual(Notification.objects.filter(kind='hold_ready').count(), 3)
+
+    def test_notices_for_one_patron_share_an_email(self):
+        notifications.scan_reminders()
+        stats = notifications.send_pending()
+        self.assertEqual(stats, {'sent': 5, 'failed': 0, 'retry': 0})
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertIn('2 updates from the library', [message.subject for message in mail.outbox])
+        self.assertFalse(Notification.objects.exclude(status='sent').exists())
+        self.assertEqual(notifications.send_pending(), {'sent': 0, 'failed': 0, 'retry': 0})
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failed_send_is_retried_then_given_up(self):
+        notifications.enqueue(notifications.hold_ready_notice(Hold.objects.select_related('work').first()))
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('refused')):
+            self.assertEqual(notifications.send_pending()['retry'], 1)
+            notice = Notification.objects.get()
+            self.assertEqual((notice.status, notice.attempts), ('pending', 1))
+            self.assertGreater(notice.next_attempt_at, timezone.now())
+            Notification.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(notifications.send_pending()['failed'], 1)
+        self.assertEqual(Notification.objects.get().status, 'failed')
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from ..principals import get_principal, principal_cache_key
+from .helpers import make_patron
+
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patron = make_patron(1)
+
+    def cached(self):
+        return cache.get(principal_cache_key('patron', self.patron.pk), version=settings.PRINCIPAL_CACHE_VERSION)
+
+    @override_settings(PRINCIPAL_CACHE_ENABLED=True)
+    def test_saving_the_row_drops_the_cached_principal(self):
+        self.assertEqual(get_principal('patron', self.patron.pk), self.patron)
+        self.assertIsNotNone(self.cached())
+        self.patron.status = 'suspended'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patron.save()
+        self.assertIsNone(self.cached())
+        self.assertEqual(get_principal('patron', self.patron.pk).status, 'suspended')
+
+    @override_settings(PRINCIPAL_CACHE_ENABLED=False)
+    def test_without_a_shared_cache_principals_are_read_from_the_database(self):
+        get_principal('patron', self.patron.pk)
+        self.assertIsNone(self.cached())
+        self.patron.status = 'suspended'
+        self.patron.save()
+        self.assertEqual(get_principal('patron', self.patron.pk).status, 'suspended')
+
+    def test_missing_principal(self):
+        self.assertIsNone(get_principal('patron', self.patron.pk + 1))
+
+class SessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patron = make_patron(1)
+        session = self.client.session
+        session['patron_id'] = self.patron.pk
+        session.save()
+        self.session_key = session.session_key
+
+    def test_sessions_skip_a_per_process_cache(self):
+        self.assertFalse(settings.SHARED_CACHE)
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+
+    def test_logout_ends_the_session_everywhere(self):
+        self.assertEqual(self.client.get(reverse('patron_dashboard')).status_code, 200)
+        self.client.get(reverse('logout'))
+        # What another worker's cache would still hold for the session.
+        cache.set(f'django.contrib.sessions.cached_db{self.session_key}', {'patron_id': self.patron.pk})
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = self.session_key
+        response = self.client.get(reverse('patron_dashboard'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
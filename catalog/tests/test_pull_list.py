@@ -0,0 +1,56 @@
+from django.test import TestCase
+from .. import pull_list
+from ..circulation import receive_transit
+from ..models import Hold, MediaItem, Notification
+from .helpers import make_copy, make_patron, make_work
+
+class PullListTests(TestCase):
+    def setUp(self):
+        self.work = make_work()
+        self.copies = [make_copy(self.work, n) for n in range(2)]
+        self.holds = [
+            Hold.objects.create(patron=make_patron(n), work=self.work, queue_position=n + 1)
+            for n in range(4)
+        ]
+
+    def positions(self):
+        return list(Hold.objects.filter(work=self.work, status='pending').order_by('queue_position').values_list('id', 'queue_position'))
+
+    def test_rows_pair_oldest_holds_with_available_copies(self):
+        pairs = [(row['hold_id'], row['item_id']) for row in pull_list.rows()]
+        self.assertEqual(sorted(pairs), [(self.holds[0].id, self.copies[0].id), (self.holds[1].id, self.copies[1].id)])
+
+    def test_marking_moves_the_queue_up(self):
+        marked = pull_list.mark_in_transit([(self.holds[0].id, self.copies[0].id), (self.holds[1].id, self.copies[1].id)])
+        self.assertEqual(marked, 2)
+        self.assertEqual(self.positions(), [(self.holds[2].id, 1), (self.holds[3].id, 2)])
+        self.assertEqual(set(MediaItem.objects.filter(work=self.work).values_list('status', flat=True)), {'in_transit'})
+
+    def test_marking_a_hold_behind_the_head(self):
+        pull_list.mark_in_transit([(self.holds[2].id, self.copies[0].id)], pickup_location='East Branch')
+        self.assertEqual(self.positions(), [(self.holds[0].id, 1), (self.holds[1].id, 2), (self.holds[3].id, 3)])
+        self.holds[2].refresh_from_db()
+        self.assertEqual((self.holds[2].status, self.holds[2].pickup_location), ('in_transit', 'East Branch'))
+
+    def test_stale_pairs_are_skipped(self):
+        self.copies[1].status = 'checked_out'
+        self.copies[1].save()
+        # The same copy twice, and a copy that left the shelf.
+        marked = pull_list.mark_in_transit([
+            (self.holds[0].id, self.copies[0].id),
+            (self.holds[1].id, self.copies[0].id),
+            (self.holds[2].id, self.copies[1].id),
+        ])
+        self.assertEqual(marked, 1)
+        self.assertEqual(self.positions(), [(self.holds[1].id, 1), (self.holds[2].id, 2), (self.holds[3].id, 3)])
+
+    def test_arrival_at_the_pickup_branch_readies_the_hold(self):
+        pull_list.mark_in_transit([(self.holds[0].id, self.copies[0].id)])
+        self.copies[0].refresh_from_db()
+        self.assertEqual(receive_transit(self.copies[0]), self.holds[0])
+        self.holds[0].refresh_from_db()
+        self.copies[0].refresh_from_db()
+        self.assertEqual((self.holds[0].status, self.copies[0].status), ('ready', 'on_hold'))
+        self.assertIsNotNone(self.holds[0].pickup_by)
+        self.assertTrue(Notification.objects.filter(patron=self.holds[0].patron, kind='hold_ready').exists())
+        self.assertIsNone(receive_transit(self.copies[1]))
@@ -0,0 +1,86 @@
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+from .. import purge
+from ..models import Hold, MediaItem, Notification, Patron, PurgeJob, Work
+from .helpers import make_copy, make_librarian, make_loan, make_patron, make_work, sign_in
+
+class DeleteItemTests(TestCase):
+    def setUp(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        self.work = make_work()
+
+    def delete(self, item):
+        return self.client.post(reverse('librarian_delete_item', args=[item.pk]))
+
+    def test_copies_in_use_are_kept(self):
+        for n, status in enumerate(['checked_out', 'on_hold', 'in_transit']):
+            item = make_copy(self.work, n, status=status)
+            self.delete(item)
+            self.assertTrue(MediaItem.objects.filter(pk=item.pk).exists(), status)
+
+    def test_last_copy_takes_the_work_with_it(self):
+        first, second = make_copy(self.work, 1), make_copy(self.work, 2, status='lost')
+        self.delete(first)
+        self.assertFalse(MediaItem.objects.filter(pk=first.pk).exists())
+        self.assertEqual(MediaItem.all_objects.get(pk=first.pk).barcode, f'deleted-{first.pk}-BC-T{self.work.pk}-1')
+        self.assertTrue(Work.objects.filter(pk=self.work.pk).exists())
+        self.delete(second)
+        self.assertFalse(Work.objects.filter(pk=self.work.pk).exists())
+        self.assertTrue(PurgeJob.objects.filter(kind='work', object_id=self.work.pk, status='pending').exists())
+
+class DeletePatronTests(TestCase):
+    def setUp(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        self.patron = make_patron(1)
+
+    def test_patron_with_a_loan_is_kept(self):
+        make_loan(self.patron, make_copy(make_work(), 1))
+        self.client.post(reverse('librarian_delete_patron', args=[self.patron.pk]))
+        self.assertTrue(Patron.objects.filter(pk=self.patron.pk).exists())
+
+    def test_delete_frees_the_email_and_queues_a_purge(self):
+        self.client.post(reverse('librarian_delete_patron', args=[self.patron.pk]))
+        self.assertFalse(Patron.objects.filter(pk=self.patron.pk).exists())
+        self.assertEqual(Patron.all_objects.get(pk=self.patron.pk).email, f'deleted-{self.patron.pk}@invalid')
+        self.assertTrue(PurgeJob.objects.filter(kind='patron', object_id=self.patron.pk).exists())
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        self.work = make_work()
+        self.patrons = [make_patron(n) for n in range(5)]
+        self.holds = [
+            Hold.objects.create(patron=patron, work=self.work, queue_position=n + 1)
+            for n, patron in enumerate(self.patrons)
+        ]
+
+    def queue(self):
+        return list(Hold.objects.filter(status='pending').order_by('queue_position').values_list('patron_id', 'queue_position'))
+
+    def purge_patron(self, patron, batch_size=None):
+        patron.soft_delete()
+        job = PurgeJob.objects.create(kind='patron', object_id=patron.pk)
+        purge.run(job, batch_size)
+        job.refresh_from_db()
+        return job
+
+    def test_patron_purge_moves_the_queue_up(self):
+        Notification.objects.create(patron=self.patrons[1], kind='hold_ready', subject='s', body='b', dedupe_key='purge-test')
+        job = self.purge_patron(self.patrons[1], batch_size=1)
+        self.assertEqual(self.queue(), [(self.patrons[0].pk, 1)] + [(p.pk, n) for n, p in enumerate(self.patrons[2:], 2)])
+        self.assertFalse(Notification.objects.filter(patron=self.patrons[1]).exists())
+        self.assertEqual((job.status, job.rows_done), ('done', 2))
+        self.assertEqual(Patron.all_objects.get(pk=self.patrons[1].pk).name, 'Deleted patron')
+
+    def test_batch_with_two_holds_on_one_work(self):
+        purge._cancel_holds(Hold.objects.filter(pk__in=[self.holds[1].pk, self.holds[3].pk]), 10)
+        self.assertEqual(self.queue(), [(self.patrons[0].pk, 1), (self.patrons[2].pk, 2), (self.patrons[4].pk, 3)])
+
+    def test_copy_set_aside_goes_to_the_next_hold(self):
+        copy = make_copy(self.work, 1, status='on_hold')
+        Hold.objects.filter(pk=self.holds[0].pk).update(status='ready', media_item=copy, queue_position=0)
+        Hold.objects.filter(pk__in=[h.pk for h in self.holds[1:]]).update(queue_position=F('queue_position') - 1)
+        self.purge_patron(self.patrons[0])
+        ready = Hold.objects.get(status='ready')
+        self.assertEqual((ready.patron_id, ready.media_item_id), (self.patrons[1].pk, copy.pk))
+        self.assertEqual(self.queue(), [(p.pk, n) for n, p in enumerate(self.patrons[2:], 1)])
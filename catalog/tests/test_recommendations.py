@@ -0,0 +1,55 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from .. import recommendations
+from ..models import CoBorrowCount, WorkRecommendation
+from .helpers import make_copy, make_loan, make_patron, make_work
+
+def _top(work):
+    return [(rec.recommended_id, rec.score) for rec in recommendations.for_work(work.id)]
+
+@override_settings(RECOMMENDATION_TOP_K=2)
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.works = [make_work(f'Title {n}', 'Author') for n in range(4)]
+        self.copies = [make_copy(work, 1) for work in self.works]
+        self.patrons = [make_patron(n) for n in range(3)]
+
+    def borrow(self, patron, *works):
+        for n in works:
+            make_loan(self.patrons[patron], self.copies[n])
+
+    def test_rebuild_ranks_works_borrowed_together(self):
+        self.borrow(0, 0, 1, 2)
+        self.borrow(1, 0, 1)
+        self.borrow(2, 0, 3)
+        self.assertEqual(recommendations.rebuild(), 8)
+        # Ties go to the lower work id.
+        self.assertEqual(_top(self.works[0]), [(self.works[1].id, 2), (self.works[2].id, 1)])
+        self.assertEqual(_top(self.works[3]), [(self.works[0].id, 1)])
+
+    def test_update_folds_in_new_loans_only(self):
+        self.borrow(0, 0, 1)
+        recommendations.rebuild()
+        self.assertEqual(recommendations.update(), 0)
+        self.borrow(1, 0, 1)
+        self.borrow(0, 2)
+        self.assertEqual(recommendations.update(), 6)
+        self.assertEqual(CoBorrowCount.objects.get(work=self.works[0], other=self.works[1]).count, 2)
+        self.assertEqual(CoBorrowCount.objects.get(work=self.works[2], other=self.works[0]).count, 1)
+        self.assertEqual(_top(self.works[0])[0], (self.works[1].id, 2))
+
+    def test_for_patron_skips_what_they_borrowed(self):
+        self.borrow(0, 0, 1, 2)
+        self.borrow(1, 2, 0)
+        recommendations.rebuild()
+        self.assertEqual([rec.recommended_id for rec in recommendations.for_patron(self.patrons[1])], [self.works[1].id])
+
+    def test_failed_rebuild_keeps_the_old_recommendations(self):
+        self.borrow(0, 0, 1)
+        recommendations.rebuild()
+        self.borrow(1, 0, 2)
+        with mock.patch.object(recommendations, '_store_top_k', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                recommendations.rebuild()
+        self.assertEqual(_top(self.works[0]), [(self.works[1].id, 1)])
+        self.assertEqual(WorkRecommendation.objects.count(), 2)
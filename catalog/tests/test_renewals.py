@@ -0,0 +1,68 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from ..models import ActivityLog, Checkout, Fine, Hold, Work
+from ..renewals import auto_renew
+from .helpers import make_copy, make_loan, make_patron, make_work
+
+class AutoRenewTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.patron = make_patron(1)
+        self.book = make_work()
+        self.dvd = Work.objects.create(title='Alien', author='Ridley Scott', media_type='dvd')
+        self.copies = iter(range(100))
+
+    def loan(self, work=None, due_in=timedelta(days=1), patron=None, **fields):
+        copy = make_copy(work or self.book, next(self.copies))
+        return make_loan(patron or self.patron, copy, due_date=self.now + due_in, **fields)
+
+    def renewed(self, loan):
+        before = loan.due_date
+        loan.refresh_from_db()
+        return loan.due_date != before
+
+    def test_loans_due_soon_get_a_fresh_loan_period(self):
+        book, dvd = self.loan(), self.loan(self.dvd)
+        self.assertEqual(auto_renew(now=self.now), {7: 1, 14: 0, 21: 1})
+        book.refresh_from_db()
+        dvd.refresh_from_db()
+        self.assertEqual((book.due_date, book.renewals), (self.now + timedelta(days=21), 1))
+        self.assertEqual((dvd.due_date, dvd.renewals), (self.now + timedelta(days=7), 1))
+        self.assertEqual(ActivityLog.objects.filter(action='renewal', patron=self.patron).count(), 2)
+
+    def test_loans_that_cannot_be_renewed_are_left(self):
+        other = make_patron(2)
+        waited_for = make_work('Dune', 'Frank Herbert')
+        Hold.objects.create(patron=other, work=waited_for)
+        fined = make_patron(3)
+        Fine.objects.create(patron=fined, amount='1.00', reason='Late')
+        suspended = make_patron(4)
+        suspended.status = 'suspended'
+        suspended.save()
+        loans = [
+            self.loan(waited_for),
+            self.loan(patron=fined),
+            self.loan(patron=suspended),
+            self.loan(renewals=2),
+            self.loan(due_in=timedelta(days=3)),
+            self.loan(due_in=-timedelta(hours=1)),
+            self.loan(returned_at=self.now),
+        ]
+        self.assertEqual(sum(auto_renew(now=self.now).values()), 0)
+        self.assertFalse([loan for loan in loans if self.renewed(loan)])
+
+    def test_every_loan_is_renewed_once_across_batches(self):
+        # The new due date still falls inside a 30-day window.
+        loans = [self.loan() for _ in range(5)]
+        self.assertEqual(auto_renew(now=self.now, days=30, batch_size=2)[21], 5)
+        self.assertEqual(list(Checkout.objects.filter(pk__in=[loan.pk for loan in loans]).values_list('renewals', flat=True)), [1] * 5)
+
+    def test_command_reports_the_totals(self):
+        self.loan()
+        out = StringIO()
+        call_command('auto_renew', stdout=out)
+        self.assertIn('21-day loans: 1 renewed', out.getvalue())
+        self.assertIn('Renewed 1 loans', out.getvalue())
@@ -0,0 +1,57 @@
+import csv
+from io import StringIO
+from unittest import mock
+from django.test import TestCase, override_settings
+from .. import roster
+from ..allocators import card_numbers
+from ..models import Patron
+from .helpers import make_patron
+
+def roster_file(*rows, header='name,email,pin'):
+    return StringIO('\n'.join([header, *rows]) + '\n')
+
+@override_settings(PATRON_PIN_ITERATIONS=1000)
+class RosterImportTests(TestCase):
+    def setUp(self):
+        make_patron(1)
+
+    def test_rows_are_imported_or_skipped_with_a_reason(self):
+        first = roster_file(
+            'Ada Lovelace,ada@example.com,1815',
+            'No Pin,nopin@example.com,',
+            'Bad Email,not-an-email,1234',
+            'Ada Again,ADA@example.com,1111',
+            'Taken,patron1@example.com,2222',
+        )
+        second = roster_file('Alan Turing,alan@example.com,1912')
+        report = StringIO()
+        counts, _ = roster.run([first, second], report, batch_size=2, workers=2)
+        self.assertEqual(dict(counts), {'imported': 2, 'exists': 1, 'duplicate': 1, 'invalid': 2})
+
+        rows = list(csv.DictReader(StringIO(report.getvalue())))
+        self.assertEqual([(row['line'], row['email'], row['result']) for row in rows], [
+            ('2', 'ada@example.com', 'imported'),
+            ('3', 'nopin@example.com', 'invalid'),
+            ('4', 'not-an-email', 'invalid'),
+            ('5', 'ADA@example.com', 'duplicate'),
+            ('6', 'patron1@example.com', 'exists'),
+            ('2', 'alan@example.com', 'imported'),
+        ])
+        ada = Patron.objects.get(email='ada@example.com')
+        self.assertEqual(rows[0]['card_number'], ada.card_number)
+        self.assertTrue(card_numbers.is_valid(ada.card_number))
+        self.assertTrue(ada.check_pin('1815'))
+        self.assertIsNotNone(ada.expires_at)
+        self.assertEqual(rows[1]['card_number'], '')
+
+    def test_missing_column_stops_before_anything_is_written(self):
+        with self.assertRaisesMessage(ValueError, 'missing column(s) pin'):
+            roster.run([roster_file('Ada,ada@example.com', header='name,email')])
+        self.assertEqual(Patron.objects.count(), 1)
+
+    def test_email_registered_during_the_import_is_reported(self):
+        # The email is free when the batch is checked and taken by insert time.
+        with mock.patch.object(roster, '_registered', side_effect=[set(), {'patron1@example.com'}]):
+            counts, _ = roster.run([roster_file('Taken,patron1@example.com,2222', 'Grace Hopper,grace@example.com,1906')])
+        self.assertEqual((counts['imported'], counts['exists']), (1, 1))
+        self.assertTrue(Patron.objects.filter(email='grace@example.com').exists())
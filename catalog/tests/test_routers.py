@@ -0,0 +1,72 @@
+from unittest import mock
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from .. import routers
+from ..models import Work
+
+router = routers.ReplicaRouter()
+
+# SimpleTestCase: TestCase holds every test in a transaction, and reads
+# inside one always stay on the primary.
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.chooser = mock.patch.object(routers, '_choose_replica', return_value='replica2')
+        self.choose = self.chooser.start()
+        self.addCleanup(self.chooser.stop)
+        routers._down_until.clear()
+
+    def through_middleware(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return routers.PrimaryPinMiddleware(routers.use_replica(view))(request)
+
+    def test_reads_outside_replica_views_use_the_primary(self):
+        self.assertIsNone(router.db_for_read(Work))
+
+    def test_one_replica_per_request(self):
+        aliases = []
+        def view(request):
+            aliases.extend(router.db_for_read(Work) for _ in range(3))
+            return HttpResponse()
+        response = self.through_middleware(view)
+        self.assertEqual(aliases, ['replica2'] * 3)
+        self.assertEqual(self.choose.call_count, 1)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_a_write_pins_the_browser_to_the_primary(self):
+        aliases = []
+        def view(request):
+            aliases.append(router.db_for_read(Work))
+            self.assertEqual(router.db_for_write(Work), 'default')
+            aliases.append(router.db_for_read(Work))
+            return HttpResponse()
+        response = self.through_middleware(view)
+        self.assertEqual(aliases, ['replica2', 'default'])
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 10)
+
+    def test_pinned_browser_reads_the_primary(self):
+        aliases = []
+        def view(request):
+            aliases.append(router.db_for_read(Work))
+            return HttpResponse()
+        self.through_middleware(view, cookies={routers.PIN_COOKIE: '1'})
+        self.assertEqual(aliases, ['default'])
+
+    def test_unreachable_replica_is_skipped_for_a_while(self):
+        self.chooser.stop()
+        broken, healthy = mock.Mock(), mock.Mock()
+        broken.ensure_connection.side_effect = DatabaseError('down')
+        connections = {'replica1': broken, 'replica2': healthy}
+        with mock.patch.object(routers, 'connections', connections), mock.patch.object(routers.random, 'shuffle'):
+            self.assertEqual(routers._choose_replica(), 'replica2')
+            self.assertEqual(routers._choose_replica(), 'replica2')
+            self.assertEqual(broken.ensure_connection.call_count, 1)
+            healthy.ensure_connection.side_effect = DatabaseError('down')
+            self.assertEqual(routers._choose_replica(), 'default')
+        self.chooser.start()
+
+    def test_replicas_get_no_migrations(self):
+        self.assertTrue(router.allow_migrate('default', 'catalog'))
+        self.assertFalse(router.allow_migrate('replica1', 'catalog'))
@@ -0,0 +1,68 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from .. import scans
+from ..models import Fine, Hold, MediaItem
+from .helpers import make_librarian, make_loan, make_patron, make_work, sign_in
+
+class ResolveTests(TestCase):
+    def setUp(self):
+        self.patron = make_patron(1)
+        self.work = make_work()
+        self.copy = MediaItem.objects.create(work=self.work, barcode='BC-000000001', location='Main Branch')
+
+    def test_kind_comes_from_the_format(self):
+        self.assertEqual(scans.kind_of(self.patron.card_number), 'patron')
+        self.assertEqual(scans.kind_of('BC-000000001'), 'item')
+        self.assertIsNone(scans.kind_of('hobbit'))
+        self.assertEqual(scans.resolve('hobbit'), (None, None))
+
+    def test_patron_with_totals_and_blocks(self):
+        make_loan(self.patron, self.copy, due_date=timezone.now() - timedelta(days=1))
+        Fine.objects.create(patron=self.patron, amount='2.50', reason='Late')
+        kind, payload = scans.resolve(self.patron.card_number)
+        self.assertEqual(kind, 'patron')
+        self.assertEqual(
+            {k: payload[k] for k in ('id', 'blocked', 'checked_out', 'overdue', 'fines')},
+            {'id': self.patron.pk, 'blocked': False, 'checked_out': 1, 'overdue': 1, 'fines': 2.5},
+        )
+        self.patron.expires_at = timezone.now() - timedelta(days=1)
+        self.patron.save()
+        self.assertEqual(scans.resolve(self.patron.card_number)[1]['blocks'], ['expired'])
+        self.patron.status = 'suspended'
+        self.patron.save()
+        self.assertEqual(scans.resolve(self.patron.card_number)[1]['blocks'], ['suspended'])
+
+    def test_item_with_its_loan_and_queue(self):
+        self.assertIsNone(scans.resolve('BC-000000001')[1]['loan'])
+        loan = make_loan(self.patron, self.copy)
+        Hold.objects.create(patron=make_patron(2), work=self.work)
+        kind, payload = scans.resolve('BC-000000001')
+        self.assertEqual(kind, 'item')
+        self.assertEqual((payload['status'], payload['title'], payload['pending_holds']), ('checked_out', 'The Hobbit', 1))
+        self.assertEqual((payload['loan']['id'], payload['loan']['card_number'], payload['loan']['overdue']), (loan.pk, self.patron.card_number, False))
+
+    def test_unknown_codes(self):
+        self.assertEqual(scans.resolve('LC-900099'), ('patron', None))
+        self.assertEqual(scans.resolve('BC-000000099'), ('item', None))
+        with self.assertRaises(MediaItem.DoesNotExist):
+            scans.find_item('BC-000000099')
+        self.assertEqual(scans.find_item('BC-000000001').work, self.work)
+
+class ScanApiTests(TestCase):
+    def setUp(self):
+        self.copy = MediaItem.objects.create(work=make_work(), barcode='BC-000000001')
+
+    def scan(self, code):
+        return self.client.get(reverse('scan_api'), {'code': code})
+
+    def test_needs_a_librarian(self):
+        self.assertRedirects(self.scan('BC-000000001'), reverse('login'), fetch_redirect_response=False)
+
+    def test_responses(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        self.assertEqual(self.scan(' BC-000000001 ').json()['id'], self.copy.pk)
+        self.assertEqual(self.scan('BC-000000099').status_code, 404)
+        self.assertEqual(self.scan('LC-900099').json(), {'error': 'No patron with this card number.'})
+        self.assertEqual(self.scan('hobbit').status_code, 400)
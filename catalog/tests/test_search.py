@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from ..models import Fine
+from .helpers import make_copy, make_librarian, make_loan, make_patron, make_work, sign_in
+
+@override_settings(CATALOG_SNAPSHOT_PATH='/nonexistent/catalog.sqlite3')
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hobbit = make_work()
+        self.dune = make_work('Dune', 'Frank Herbert')
+        self.copies = [make_copy(self.hobbit, 1), make_copy(self.hobbit, 2), make_copy(self.dune, 1)]
+        self.patron = make_patron(1)
+        make_loan(self.patron, self.copies[1])
+        Fine.objects.create(patron=self.patron, amount='2.25', reason='Overdue')
+        Fine.objects.create(patron=self.patron, amount='1.00', reason='Overdue', paid=True)
+
+    def test_items_api_lists_available_copies(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        response = self.client.get(reverse('search_items_api'), {'q': 'hobbit'})
+        self.assertEqual([item['id'] for item in response.json()], [self.copies[0].id])
+        self.assertEqual(response.json()[0]['title'], 'The Hobbit')
+
+    def test_patrons_api_counts_loans_and_unpaid_fines(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        response = self.client.get(reverse('search_patrons_api'), {'q': self.patron.card_number})
+        self.assertEqual(response.json(), [{
+            'id': self.patron.id, 'name': self.patron.name, 'card_number': self.patron.card_number,
+            'checked_out': 1, 'fines': 2.25,
+        }])
+
+    def test_patron_search_falls_back_to_the_database(self):
+        sign_in(self.client, 'patron', self.patron)
+        response = self.client.get(reverse('patron_search'), {'q': 'herbert', 'search_by': 'author'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([work.id for work in response.context['items']], [self.dune.id])
+        self.assertEqual(response.context['total_count'], 1)
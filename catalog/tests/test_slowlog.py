@@ -0,0 +1,63 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from .. import slowlog
+from ..models import Work
+from .helpers import make_librarian, make_work, sign_in
+
+class FingerprintTests(TestCase):
+    def test_literals_and_in_lists_are_normalized(self):
+        key, normalized = slowlog.fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b IN (1, 2,  3)\n AND c = %s")
+        self.assertEqual(normalized, 'SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ?')
+        self.assertEqual(key, slowlog.fingerprint('SELECT * FROM t WHERE a = %s AND b IN (%s) AND c = 7')[0])
+
+@override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_EXPLAIN_RATE=0)
+class RecordTests(TestCase):
+    def setUp(self):
+        slowlog.clear()
+        self.addCleanup(slowlog.clear)
+
+    def test_queries_over_the_threshold_are_grouped(self):
+        make_work()
+        slowlog.clear()
+        for pk in (1, 2, 3):
+            list(Work.objects.filter(pk=pk))
+        [entry] = [e for e in slowlog.slow_queries() if 'FROM "catalog_work"' in e['sql']]
+        self.assertEqual(entry['count'], 3)
+        self.assertAlmostEqual(entry['avg_ms'], entry['total_ms'] / 3)
+        self.assertEqual(entry['caller'].split(':')[0], 'catalog/tests/test_slowlog.py')
+        self.assertIsNone(entry['plan'])
+
+    @override_settings(SLOW_QUERY_MS=10000)
+    def test_fast_queries_are_ignored(self):
+        list(Work.objects.all())
+        self.assertEqual(slowlog.slow_queries(), [])
+
+    @override_settings(SLOW_QUERY_TOP_N=2)
+    def test_cheapest_fingerprint_is_dropped(self):
+        from django.db import connection
+        slowlog._record(connection, 'SELECT 1 FROM a', (), False, 5)
+        slowlog._record(connection, 'SELECT 1 FROM b', (), False, 50)
+        slowlog._record(connection, 'SELECT 1 FROM c', (), False, 1)
+        slowlog._record(connection, 'SELECT 1 FROM d', (), False, 20)
+        self.assertEqual([e['sql'] for e in slowlog.slow_queries()], ['SELECT ? FROM b', 'SELECT ? FROM d'])
+
+    def test_diagnostics_page_lists_and_clears(self):
+        sign_in(self.client, 'librarian', make_librarian())
+        list(Work.objects.filter(title='Dune'))
+        response = self.client.get(reverse('librarian_diagnostics'))
+        self.assertContains(response, 'catalog_work')
+        self.client.post(reverse('librarian_diagnostics'))
+        self.assertFalse([e for e in slowlog.slow_queries() if 'catalog_work' in e['sql']])
+
+# Plans are only taken outside transactions, which TestCase never is.
+@override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_EXPLAIN_RATE=1)
+class ExplainTests(TransactionTestCase):
+    def setUp(self):
+        slowlog.clear()
+        self.addCleanup(slowlog.clear)
+
+    def test_plan_is_captured_for_selects(self):
+        list(Work.objects.filter(title='Dune'))
+        [entry] = [e for e in slowlog.slow_queries() if 'FROM "catalog_work"' in e['sql']]
+        self.assertIn('catalog_work', entry['plan'])
+        self.assertFalse([e for e in slowlog.slow_queries() if e['sql'].startswith('EXPLAIN')])
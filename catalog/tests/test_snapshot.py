@@ -0,0 +1,68 @@
+import tempfile
+from pathlib import Path
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .. import snapshot
+from ..models import Work
+from .helpers import make_copy, make_loan, make_patron, make_work
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'catalog.sqlite3'
+        # Re-check the file on every read instead of once a second.
+        snapshot_settings = override_settings(CATALOG_SNAPSHOT_PATH=str(self.path), CATALOG_SNAPSHOT_CHECK_SECONDS=0)
+        snapshot_settings.enable()
+        self.addCleanup(snapshot_settings.disable)
+        self.addCleanup(snapshot._close)
+        snapshot._close()
+        self.hobbit = make_work()
+        self.copies = [make_copy(self.hobbit, 1), make_copy(self.hobbit, 2)]
+        make_loan(make_patron(1), self.copies[1])
+        self.dune = Work.objects.create(title='Dune', author='Frank Herbert', media_type='audiobook', isbn='9780441172719', genre='Science Fiction')
+        self.eeyore = make_work('Éeyore Returns', 'A. A. Milne')
+
+    def test_latest_carries_copy_counts(self):
+        self.assertEqual(snapshot.publish(), 3)
+        works = snapshot.latest(2)
+        self.assertEqual([work.pk for work in works], [self.hobbit.pk, self.dune.pk])
+        self.assertEqual((works[0].title, works[0].copies_count, works[0].available_copies), ('The Hobbit', 2, 1))
+
+    def test_search(self):
+        snapshot.publish()
+        def titles(*args, **kwargs):
+            works, total = snapshot.search(*args, **kwargs)
+            self.assertEqual(total, len(works))
+            return [work.title for work in works]
+        self.assertEqual(titles('hob'), ['The Hobbit'])
+        self.assertEqual(titles('herb', search_by='author'), ['Dune'])
+        self.assertEqual(titles('herb', search_by='title'), [])
+        self.assertEqual(titles('eeyore'), ['Éeyore Returns'])
+        self.assertEqual(titles('0441172', search_by='isbn'), ['Dune'])
+        self.assertEqual(titles(media_type='book'), ['The Hobbit', 'Éeyore Returns'])
+        self.assertEqual(titles(genre='fiction'), ['Dune'])
+        self.assertEqual(snapshot.search('!!'), ([], 0))
+
+    def test_a_new_publish_is_picked_up(self):
+        snapshot.publish()
+        make_work('Piranesi', 'Susanna Clarke')
+        self.assertEqual(snapshot.search('piranesi')[1], 0)
+        snapshot.publish()
+        self.assertEqual(snapshot.search('piranesi')[1], 1)
+
+    def test_missing_stale_or_broken_snapshot_falls_back(self):
+        self.assertIsNone(snapshot.latest(5))
+        snapshot.publish()
+        with override_settings(CATALOG_SNAPSHOT_MAX_AGE=-1):
+            self.assertIsNone(snapshot.latest(5))
+            self.assertIsNone(snapshot.search('hobbit'))
+        self.path.write_bytes(b'not a database')
+        self.assertIsNone(snapshot.latest(5))
+
+    def test_home_page_reads_the_snapshot_until_it_goes_away(self):
+        snapshot.publish()
+        make_work('Piranesi', 'Susanna Clarke')
+        self.assertNotContains(self.client.get(reverse('index')), 'Piranesi')
+        self.path.unlink()
+        self.assertContains(self.client.get(reverse('index')), 'Piranesi')
@@ -0,0 +1,69 @@
+import time
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from .. import throttle
+
+@throttle.throttle('test')
+def throttled_view(request):
+    return HttpResponse('ok')
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={'test': (1, 2)},
+    THROTTLE_CONCURRENCY={'test': 1},
+    THROTTLE_MAX_QUEUE_SECONDS=2,
+    THROTTLE_TRUSTED_PROXIES=0,
+)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def get(self, session=None, **headers):
+        request = self.factory.get('/', **headers)
+        request.session = session or {}
+        return throttled_view(request)
+
+    def test_over_the_rate_is_429(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 200)
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_buckets_are_per_caller(self):
+        for _ in range(3):
+            self.get()
+        self.assertEqual(self.get(REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.get(session={'patron_id': 1}).status_code, 200)
+
+    def test_forwarded_client_ip_behind_trusted_proxy(self):
+        for _ in range(3):
+            self.get(HTTP_X_FORWARDED_FOR='10.0.0.5')
+        self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='10.0.0.6').status_code, 429)
+        with override_settings(THROTTLE_TRUSTED_PROXIES=1):
+            self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='10.0.0.6').status_code, 200)
+            # A client cannot pick its own address by prepending one.
+            self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='10.0.0.7, 10.0.0.6').status_code, 200)
+            self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='10.0.0.8, 10.0.0.6').status_code, 429)
+
+    def test_request_queued_too_long_is_shed(self):
+        response = self.get(HTTP_X_REQUEST_START=f't={time.time() - 10:.3f}')
+        self.assertEqual(response.status_code, 503)
+        # Shedding happens before the bucket is charged.
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_full_scope_is_503(self):
+        slot = throttle._slot('test')
+        slot.acquire()
+        try:
+            self.assertEqual(self.get().status_code, 503)
+        finally:
+            slot.release()
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_disabled(self):
+        with override_settings(THROTTLE_ENABLED=False):
+            self.assertTrue(all(self.get().status_code == 200 for _ in range(5)))
@@ -0,0 +1,59 @@
+from django.test import TestCase
+from .. import triage
+from ..models import ActivityLog, MediaRequest, Notification, Work
+from .helpers import make_librarian, make_patron, make_work
+
+class TriageTests(TestCase):
+    def setUp(self):
+        self.librarian = make_librarian('staff')
+        self.patrons = [make_patron(n) for n in range(3)]
+        self.requests = [
+            MediaRequest.objects.create(patron=self.patrons[0], title='Hunger', author='Roxane Gay', media_type='book'),
+            MediaRequest.objects.create(patron=self.patrons[1], title='hunger!', media_type='book', notify_when_available=False),
+        ]
+        self.other = MediaRequest.objects.create(patron=self.patrons[2], title='Piranesi', media_type='book')
+
+    def test_clusters_group_requests_by_title(self):
+        clusters = {cluster['normalized_title']: cluster for cluster in triage.demand_clusters()}
+        self.assertEqual((clusters['hunger']['requests'], clusters['hunger']['patrons']), (2, 2))
+        self.assertEqual(clusters['piranesi']['requests'], 1)
+
+    def test_approve_cluster(self):
+        self.assertEqual(triage.review_cluster('hunger', 'approved', self.librarian), 2)
+        self.assertEqual(
+            set(MediaRequest.objects.filter(normalized_title='hunger').values_list('status', 'reviewed_by')),
+            {('approved', self.librarian.id)},
+        )
+        self.assertEqual(ActivityLog.objects.filter(action='request_approved').count(), 2)
+        # Only the patron who asked to be told gets a notice.
+        self.assertEqual(list(Notification.objects.values_list('patron_id', 'kind')), [(self.patrons[0].id, 'request_approved')])
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.status, 'pending')
+
+    def test_reject_cluster(self):
+        self.assertEqual(triage.review_cluster('hunger', 'rejected', self.librarian), 2)
+        self.assertEqual(set(MediaRequest.objects.filter(normalized_title='hunger').values_list('status', flat=True)), {'rejected'})
+        self.assertEqual(ActivityLog.objects.filter(action='request_rejected').count(), 2)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_reviewed_cluster_is_not_reviewed_again(self):
+        triage.review_cluster('hunger', 'rejected', self.librarian)
+        self.assertEqual(triage.review_cluster('hunger', 'approved', self.librarian), 0)
+        self.assertFalse(MediaRequest.objects.filter(status='approved').exists())
+
+    def test_match_work_checks_author(self):
+        work = make_work('Hunger', 'Knut Hamsun')
+        self.assertIsNone(triage.match_work('Hunger', 'Roxane Gay'))
+        self.assertEqual(triage.match_work('hunger', 'knut hamsun'), work)
+        self.assertEqual(triage.match_work('The Hunger'), work)
+
+    def test_match_work_forgives_punctuation_and_typos_in_the_author(self):
+        work = Work.objects.create(title='Green Eggs and Ham', author='Dr Suess', media_type='audiobook')
+        self.assertEqual(triage.match_work('Green Eggs and Ham', 'Dr. Seuss', media_type='book'), work)
+        self.assertEqual(triage.match_work('green eggs and ham!', 'DR  SUESS'), work)
+        self.assertIsNone(triage.match_work('Green Eggs and Ham', 'Stephen Fry'))
+
+    def test_match_work_prefers_the_requested_format(self):
+        make_work('Dune', 'Frank Herbert')
+        audiobook = Work.objects.create(title='Dune', author='Frank Herbert', media_type='audiobook')
+        self.assertEqual(triage.match_work('Dune', 'Frank Herbert', media_type='audiobook'), audiobook)
@@ -0,0 +1,101 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from ..circulation import check_in, check_out, fill_hold
+from ..models import Hold, Notification
+from .helpers import make_copy, make_loan, make_patron, make_work
+
+class HoldQueueTests(TestCase):
+    def setUp(self):
+        self.work = make_work()
+        self.copies = [make_copy(self.work, n) for n in range(2)]
+        self.borrower = make_patron(0)
+        for copy in self.copies:
+            make_loan(self.borrower, copy)
+        self.holds = [Hold.objects.create(patron=make_patron(n + 1), work=self.work, queue_position=n + 1) for n in range(3)]
+
+    def state(self):
+        return [(hold.status, hold.queue_position, hold.media_item_id) for hold in Hold.objects.order_by('id')]
+
+    def test_each_returned_copy_fills_the_next_hold(self):
+        check_in(self.copies[1])
+        check_in(self.copies[0])
+        self.assertEqual([status for status, _, _ in self.state()], ['ready', 'ready', 'pending'])
+        self.assertEqual(self.state()[0][2], self.copies[1].id)
+        self.assertEqual(self.state()[1][2], self.copies[0].id)
+        self.assertEqual(self.state()[2][:2], ('pending', 1))
+        self.assertEqual(Notification.objects.filter(kind='hold_ready').count(), 2)
+
+    def test_deleted_patrons_are_passed_over(self):
+        self.holds[0].patron.soft_delete()
+        self.assertEqual(fill_hold(self.copies[0]), self.holds[1])
+
+    def test_no_pending_hold_leaves_the_copy_available(self):
+        Hold.objects.update(status='cancelled')
+        checkout, _ = check_in(self.copies[0])
+        self.copies[0].refresh_from_db()
+        self.assertEqual(self.copies[0].status, 'available')
+        self.assertIsNotNone(checkout.returned_at)
+
+    def test_any_copy_satisfies_a_pending_hold(self):
+        copy = make_copy(self.work, 9)
+        self.assertIsNotNone(check_out(self.holds[1].patron, copy))
+        self.assertEqual(self.state(), [('pending', 1, None), ('picked_up', 2, copy.id), ('pending', 2, None)])
+
+    def test_copy_set_aside_goes_only_to_its_patron(self):
+        check_in(self.copies[0])
+        self.assertIsNone(check_out(self.holds[1].patron, self.copies[0]))
+        self.assertIsNotNone(check_out(self.holds[0].patron, self.copies[0]))
+
+class SplitWorksMigrationTests(TransactionTestCase):
+    before = [('catalog', '0006_work')]
+    after = [('catalog', '0008_work_copies')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes('catalog')
+        executor.migrate(self.before)
+        self.old_apps = executor.loader.project_state(self.before).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.latest)
+
+    def test_copies_are_grouped_into_works_and_holds_requeue(self):
+        Patron = self.old_apps.get_model('catalog', 'Patron')
+        MediaItem = self.old_apps.get_model('catalog', 'MediaItem')
+        Hold = self.old_apps.get_model('catalog', 'Hold')
+        patrons = [Patron.objects.create(name=f'P{n}', email=f'p{n}@example.com', card_number=f'LC-90000{n}', pin_hash='-') for n in range(3)]
+        hobbit = [
+            MediaItem.objects.create(barcode=f'H{n}', title='The Hobbit', author='J.R.R. Tolkien', media_type='book')
+            for n in range(2)
+        ]
+        # Same ISBN, different spelling of the title.
+        MediaItem.objects.create(barcode='D1', title='Dune', author='Frank Herbert', media_type='book', isbn='9780441013593')
+        MediaItem.objects.create(barcode='D2', title='DUNE', author='F. Herbert', media_type='book', isbn='9780441013593')
+        MediaItem.objects.create(barcode='A1', title='The Hobbit', author='J.R.R. Tolkien', media_type='audiobook')
+        now = timezone.now()
+        holds = [
+            Hold.objects.create(patron=patrons[0], media_item=hobbit[1], queue_position=1),
+            Hold.objects.create(patron=patrons[1], media_item=hobbit[0], queue_position=1),
+        ]
+        Hold.objects.filter(pk=holds[0].pk).update(placed_at=now)
+        Hold.objects.filter(pk=holds[1].pk).update(placed_at=now.replace(year=now.year - 1))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        new_apps = executor.loader.project_state(self.after).apps
+        MediaItem = new_apps.get_model('catalog', 'MediaItem')
+        Hold = new_apps.get_model('catalog', 'Hold')
+        Work = new_apps.get_model('catalog', 'Work')
+
+        work_of = dict(MediaItem.objects.values_list('barcode', 'work_id'))
+        self.assertEqual(work_of['H0'], work_of['H1'])
+        self.assertEqual(work_of['D1'], work_of['D2'])
+        self.assertEqual(len({work_of['H0'], work_of['D1'], work_of['A1']}), 3)
+        self.assertEqual(Work.objects.count(), 3)
+        self.assertEqual(Work.objects.get(pk=work_of['A1']).media_type, 'audiobook')
+        queue = list(Hold.objects.order_by('queue_position').values_list('patron_id', 'work_id', 'media_item_id', 'queue_position'))
+        self.assertEqual(queue, [(patrons[1].pk, work_of['H0'], None, 1), (patrons[0].pk, work_of['H0'], None, 2)])
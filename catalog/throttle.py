@@ -0,0 +1,177 @@
+import math
+import threading
+import time
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from . import metrics
+
+# Throttling for the search and read API endpoints. A request passes three
+# checks, cheapest first:
+#
+# 1. Load shedding: if the proxy says the request already waited longer than
+#    THROTTLE_MAX_QUEUE_SECONDS for a worker (X-Request-Start), the client
+#    has likely given up and the workers are saturated, so it gets a 503
+#    without touching the database.
+# 2. A token bucket per caller and scope in the shared cache: THROTTLE_RATES
+#    gives (tokens per second, burst). Callers are the signed-in patron or
+#    librarian, otherwise the client IP. Over the limit is a 429. With the
+#    default local-memory cache each process keeps its own buckets, so a
+#    caller gets the rate once per worker; set REDIS_URL to share them.
+# 3. A cap on requests of the scope running at once in this process
+#    (THROTTLE_CONCURRENCY). A full scope answers 503 right away instead of
+#    queueing more icontains scans behind the ones already running.
+#
+# Every decision is counted in throttle_decisions_total.
+
+_lock = threading.Lock()
+_slots = {}
+
+def queue_seconds(request):
+    # X-Request-Start as set by nginx ("t=<seconds>") or by routers that
+    # send milliseconds or microseconds since the epoch.
+    header = request.headers.get('X-Request-Start', '')
+    try:
+        started = float(header.removeprefix('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(time.time() - started, 0.0)
+
+def client_ip(request):
+    # Behind THROTTLE_TRUSTED_PROXIES proxies the peer address is the last
+    # proxy's; each proxy appends the address it got the request from to
+    # X-Forwarded-For, so the client is that many entries from the right.
+    # Entries further left are whatever the client sent and are ignored.
+    proxies = settings.THROTTLE_TRUSTED_PROXIES
+    forwarded = [a.strip() for a in request.headers.get('X-Forwarded-For', '').split(',') if a.strip()]
+    if proxies and forwarded:
+        return forwarded[-min(proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+def _caller(request, principal):
+    if principal:
+        return principal
+    return 'ip:' + client_ip(request)
+
+def _principal(session):
+    for kind in ('librarian', 'patron'):
+        principal_id = session.get(f'{kind}_id')
+        if principal_id:
+            return f'{kind}:{principal_id}'
+    return None
+
+async def _aprincipal(session):
+    for kind in ('librarian', 'patron'):
+        principal_id = await session.aget(f'{kind}_id')
+        if principal_id:
+            return f'{kind}:{principal_id}'
+    return None
+
+def _take(arrival, now, rate, burst):
+    # GCRA form of a token bucket: the cache stores when the bucket will be
+    # full again, so one value per caller is enough. Returns the new value
+    # to store (None when refused) and seconds until a token is free. Two
+    # requests of one caller racing on the same value may both pass, which
+    # lets a burst through slightly early but never refuses anyone wrongly.
+    interval = 1.0 / rate
+    arrival = max(arrival or now, now) + interval
+    wait = arrival - now - burst * interval
+    if wait > 0:
+        return None, wait
+    return arrival, 0
+
+def _bucket_key(scope, caller):
+    return f'throttle:{scope}:{caller}'
+
+def _slot(scope):
+    limit = settings.THROTTLE_CONCURRENCY.get(scope)
+    if not limit:
+        return None
+    with _lock:
+        if scope not in _slots:
+            _slots[scope] = threading.BoundedSemaphore(limit)
+        return _slots[scope]
+
+def _refuse(scope, decision, status, message, retry_after):
+    metrics.inc('throttle_decisions_total', scope=scope, decision=decision)
+    response = JsonResponse({'error': message}, status=status)
+    response['Retry-After'] = str(max(math.ceil(retry_after), 1))
+    return response
+
+def _shed(request, scope):
+    waited = queue_seconds(request)
+    if waited is None:
+        return None
+    metrics.observe('request_queue_seconds', waited, scope=scope)
+    if waited > settings.THROTTLE_MAX_QUEUE_SECONDS:
+        return _refuse(scope, 'shed', 503, 'The catalog is busy. Please try again shortly.', 1)
+    return None
+
+def _limit(scope, arrival, now, rate, burst):
+    # Returns (value to store, refusal response).
+    stored, wait = _take(arrival, now, rate, burst)
+    if stored is None:
+        return None, _refuse(scope, 'limited', 429, 'Too many requests. Please slow down.', wait)
+    return stored, None
+
+def throttle(scope):
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if not settings.THROTTLE_ENABLED:
+                    return await view_func(request, *args, **kwargs)
+                refused = _shed(request, scope)
+                if refused:
+                    return refused
+                if scope in settings.THROTTLE_RATES:
+                    rate, burst = settings.THROTTLE_RATES[scope]
+                    key = _bucket_key(scope, _caller(request, await _aprincipal(request.session)))
+                    now = time.time()
+                    stored, refused = _limit(scope, await cache.aget(key), now, rate, burst)
+                    if refused:
+                        return refused
+                    await cache.aset(key, stored, timeout=math.ceil(stored - now) + 1)
+                slot = _slot(scope)
+                if slot and not slot.acquire(blocking=False):
+                    return _refuse(scope, 'busy', 503, 'The catalog is busy. Please try again shortly.', 1)
+                metrics.inc('throttle_decisions_total', scope=scope, decision='allowed')
+                try:
+                    return await view_func(request, *args, **kwargs)
+                finally:
+                    if slot:
+                        slot.release()
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not settings.THROTTLE_ENABLED:
+                return view_func(request, *args, **kwargs)
+            refused = _shed(request, scope)
+            if refused:
+                return refused
+            if scope in settings.THROTTLE_RATES:
+                rate, burst = settings.THROTTLE_RATES[scope]
+                key = _bucket_key(scope, _caller(request, _principal(request.session)))
+                now = time.time()
+                stored, refused = _limit(scope, cache.get(key), now, rate, burst)
+                if refused:
+                    return refused
+                cache.set(key, stored, timeout=math.ceil(stored - now) + 1)
+            slot = _slot(scope)
+            if slot and not slot.acquire(blocking=False):
+                return _refuse(scope, 'busy', 503, 'The catalog is busy. Please try again shortly.', 1)
+            metrics.inc('throttle_decisions_total', scope=scope, decision='allowed')
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                if slot:
+                    slot.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,85 @@
+from difflib import SequenceMatcher
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from .events import broker
+from .models import Work, MediaRequest, ActivityLog, normalize_isbn, normalize_title
+from .notifications import enqueue, request_approved_notice
+
+# Purchase-request triage. Requests carry a normalized title (and optional
+# ISBN) so a new request can be matched against the catalog through an index,
+# and pending requests for the same title are reviewed together as one
+# demand cluster instead of one row per patron.
+
+AUTHOR_MATCH_RATIO = 0.8
+
+def _same_author(stored, requested):
+    # Folded like titles, so "Dr. Seuss" and "dr  seuss" are equal, and a
+    # near miss ("Dr Suess") still counts; another name does not.
+    stored, requested = normalize_title(stored), normalize_title(requested)
+    return stored == requested or SequenceMatcher(None, stored, requested).ratio() >= AUTHOR_MATCH_RATIO
+
+def match_work(title, author='', isbn='', media_type=''):
+    isbn = normalize_isbn(isbn)
+    if isbn:
+        work = Work.objects.filter(isbn=isbn).first()
+        if work:
+            return work
+    # Same title by another author is a different work.
+    matches = list(Work.objects.filter(normalized_title=normalize_title(title)).order_by('id')[:50])
+    if author.strip():
+        matches = [work for work in matches if _same_author(work.author, author)]
+    # The requested format first, but the title in another format is still
+    # worth suggesting before a purchase request.
+    matches.sort(key=lambda work: work.media_type != media_type)
+    return matches[0] if matches else None
+
+def demand_clusters(limit=50):
+    clusters = list(
+        MediaRequest.objects.filter(status='pending').values('normalized_title').annotate(
+            requests=Count('id'),
+            patrons=Count('patron', distinct=True),
+            wants_notice=Count('id', filter=Q(notify_when_available=True)),
+            display_title=Min('title'),
+            display_author=Max('author'),
+            display_isbn=Max('isbn'),
+            first_requested=Min('requested_at'),
+            last_requested=Max('requested_at'),
+        ).order_by('-requests', 'first_requested')[:limit]
+    )
+    # Titles added to the catalog since they were requested.
+    in_catalog = dict(
+        Work.objects.filter(normalized_title__in=[c['normalized_title'] for c in clusters]).values_list('normalized_title', 'id')
+    )
+    for cluster in clusters:
+        cluster['work_id'] = in_catalog.get(cluster['normalized_title'])
+    return clusters
+
+def review_cluster(normalized_title, status, librarian):
+    # Approves or rejects every pending request for a title in one
+    # transaction. Returns the number of requests reviewed.
+    verb = 'Approved' if status == 'approved' else 'Rejected'
+    with transaction.atomic():
+        media_requests = list(
+            MediaRequest.objects.select_for_update().filter(status='pending', normalized_title=normalized_title)
+            .only('id', 'patron_id', 'title', 'notify_when_available')
+        )
+        if not media_requests:
+            return 0
+        MediaRequest.objects.filter(id__in=[r.id for r in media_requests]).update(
+            status=status, reviewed_at=timezone.now(), reviewed_by=librarian
+        )
+        ActivityLog.objects.bulk_create([
+            ActivityLog(
+                action=f'request_{status}',
+                patron_id=media_request.patron_id,
+                librarian=librarian,
+                description=f'{verb} request for "{media_request.title}"',
+            ) for media_request in media_requests
+        ])
+        if status == 'approved':
+            enqueue(*[request_approved_notice(r) for r in media_requests if r.notify_when_available])
+        broker.publish_on_commit('request_reviewed', {'deltas': {
+            'pending_requests': -len(media_requests), f'{status}_requests': len(media_requests),
+        }})
+    return len(media_requests)
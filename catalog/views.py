@@ -1,44 +1,115 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q
+from django.db import DatabaseError, transaction
+from django.db.models import F, Q
 from datetime import timedelta
+from urllib.parse import urlencode
+import asyncio
 from functools import wraps
-from .models import Patron, Librarian, MediaItem, Checkout, Hold, MediaRequest, Fine, ActivityLog
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from .models import Patron, Librarian, Work, MediaItem, Checkout, Hold, MediaRequest, Fine, ActivityLog, Notification, PurgeJob, normalize_isbn, normalize_title
+from .principals import PRINCIPAL_MODELS, get_principal, aget_principal, cache_principal
+from .login import verify_credentials, LoginBusy
+from .allocators import barcodes, card_numbers
+from .events import broker, format_event, live_counters
+from .circulation import check_out, check_in, fill_hold, receive_transit
+from .notifications import enqueue, request_approved_notice, request_available_notice
+from .analytics import daily_metrics
+from .triage import match_work, demand_clusters, review_cluster
+from . import journal, metrics, pull_list, recommendations, scans, slowlog, snapshot
+from .routers import use_replica
+from .throttle import throttle
 
-def patron_required(view_func):
+def _is_fragment(request):
+    # Set by htmx on the in-page actions, which only want the changed row
+    # back instead of a redirect to the whole page.
+    return request.headers.get('HX-Request') == 'true'
+
+def _login_redirect(request):
+    messages.error(request, 'Please login to access this page.')
+    if _is_fragment(request):
+        # A redirect would be followed and the login page swapped into the row.
+        response = HttpResponse()
+        response['HX-Redirect'] = reverse('login')
+        return response
+    return redirect('login')
+
+def _principal_required(kind, view_func, offline=False):
+    # Attaches request.patron / request.librarian from the principal cache.
+    # Async views get an async wrapper so the session and cache are read
+    # without leaving the event loop.
+    session_key = f'{kind}_id'
+    
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            principal_id = await request.session.aget(session_key)
+            if principal_id is None:
+                return _login_redirect(request)
+            principal = await aget_principal(kind, principal_id)
+            if principal is None:
+                await request.session.aflush()
+                return _login_redirect(request)
+            setattr(request, kind, principal)
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+    
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        if 'patron_id' not in request.session:
-            messages.error(request, 'Please login to access this page.')
-            return redirect('login')
+        if session_key not in request.session:
+            return _login_redirect(request)
+        try:
+            principal = get_principal(kind, request.session[session_key])
+        except DatabaseError:
+            if not offline:
+                raise
+            # The offline journal only needs the id from the session, so
+            # a stand-in keeps the desk working while the row can't be read.
+            principal = PRINCIPAL_MODELS[kind](pk=request.session[session_key])
+        if principal is None:
+            request.session.flush()
+            return _login_redirect(request)
+        setattr(request, kind, principal)
         return view_func(request, *args, **kwargs)
     return wrapper
 
+def patron_required(view_func):
+    return _principal_required('patron', view_func)
+
 def librarian_required(view_func):
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        if 'librarian_id' not in request.session:
-            messages.error(request, 'Please login to access this page.')
-            return redirect('login')
-        return view_func(request, *args, **kwargs)
-    return wrapper
+    return _principal_required('librarian', view_func)
+
+def desk_required(view_func):
+    # Check-in and checkout, which fall back to the offline journal when
+    # the database is down (see catalog/journal.py).
+    return _principal_required('librarian', view_func, offline=True)
 
 def index(request):
-    media_items = MediaItem.objects.all()[:15]
+    media_items = snapshot.latest(15)
+    if media_items is None:
+        media_items = Work.objects.with_availability().order_by('id')[:15]
     return render(request, 'main/index.html', {'media_items': media_items})
 
 def login_view(request):
+    status = 200
     if request.method == 'POST':
         user_type = request.POST.get('user_type')
         
         if user_type == 'patron':
             card_number = request.POST.get('card_number')
             pin = request.POST.get('pin')
+            if not card_numbers.is_valid(card_number):
+                messages.error(request, 'Library card not found.')
+                return render(request, 'main/login.html')
             try:
                 patron = Patron.objects.get(card_number=card_number)
-                if patron.check_pin(pin):
+                if verify_credentials(patron, pin):
+                    cache_principal('patron', patron)
                     request.session['patron_id'] = patron.id
                     request.session['user_type'] = 'patron'
                     messages.success(request, f'Welcome back, {patron.name}!')
@@ -47,13 +118,17 @@ def login_view(request):
                     messages.error(request, 'Invalid PIN.')
             except Patron.DoesNotExist:
                 messages.error(request, 'Library card not found.')
+            except LoginBusy:
+                messages.error(request, 'Too many sign-ins right now. Please try again in a moment.')
+                status = 503
         
         elif user_type == 'librarian':
             username = request.POST.get('username')
             password = request.POST.get('password')
             try:
                 librarian = Librarian.objects.get(username=username)
-                if librarian.check_password(password):
+                if verify_credentials(librarian, password):
+                    cache_principal('librarian', librarian)
                     request.session['librarian_id'] = librarian.id
                     request.session['user_type'] = 'librarian'
                     messages.success(request, f'Welcome back, {librarian.username}!')
@@ -62,8 +137,11 @@ def login_view(request):
                     messages.error(request, 'Invalid password.')
             except Librarian.DoesNotExist:
                 messages.error(request, 'Username not found.')
+            except LoginBusy:
+                messages.error(request, 'Too many sign-ins right now. Please try again in a moment.')
+                status = 503
     
-    return render(request, 'main/login.html')
+    return render(request, 'main/login.html', status=status)
 
 def logout_view(request):
     request.session.flush()
@@ -124,8 +202,9 @@ def librarian_signup(request):
     return render(request, 'main/librarian-signup.html')
 
 @patron_required
+@use_replica
 def patron_dashboard(request):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
+    patron = request.patron
     checkouts = Checkout.objects.filter(patron=patron, returned_at__isnull=True)
     holds = Hold.objects.filter(patron=patron, status__in=['pending', 'ready', 'in_transit'])
     fines = Fine.objects.filter(patron=patron, paid=False)
@@ -147,14 +226,36 @@ def patron_dashboard(request):
     })
 
 @patron_required
-def patron_search(request):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
+@use_replica
+async def patron_search(request):
+    patron = request.patron
     query = request.GET.get('q', '')
     media_type = request.GET.get('type', '')
     genre = request.GET.get('genre', '')
     search_by = request.GET.get('search_by', 'title')
     
-    items = MediaItem.objects.all()
+    # The published snapshot answers without touching the database; the
+    # query below is the fallback when it is missing or too old.
+    found = await sync_to_async(snapshot.search, thread_sensitive=False)(query, search_by, media_type, genre, 24)
+    if found is not None:
+        items, total_count = found
+    else:
+        items, total_count = await _search_works(query, search_by, media_type, genre, 24)
+    
+    return render(request, 'patron/patron-search.html', {
+        'patron': patron,
+        'items': items,
+        'query': query,
+        'media_type': media_type,
+        'genre': genre,
+        'search_by': search_by,
+        'total_count': total_count,
+        'recommendations': [rec async for rec in recommendations.for_patron(patron)],
+    })
+
+async def _search_works(query, search_by, media_type, genre, limit):
+    # One result per work, with copy availability counted in the same query.
+    items = Work.objects.with_availability().order_by('title', 'id')
     
     if query:
         if search_by == 'title':
@@ -174,20 +275,26 @@ def patron_search(request):
     if genre:
         items = items.filter(genre__icontains=genre)
     
-    return render(request, 'patron/patron-search.html', {
+    return [item async for item in items[:limit]], await items.acount()
+
+@patron_required
+@use_replica
+def patron_work_detail(request, work_id):
+    patron = request.patron
+    work = get_object_or_404(Work.objects.with_availability(), id=work_id)
+    
+    return render(request, 'patron/patron-work.html', {
         'patron': patron,
-        'items': items[:24],
-        'query': query,
-        'media_type': media_type,
-        'genre': genre,
-        'search_by': search_by,
-        'total_count': items.count(),
+        'work': work,
+        'copies': work.copies.order_by('location', 'barcode'),
+        'pending_holds': Hold.objects.filter(work=work, status='pending').count(),
+        'recommendations': recommendations.for_work(work.id),
     })
 
 @patron_required
 def patron_checked_out(request):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
-    checkouts = Checkout.objects.filter(patron=patron, returned_at__isnull=True).select_related('media_item')
+    patron = request.patron
+    checkouts = Checkout.objects.filter(patron=patron, returned_at__isnull=True).select_related('media_item__work')
     
     due_soon = [c for c in checkouts if 0 < c.days_until_due() <= 3]
     
@@ -199,8 +306,8 @@ def patron_checked_out(request):
 
 @patron_required
 def patron_renew(request, checkout_id):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
-    checkout = get_object_or_404(Checkout, id=checkout_id, patron=patron)
+    patron = request.patron
+    checkout = get_object_or_404(Checkout.objects.select_related('media_item__work'), id=checkout_id, patron=patron)
     
     if checkout.renew():
         ActivityLog.objects.create(
@@ -213,13 +320,15 @@ def patron_renew(request, checkout_id):
     else:
         messages.error(request, 'Cannot renew this item.')
     
+    if _is_fragment(request):
+        return render(request, 'patron/partials/checkout-row.html', {'checkout': checkout, 'fragment': True})
     return redirect('patron_checked_out')
 
 @patron_required
 def patron_holds(request):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
-    active_holds = Hold.objects.filter(patron=patron, status__in=['pending', 'ready', 'in_transit']).select_related('media_item')
-    hold_history = Hold.objects.filter(patron=patron, status__in=['picked_up', 'cancelled', 'expired']).select_related('media_item')[:10]
+    patron = request.patron
+    active_holds = Hold.objects.filter(patron=patron, status__in=['pending', 'ready', 'in_transit']).select_related('work', 'media_item')
+    hold_history = Hold.objects.filter(patron=patron, status__in=['picked_up', 'cancelled', 'expired']).select_related('work')[:10]
     
     return render(request, 'patron/patron-holds.html', {
         'patron': patron,
@@ -228,37 +337,41 @@ def patron_holds(request):
     })
 
 @patron_required
-def patron_place_hold(request, item_id):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
-    media_item = get_object_or_404(MediaItem, id=item_id)
+def patron_place_hold(request, work_id):
+    # Holds are on the title; the first copy returned goes to the queue head.
+    patron = request.patron
+    work = get_object_or_404(Work, id=work_id)
     
-    existing_hold = Hold.objects.filter(patron=patron, media_item=media_item, status__in=['pending', 'ready', 'in_transit']).exists()
+    existing_hold = Hold.objects.filter(patron=patron, work=work, status__in=['pending', 'ready', 'in_transit']).exists()
     if existing_hold:
-        messages.error(request, 'You already have a hold on this item.')
+        messages.error(request, 'You already have a hold on this title.')
+        if _is_fragment(request):
+            return render(request, 'patron/partials/hold-button.html', {'work': work, 'fragment': True})
         return redirect('patron_search')
     
-    queue_position = Hold.objects.filter(media_item=media_item, status='pending').count() + 1
+    queue_position = Hold.objects.filter(work=work, status='pending').count() + 1
     
     hold = Hold.objects.create(
         patron=patron,
-        media_item=media_item,
+        work=work,
         queue_position=queue_position
     )
     
     ActivityLog.objects.create(
         action='hold_placed',
         patron=patron,
-        media_item=media_item,
-        description=f'Placed hold on "{media_item.title}"'
+        description=f'Placed hold on "{work.title}"'
     )
     
-    messages.success(request, f'Hold placed on "{media_item.title}". You are #{queue_position} in queue.')
+    messages.success(request, f'Hold placed on "{work.title}". You are #{queue_position} in queue.')
+    if _is_fragment(request):
+        return render(request, 'patron/partials/hold-button.html', {'work': work, 'hold': hold, 'fragment': True})
     return redirect('patron_holds')
 
 @patron_required
 def patron_cancel_hold(request, hold_id):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
-    hold = get_object_or_404(Hold, id=hold_id, patron=patron)
+    patron = request.patron
+    hold = get_object_or_404(Hold.objects.select_related('work'), id=hold_id, patron=patron)
     
     hold.status = 'cancelled'
     hold.save()
@@ -267,27 +380,43 @@ def patron_cancel_hold(request, hold_id):
         action='hold_cancelled',
         patron=patron,
         media_item=hold.media_item,
-        description=f'Cancelled hold on "{hold.media_item.title}"'
+        description=f'Cancelled hold on "{hold.work.title}"'
     )
     
     messages.success(request, 'Hold cancelled.')
+    if _is_fragment(request):
+        return render(request, 'patron/partials/hold-card.html', {'hold': hold, 'fragment': True})
     return redirect('patron_holds')
 
 @patron_required
 def patron_requests(request):
-    patron = get_object_or_404(Patron, id=request.session['patron_id'])
+    patron = request.patron
     
     if request.method == 'POST':
         title = request.POST.get('title')
         author = request.POST.get('author', '')
+        isbn = request.POST.get('isbn', '')
         media_type = request.POST.get('type')
         reason = request.POST.get('reason', '')
         notify = request.POST.get('notify') == 'on'
         
+        # Suggest a title we already have before queueing a request staff
+        # would have to look up; the patron can still submit it anyway.
+        if request.POST.get('confirm') != '1':
+            work = match_work(title, author, isbn, media_type)
+            if work:
+                return render(request, 'patron/patron-requests.html', {
+                    'patron': patron,
+                    'previous_requests': MediaRequest.objects.filter(patron=patron).order_by('-requested_at')[:10],
+                    'suggestion': work,
+                    'form': request.POST,
+                })
+        
         MediaRequest.objects.create(
             patron=patron,
             title=title,
             author=author,
+            isbn=isbn,
             media_type=media_type,
             reason=reason,
             notify_when_available=notify
@@ -299,6 +428,8 @@ def patron_requests(request):
             description=f'Requested "{title}"'
         )
         
+        broker.publish_on_commit('request_submitted', {'deltas': {'pending_requests': 1}})
+        
         messages.success(request, 'Request submitted successfully!')
         return redirect('patron_requests')
     
@@ -310,8 +441,9 @@ def patron_requests(request):
     })
 
 @librarian_required
+@use_replica
 def librarian_dashboard(request):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     
     today = timezone.now().date()
     checkouts_today = Checkout.objects.filter(checked_out_at__date=today).count()
@@ -329,18 +461,81 @@ def librarian_dashboard(request):
     })
 
 @librarian_required
+@use_replica
+def librarian_reports(request):
+    return render(request, 'librarian/librarian-reports.html', {
+        'librarian': request.librarian,
+        'metrics': daily_metrics(),
+    })
+
+@librarian_required
+@use_replica
+def librarian_pull_list(request):
+    location = request.GET.get('location', '')
+    
+    if request.method == 'POST':
+        pairs = []
+        for value in request.POST.getlist('pull'):
+            hold_id, _, item_id = value.partition(':')
+            if hold_id.isdigit() and item_id.isdigit():
+                pairs.append((int(hold_id), int(item_id)))
+        marked = pull_list.mark_in_transit(pairs, request.POST.get('pickup_location', '').strip())
+        if marked < len(pairs):
+            messages.warning(request, f'Marked {marked} of {len(pairs)} holds in transit; the rest were filled or changed since the list was made.')
+        else:
+            messages.success(request, f'Marked {marked} holds in transit.')
+        if location:
+            return redirect(f"{reverse('librarian_pull_list')}?{urlencode({'location': location})}")
+        return redirect('librarian_pull_list')
+    
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(pull_list.csv_lines(pull_list.rows(location or None)), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="pull-list-{timezone.localdate():%Y-%m-%d}.csv"'
+        return response
+    
+    rows = []
+    total_count = 0
+    for row in pull_list.rows(location or None):
+        if total_count < settings.PULL_LIST_PAGE_ROWS:
+            rows.append(row)
+        total_count += 1
+    
+    return render(request, 'librarian/librarian-pull-list.html', {
+        'librarian': request.librarian,
+        'rows': rows,
+        'total_count': total_count,
+        'location': location,
+        'locations': MediaItem.objects.exclude(location='').order_by('location').values_list('location', flat=True).distinct(),
+    })
+
+@librarian_required
+def librarian_diagnostics(request):
+    if request.method == 'POST':
+        slowlog.clear()
+        messages.success(request, 'Slow query log cleared.')
+        return redirect('librarian_diagnostics')
+    
+    return render(request, 'librarian/librarian-diagnostics.html', {
+        'librarian': request.librarian,
+        'slow_queries': slowlog.slow_queries(),
+        'threshold_ms': settings.SLOW_QUERY_MS,
+        'journal': journal.stats(),
+    })
+
+@librarian_required
+@use_replica
 def librarian_catalog(request):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     query = request.GET.get('q', '')
     media_type = request.GET.get('type', '')
     
-    items = MediaItem.objects.all()
+    items = MediaItem.objects.select_related('work')
     
     if query:
-        items = items.filter(Q(title__icontains=query) | Q(author__icontains=query) | Q(isbn__icontains=query))
+        items = items.filter(Q(work__title__icontains=query) | Q(work__author__icontains=query) | Q(work__isbn__icontains=query) | Q(barcode__icontains=query))
     
     if media_type:
-        items = items.filter(media_type=media_type)
+        items = items.filter(work__media_type=media_type)
     
     return render(request, 'librarian/librarian-catalog.html', {
         'librarian': librarian,
@@ -353,22 +548,41 @@ def librarian_catalog(request):
 @librarian_required
 def librarian_add_item(request):
     if request.method == 'POST':
-        import random
-        import string
+        barcode = barcodes.allocate()
         
-        barcode = 'BC-' + ''.join(random.choices(string.digits, k=9))
+        title = request.POST.get('title')
+        author = request.POST.get('author')
+        media_type = request.POST.get('media_type')
+        isbn = normalize_isbn(request.POST.get('isbn', ''))
         
-        MediaItem.objects.create(
-            title=request.POST.get('title'),
-            author=request.POST.get('author'),
-            media_type=request.POST.get('media_type'),
-            isbn=request.POST.get('isbn', ''),
-            barcode=barcode,
-            description=request.POST.get('description', ''),
-            genre=request.POST.get('genre', ''),
-            publisher=request.POST.get('publisher', ''),
-            location=request.POST.get('location', ''),
-        )
+        with transaction.atomic():
+            # A new copy of a title we already hold joins its work.
+            if isbn:
+                work = Work.objects.filter(isbn=isbn).first()
+            else:
+                work = Work.objects.filter(normalized_title=normalize_title(title), author__iexact=author, media_type=media_type).first()
+            if work is None:
+                work = Work.objects.create(
+                    title=title,
+                    author=author,
+                    media_type=media_type,
+                    isbn=isbn,
+                    description=request.POST.get('description', ''),
+                    genre=request.POST.get('genre', ''),
+                    publisher=request.POST.get('publisher', ''),
+                )
+            media_item = MediaItem.objects.create(
+                work=work,
+                barcode=barcode,
+                location=request.POST.get('location', ''),
+            )
+            fill_hold(media_item)
+            
+            requested = Q(normalized_title=work.normalized_title)
+            if work.isbn:
+                requested |= Q(isbn=work.isbn)
+            wanted = MediaRequest.objects.filter(requested, status='approved', notify_when_available=True)
+            enqueue(*[request_available_notice(media_request, media_item) for media_request in wanted])
         
         messages.success(request, 'Item added to catalog.')
         return redirect('librarian_catalog')
@@ -377,15 +591,28 @@ def librarian_add_item(request):
 
 @librarian_required
 def librarian_delete_item(request, item_id):
-    item = get_object_or_404(MediaItem, id=item_id)
-    title = item.title
-    item.delete()
+    with transaction.atomic():
+        # Locked so a checkout or pull list can't take the copy mid-delete.
+        item = get_object_or_404(MediaItem.objects.select_for_update(of=('self',)).select_related('work'), id=item_id)
+        title = item.title
+        
+        # Only copies on the shelf or written off: anything else is out on
+        # loan, set aside for a hold or on its way to a pickup branch.
+        if item.status not in ['available', 'lost']:
+            messages.error(request, f'Cannot delete "{title}" - it is checked out, set aside for a hold or in transit.')
+            return redirect('librarian_catalog')
+        
+        item.soft_delete()
+        # A work without copies would still show up in search.
+        if not item.work.copies.exists():
+            item.work.soft_delete()
+            PurgeJob.objects.create(kind='work', object_id=item.work_id, requested_by=request.librarian)
     messages.success(request, f'"{title}" deleted from catalog.')
     return redirect('librarian_catalog')
 
 @librarian_required
 def librarian_patrons(request):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     query = request.GET.get('q', '')
     filter_type = request.GET.get('filter', '')
     
@@ -424,124 +651,149 @@ def librarian_delete_patron(request, patron_id):
         return redirect('librarian_patrons')
     
     name = patron.name
-    patron.delete()
+    # Holds, requests and notifications are cleaned up by purge_deleted.
+    with transaction.atomic():
+        patron.soft_delete()
+        PurgeJob.objects.create(kind='patron', object_id=patron.pk, requested_by=request.librarian)
     messages.success(request, f'Patron "{name}" has been deleted.')
     return redirect('librarian_patrons')
 
 
 
-@librarian_required
+@desk_required
 def librarian_checkout(request):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     
     if request.method == 'POST':
+        key = request.POST.get('idempotency_key') or journal.new_key()
         patron_id = request.POST.get('patron_id')
+        card_number = request.POST.get('card_number', '').strip()
         item_ids = request.POST.getlist('item_ids')
+        item_barcodes = request.POST.get('barcodes', '').split()
         
-        patron = get_object_or_404(Patron, id=patron_id)
-        
-        for item_id in item_ids:
-            media_item = get_object_or_404(MediaItem, id=item_id)
-            if media_item.status == 'available':
-                due_date = timezone.now() + timedelta(days=media_item.get_loan_period_days())
-                Checkout.objects.create(
-                    patron=patron,
-                    media_item=media_item,
-                    due_date=due_date
-                )
-                media_item.status = 'checked_out'
-                media_item.save()
+        if not settings.CIRCULATION_JOURNAL_ALWAYS:
+            try:
+                patron = get_object_or_404(Patron, id=patron_id) if patron_id else get_object_or_404(Patron, card_number=card_number)
+                media_items = [get_object_or_404(MediaItem, id=item_id) for item_id in item_ids]
+                media_items += [get_object_or_404(MediaItem, barcode=barcode) for barcode in item_barcodes]
                 
-                ActivityLog.objects.create(
-                    action='checkout',
-                    patron=patron,
-                    media_item=media_item,
-                    librarian=librarian,
-                    description=f'Checked out "{media_item.title}" to {patron.name}'
-                )
+                checked_out = 0
+                for media_item in media_items:
+                    if check_out(patron, media_item, librarian):
+                        checked_out += 1
+                
+                messages.success(request, f'Successfully checked out {checked_out} item(s) to {patron.name}.')
+                return redirect('librarian_checkout')
+            except DatabaseError:
+                pass
         
-        messages.success(request, f'Successfully checked out {len(item_ids)} item(s) to {patron.name}.')
+        # Database unavailable: keep the desk moving and replay later.
+        entries = [('item_id', item_id) for item_id in item_ids] + [('barcode', barcode) for barcode in item_barcodes]
+        for field, value in entries:
+            journal.record('checkout', f'{key}:{field}:{value}', {
+                'patron_id': patron_id, 'card_number': card_number, field: value,
+            }, librarian.pk)
+        messages.warning(request, f'Recorded {len(entries)} checkout(s) offline. They will be applied once the catalog database is reachable.')
         return redirect('librarian_checkout')
     
-    patrons = Patron.objects.filter(status='active')[:20]
-    available_items = MediaItem.objects.filter(status='available')[:20]
+    try:
+        patrons = list(Patron.objects.filter(status='active')[:20])
+        available_items = list(MediaItem.objects.filter(status__in=['available', 'on_hold']).select_related('work')[:20])
+        offline = settings.CIRCULATION_JOURNAL_ALWAYS
+    except DatabaseError:
+        patrons, available_items, offline = [], [], True
     
     return render(request, 'librarian/librarian-checkout.html', {
         'librarian': librarian,
         'patrons': patrons,
         'available_items': available_items,
+        'offline': offline,
+        'idempotency_key': journal.new_key(),
     })
 
-@librarian_required
+@desk_required
 def librarian_checkin(request):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     
     checkin_results = []
     
     if request.method == 'POST':
-        barcode = request.POST.get('barcode')
+        barcode = request.POST.get('barcode', '').strip()
         
-        try:
-            media_item = MediaItem.objects.get(barcode=barcode)
-            checkout = Checkout.objects.filter(media_item=media_item, returned_at__isnull=True).first()
+        if not barcodes.is_valid(barcode):
+            messages.error(request, 'Invalid barcode. Please rescan the item.')
+        elif settings.CIRCULATION_JOURNAL_ALWAYS:
+            _journal_checkin(request, barcode)
+        else:
+            try:
+                media_item = scans.find_item(barcode)
+                checkout, fine_amount = check_in(media_item, librarian)
             
-            if checkout:
-                checkout.returned_at = timezone.now()
-                checkout.save()
-                
-                fine_amount = checkout.calculate_fine()
-                if fine_amount > 0:
-                    Fine.objects.create(
-                        patron=checkout.patron,
-                        checkout=checkout,
-                        amount=fine_amount,
-                        reason=f'Overdue fine for "{media_item.title}"'
-                    )
-                
-                media_item.status = 'available'
-                media_item.save()
-                
-                ActivityLog.objects.create(
-                    action='checkin',
-                    patron=checkout.patron,
-                    media_item=media_item,
-                    librarian=librarian,
-                    description=f'Checked in "{media_item.title}" from {checkout.patron.name}'
-                )
-                
-                checkin_results.append({
-                    'item': media_item,
-                    'patron': checkout.patron,
-                    'due_date': checkout.due_date,
-                    'is_overdue': checkout.is_overdue(),
-                    'days_overdue': checkout.days_overdue(),
-                    'fine': fine_amount,
-                })
+                if checkout:
+                    checkin_results.append({
+                        'item': media_item,
+                        'patron': checkout.patron,
+                        'due_date': checkout.due_date,
+                        'is_overdue': checkout.is_overdue(),
+                        'days_overdue': checkout.days_overdue(),
+                        'fine': fine_amount,
+                    })
                 
-                messages.success(request, f'Successfully checked in "{media_item.title}"')
-            else:
-                messages.error(request, 'This item is not currently checked out.')
-        except MediaItem.DoesNotExist:
-            messages.error(request, 'Item not found.')
-    
-    recent_checkins = Checkout.objects.filter(returned_at__isnull=False).order_by('-returned_at')[:10]
+                    if media_item.status == 'on_hold':
+                        messages.success(request, f'Checked in "{media_item.title}". A hold is waiting - place it on the holds shelf.')
+                    else:
+                        messages.success(request, f'Successfully checked in "{media_item.title}"')
+                elif media_item.status == 'in_transit':
+                    hold = receive_transit(media_item)
+                    if hold:
+                        messages.success(request, f'"{media_item.title}" arrived for {hold.patron.name}\'s hold - place it on the holds shelf.')
+                    else:
+                        messages.error(request, 'This item is in transit but no hold is waiting for it.')
+                else:
+                    messages.error(request, 'This item is not currently checked out.')
+            except MediaItem.DoesNotExist:
+                messages.error(request, 'Item not found.')
+            except DatabaseError:
+                _journal_checkin(request, barcode)
+        
+        if _is_fragment(request):
+            # The recent check-ins table is kept current by the live updates.
+            return render(request, 'librarian/partials/checkin-result.html', {
+                'checkin_results': checkin_results,
+                'idempotency_key': journal.new_key(),
+                'fragment': True,
+            })
+    
+    try:
+        recent_checkins = list(Checkout.objects.filter(returned_at__isnull=False).select_related('patron', 'media_item__work').order_by('-returned_at')[:10])
+    except DatabaseError:
+        recent_checkins = []
     
     return render(request, 'librarian/librarian-checkin.html', {
         'librarian': librarian,
         'checkin_results': checkin_results,
         'recent_checkins': recent_checkins,
+        'idempotency_key': journal.new_key(),
     })
 
+def _journal_checkin(request, barcode):
+    key = request.POST.get('idempotency_key') or journal.new_key()
+    journal.record('checkin', key, {'barcode': barcode}, request.librarian.pk)
+    messages.warning(request, f'Recorded the return of {barcode} offline. It will be applied once the catalog database is reachable.')
+
 @librarian_required
 def librarian_requests(request):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     status_filter = request.GET.get('status', 'pending')
     
-    requests = MediaRequest.objects.all()
+    requests = MediaRequest.objects.select_related('patron')
     
     if status_filter and status_filter != 'all':
         requests = requests.filter(status=status_filter)
     
+    # Pending requests are triaged per title rather than per patron.
+    clusters = demand_clusters() if status_filter == 'pending' else None
+    
     pending_count = MediaRequest.objects.filter(status='pending').count()
     approved_count = MediaRequest.objects.filter(status='approved').count()
     rejected_count = MediaRequest.objects.filter(status='rejected').count()
@@ -549,6 +801,7 @@ def librarian_requests(request):
     return render(request, 'librarian/librarian-requests.html', {
         'librarian': librarian,
         'requests': requests.order_by('-requested_at')[:20],
+        'clusters': clusters,
         'status_filter': status_filter,
         'pending_count': pending_count,
         'approved_count': approved_count,
@@ -557,66 +810,128 @@ def librarian_requests(request):
 
 @librarian_required
 def librarian_approve_request(request, request_id):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     media_request = get_object_or_404(MediaRequest, id=request_id)
+    was_pending = media_request.status == 'pending'
     
-    media_request.status = 'approved'
-    media_request.reviewed_at = timezone.now()
-    media_request.reviewed_by = librarian
-    media_request.save()
+    with transaction.atomic():
+        media_request.status = 'approved'
+        media_request.reviewed_at = timezone.now()
+        media_request.reviewed_by = librarian
+        media_request.save()
+        
+        ActivityLog.objects.create(
+            action='request_approved',
+            patron=media_request.patron,
+            librarian=librarian,
+            description=f'Approved request for "{media_request.title}"'
+        )
+        
+        if media_request.notify_when_available:
+            enqueue(request_approved_notice(media_request))
     
-    ActivityLog.objects.create(
-        action='request_approved',
-        patron=media_request.patron,
-        librarian=librarian,
-        description=f'Approved request for "{media_request.title}"'
-    )
+    if was_pending:
+        broker.publish_on_commit('request_reviewed', {'deltas': {'pending_requests': -1, 'approved_requests': 1}})
     
     messages.success(request, f'Request for "{media_request.title}" approved.')
     return redirect('librarian_requests')
 
 @librarian_required
 def librarian_reject_request(request, request_id):
-    librarian = get_object_or_404(Librarian, id=request.session['librarian_id'])
+    librarian = request.librarian
     media_request = get_object_or_404(MediaRequest, id=request_id)
+    was_pending = media_request.status == 'pending'
+    
+    with transaction.atomic():
+        media_request.status = 'rejected'
+        media_request.reviewed_at = timezone.now()
+        media_request.reviewed_by = librarian
+        media_request.save()
+        
+        ActivityLog.objects.create(
+            action='request_rejected',
+            patron=media_request.patron,
+            librarian=librarian,
+            description=f'Rejected request for "{media_request.title}"'
+        )
     
-    media_request.status = 'rejected'
-    media_request.reviewed_at = timezone.now()
-    media_request.reviewed_by = librarian
-    media_request.save()
+    if was_pending:
+        broker.publish_on_commit('request_reviewed', {'deltas': {'pending_requests': -1, 'rejected_requests': 1}})
     
     messages.success(request, f'Request for "{media_request.title}" rejected.')
     return redirect('librarian_requests')
 
-def search_patrons_api(request):
+@librarian_required
+def librarian_review_cluster(request):
+    if request.method != 'POST':
+        return redirect('librarian_requests')
+    
+    status = 'approved' if request.POST.get('action') == 'approve' else 'rejected'
+    count = review_cluster(request.POST.get('normalized_title', ''), status, request.librarian)
+    if count:
+        messages.success(request, f'{count} request{"s" if count != 1 else ""} for "{request.POST.get("title", "")}" {status}.')
+    else:
+        messages.error(request, 'These requests were already reviewed.')
+    return redirect('librarian_requests')
+
+@librarian_required
+async def librarian_events(request):
+    # Only an ASGI server can hold hundreds of these open cheaply; under WSGI
+    # each one would pin a worker, so answer 204 and EventSource gives up.
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    async def stream():
+        queue = broker.subscribe()
+        try:
+            yield format_event('counters', {'values': await sync_to_async(live_counters)()})
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), settings.LIVE_UPDATES_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    message = ': keep-alive\n\n'
+                yield message
+        finally:
+            broker.unsubscribe(queue)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@throttle('search')
+@use_replica
+async def search_patrons_api(request):
     query = request.GET.get('q', '')
     patrons = Patron.objects.filter(
         Q(name__icontains=query) | Q(card_number__icontains=query) | Q(email__icontains=query)
-    )[:10]
+    ).with_account_totals().values('id', 'name', 'card_number', 'checked_out', 'fines')[:10]
     
     data = [{
-        'id': p.id,
-        'name': p.name,
-        'card_number': p.card_number,
-        'checked_out': p.get_checked_out_count(),
-        'fines': float(p.get_total_fines()),
-    } for p in patrons]
+        'id': p['id'],
+        'name': p['name'],
+        'card_number': p['card_number'],
+        'checked_out': p['checked_out'],
+        'fines': float(p['fines']),
+    } async for p in patrons]
     
     return JsonResponse(data, safe=False)
 
-def search_items_api(request):
+@throttle('search')
+@use_replica
+async def search_items_api(request):
     query = request.GET.get('q', '')
     items = MediaItem.objects.filter(
-        Q(title__icontains=query) | Q(barcode__icontains=query),
+        Q(work__title__icontains=query) | Q(barcode__icontains=query),
         status='available'
-    )[:10]
+    ).values('id', 'barcode', title=F('work__title'), author=F('work__author'), media_type=F('work__media_type'))[:10]
     
-    data = [{
-        'id': i.id,
-        'title': i.title,
-        'author': i.author,
-        'barcode': i.barcode,
-        'media_type': i.media_type,
-    } for i in items]
+    data = [item async for item in items]
     
     return JsonResponse(data, safe=False)
+
+def metrics_view(request):
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=401)
+    gauges = {'notification_outbox_pending': Notification.objects.filter(status='pending').count()}
+    return HttpResponse(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
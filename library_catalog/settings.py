@@ -23,7 +23,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'catalog.routers.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,6 +76,210 @@ if os.environ.get('USE_SQLITE', '1').lower() in ('1', 'true', 'yes'):
         }
     }
 
+# Read replicas for search, dashboards and the read API (catalog/routers.py).
+# PGREPLICA_HOSTS is a comma-separated list of hosts sharing the primary's
+# credentials. With SQLite, SQLITE_REPLICAS lists database files that stand
+# in for replicas; refresh them with `python manage.py sync_replicas`.
+DATABASE_REPLICAS = []
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    replica_sources = [
+        {'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'file:{path.strip()}?mode=ro'}
+        for path in os.environ.get('SQLITE_REPLICAS', '').split(',') if path.strip()
+    ]
+else:
+    replica_sources = [
+        dict(DATABASES['default'], HOST=host.strip())
+        for host in os.environ.get('PGREPLICA_HOSTS', '').split(',') if host.strip()
+    ]
+for number, replica in enumerate(replica_sources, 1):
+    DATABASES[f'replica{number}'] = dict(replica, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+
+# Seconds a browser reads from the primary after it writes, and how long an
+# unreachable replica is skipped.
+REPLICA_PIN_SECONDS = 10
+REPLICA_RETRY_SECONDS = 30
+
+# Local-memory cache by default; set REDIS_URL so every worker process shares
+# one cache. Sessions and principals are only cached in a shared one: with a
+# per-process cache, a logout or a deactivated account would only reach the
+# worker that handled it.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-catalog',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# With a shared cache, sessions are served from it and only hit
+# django_session on a miss.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db'
+
+# Cached Patron/Librarian rows attached by patron_required/librarian_required.
+# Bump the version to discard every cached principal at once.
+PRINCIPAL_CACHE_ENABLED = SHARED_CACHE
+PRINCIPAL_CACHE_VERSION = 1
+PRINCIPAL_CACHE_TIMEOUT = 300
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'catalog.hashers.PatronPINHasher',
+    'catalog.hashers.LibrarianPasswordHasher',
+]
+
+# PBKDF2 cost per account type. Existing hashes are upgraded to the current
+# value the next time the account logs in. PINs are short, so they keep
+# Django's full default cost.
+PATRON_PIN_ITERATIONS = int(os.environ.get('PATRON_PIN_ITERATIONS', '1000000'))
+LIBRARIAN_PASSWORD_ITERATIONS = int(os.environ.get('LIBRARIAN_PASSWORD_ITERATIONS', '1000000'))
+
+# Login hashing pool (see catalog/login.py): concurrent hashes per process
+# and how many more may wait; a login beyond that is refused at once.
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', os.cpu_count() or 2))
+LOGIN_HASH_QUEUE = int(os.environ.get('LOGIN_HASH_QUEUE', '32'))
+
+# Card numbers / barcodes reserved per worker process in one round trip.
+IDENTIFIER_BLOCK_SIZE = 100
+
+# Librarian live updates (server-sent events, ASGI only): keep-alive comment
+# interval, how often counters are re-counted, and per-connection backlog.
+LIVE_UPDATES_HEARTBEAT = 15
+LIVE_UPDATES_INTERVAL = 30
+LIVE_UPDATES_QUEUE_SIZE = 100
+
+# Patron notifications (see catalog/notifications.py). Local runs write
+# emails to sent_emails/; set EMAIL_BACKEND/EMAIL_HOST etc. for real delivery.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.filebased.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'library@example.com')
+NOTIFICATION_BATCH_SIZE = 200
+NOTIFICATION_MAX_PER_MINUTE = 120
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_LEASE_SECONDS = 600
+NOTIFICATION_DUE_SOON_DAYS = 3
+
+# Days a patron has to collect a hold once the item is checked in for them.
+HOLD_PICKUP_DAYS = 7
+
+# Bulk read API (/api/v1/): default page size and cap on batch lookups.
+API_PAGE_SIZE = 100
+API_MAX_BATCH = 500
+
+# Circulation analytics (catalog/analytics.py): on-disk column cache, rows
+# per fetch chunk, reporting window and how many titles to list.
+ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR', str(BASE_DIR / 'analytics_cache'))
+ANALYTICS_CHUNK_SIZE = 100000
+ANALYTICS_SETTLE_SECONDS = 300
+ANALYTICS_WINDOW_DAYS = 365
+ANALYTICS_TOP_TITLES = 25
+
+# "Patrons also borrowed" (catalog/recommendations.py): neighbours kept per
+# item, latest items counted per patron, and rows per batch.
+RECOMMENDATION_TOP_K = 10
+RECOMMENDATION_MAX_ITEMS_PER_PATRON = 200
+RECOMMENDATION_BATCH_SIZE = 2000
+
+# Prometheus metrics at /metrics (catalog/metrics.py). Point METRICS_DIR at
+# a directory shared by the worker processes of one host to merge them;
+# set METRICS_TOKEN to require "Authorization: Bearer <token>" on scrapes.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_FLUSH_SECONDS = 10
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Slow-query log shown on /librarian/diagnostics/ (catalog/slowlog.py):
+# threshold, share of slow SELECTs that get an EXPLAIN, and how many distinct
+# queries each process keeps.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+SLOW_QUERY_EXPLAIN_RATE = 0.1
+SLOW_QUERY_TOP_N = 50
+
+# Nightly auto-renewal (catalog/renewals.py): loans due within this many
+# days are renewed, this many per UPDATE.
+AUTO_RENEW_DAYS = 2
+AUTO_RENEW_BATCH_SIZE = 5000
+
+# Offline circulation journal (catalog/journal.py): a SQLite file local to
+# each web host that desk check-outs and check-ins fall back to when the
+# database fails. Set CIRCULATION_JOURNAL_ALWAYS=1 to journal every desk
+# transaction, e.g. during database maintenance. replay_journal applies
+# CIRCULATION_REPLAY_BATCH_SIZE entries per pass.
+CIRCULATION_JOURNAL_PATH = os.environ.get('CIRCULATION_JOURNAL_PATH', str(BASE_DIR / 'circulation_journal.sqlite3'))
+CIRCULATION_JOURNAL_ALWAYS = os.environ.get('CIRCULATION_JOURNAL_ALWAYS', '0').lower() in ('1', 'true', 'yes')
+CIRCULATION_REPLAY_BATCH_SIZE = 100
+
+# Shelf inventory (catalog/inventory.py): rows per database read and
+# UPDATE while reconciling scan files.
+INVENTORY_CHUNK_SIZE = 5000
+
+# Throttling for the search and read API endpoints (catalog/throttle.py):
+# token bucket (tokens per second, burst) per caller and scope in the shared
+# cache, requests of a scope running at once per process, and how long a
+# request may have waited at the proxy (X-Request-Start) before it is shed.
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+THROTTLE_RATES = {
+    'search': (5, 20),
+    'api': (10, 50),
+}
+THROTTLE_CONCURRENCY = {
+    'search': int(os.environ.get('THROTTLE_SEARCH_CONCURRENCY', '8')),
+    'api': int(os.environ.get('THROTTLE_API_CONCURRENCY', '16')),
+}
+THROTTLE_MAX_QUEUE_SECONDS = float(os.environ.get('THROTTLE_MAX_QUEUE_SECONDS', '2'))
+# Reverse proxies in front of the app that append to X-Forwarded-For. 0 keys
+# anonymous callers on the peer address; behind one nginx, set 1.
+THROTTLE_TRUSTED_PROXIES = int(os.environ.get('THROTTLE_TRUSTED_PROXIES', '0'))
+
+# Loan history (catalog/loan_history.py): archive_loans moves loans returned
+# more than this many days ago out of Checkout, this many per transaction.
+# Set LOAN_HISTORY_ANONYMIZE=1 to drop the patron from archived loans; they
+# then no longer count towards recommendations.
+LOAN_HISTORY_AFTER_DAYS = 7
+LOAN_HISTORY_BATCH_SIZE = 2000
+LOAN_HISTORY_ANONYMIZE = os.environ.get('LOAN_HISTORY_ANONYMIZE', '0').lower() in ('1', 'true', 'yes')
+
+# Published catalog snapshot (catalog/snapshot.py) read by the home page and
+# patron search. publish_catalog rebuilds it; readers look for a new file at
+# most every CATALOG_SNAPSHOT_CHECK_SECONDS and fall back to the database
+# when it is missing or older than CATALOG_SNAPSHOT_MAX_AGE seconds.
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', str(BASE_DIR / 'catalog_snapshot.sqlite3'))
+CATALOG_SNAPSHOT_MAX_AGE = int(os.environ.get('CATALOG_SNAPSHOT_MAX_AGE', '900'))
+CATALOG_SNAPSHOT_CHECK_SECONDS = 1
+CATALOG_SNAPSHOT_MMAP_SIZE = 256 * 1024 * 1024
+CATALOG_SNAPSHOT_CHUNK_SIZE = 5000
+
+# Hold pull list (catalog/pull_list.py): rows fetched and holds updated per
+# round trip, and rows shown on the page (the CSV export has them all).
+PULL_LIST_BATCH_SIZE = 1000
+PULL_LIST_PAGE_ROWS = 500
+
+# Roster import (catalog/roster.py): patrons hashed and inserted per batch,
+# and PIN hashing threads (one per core by default).
+PATRON_IMPORT_BATCH_SIZE = 1000
+PATRON_IMPORT_WORKERS = int(os.environ.get('PATRON_IMPORT_WORKERS', os.cpu_count() or 2))
+
+# Deleted patrons and titles are tombstoned right away; purge_deleted
+# (catalog/purge.py) cleans up their holds, requests and notifications this
+# many rows per transaction.
+PURGE_BATCH_SIZE = 500
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},